@@ -1,24 +1,34 @@
 import asyncio
+import logging
+import os
+import time
 from langgraph.graph import StateGraph, START, END
 from typing import TypedDict, Annotated
 from langchain_core.messages import BaseMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode, tools_condition
 from langchain_community.tools import DuckDuckGoSearchRun
 from langchain_core.tools import tool, BaseTool
 from langchain_mcp_adapters.client import MultiServerMCPClient
 from dotenv import load_dotenv
-import aiosqlite
 import requests
 
+from checkpointer_factory import aclose_checkpointer, create_async_checkpointer
+from llm_gateway import chat_model
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# MCP tool lists are re-fetched this often; after a failed fetch the runtime
+# keeps the tools it has and retries sooner.
+MCP_TOOL_REFRESH_SECONDS = float(os.getenv("MCP_TOOL_REFRESH_SECONDS", "600"))
+MCP_TOOL_RETRY_SECONDS = float(os.getenv("MCP_TOOL_RETRY_SECONDS", "30"))
+
 # -------------------
 # 1. LLM & Tools
 # -------------------
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash")
+llm = chat_model("gemini-2.0-flash")
 search_tool = DuckDuckGoSearchRun(region="us-en")
 
 @tool
@@ -47,15 +57,12 @@ client = MultiServerMCPClient(
     }
 )
 
-async def load_mcp_tools() -> list[BaseTool]:
-    """Async loader for MCP tools"""
-    try:
-        # We must await the connection and tool retrieval
-        await client.initialize()
-        return await client.get_tools()
-    except Exception as e:
-        print(f"Error loading MCP tools: {e}")
-        return []
+async def fetch_mcp_tools() -> list[BaseTool]:
+    """Connect to the MCP servers and list their tools; raises on failure."""
+    # We must await the connection and tool retrieval
+    await client.initialize()
+    return await client.get_tools()
+
 
 # -------------------
 # 2. Graph Setup (Encapsulated)
@@ -63,11 +70,9 @@ async def load_mcp_tools() -> list[BaseTool]:
 class ChatState(TypedDict):
     messages: Annotated[list[BaseMessage], add_messages]
 
-async def build_graph():
-    # Load tools asynchronously
-    mcp_tools = await load_mcp_tools()
+def compile_graph(checkpointer, mcp_tools: list[BaseTool]):
     tools = [search_tool, get_stock_price, *mcp_tools]
-    
+
     llm_with_tools = llm.bind_tools(tools)
 
     async def chat_node(state: ChatState):
@@ -77,10 +82,6 @@ async def build_graph():
 
     tool_node = ToolNode(tools)
 
-    # Database connection
-    conn = await aiosqlite.connect(database="chatbot.db")
-    checkpointer = AsyncSqliteSaver(conn)
-
     graph = StateGraph(ChatState)
     graph.add_node("chat_node", chat_node)
     graph.add_node("tools", tool_node)
@@ -92,12 +93,121 @@ async def build_graph():
     return graph.compile(checkpointer=checkpointer)
 
 # -------------------
-# 3. Streamlit Runner
+# 3. Runtime
+# -------------------
+class ChatRuntime:
+    """
+    Checkpointer, MCP tools and compiled graph, built once and shared by every
+    turn. Tools are re-fetched every MCP_TOOL_REFRESH_SECONDS, or on the next
+    turn after a failure (`invalidate_tools`); the graph is recompiled only then.
+    """
+
+    def __init__(
+        self,
+        tool_refresh_seconds: float = MCP_TOOL_REFRESH_SECONDS,
+        tool_retry_seconds: float = MCP_TOOL_RETRY_SECONDS,
+    ):
+        self.tool_refresh_seconds = tool_refresh_seconds
+        self.tool_retry_seconds = tool_retry_seconds
+        self.checkpointer = None
+        self.graph = None
+        self.tool_names: list[str] = []
+        self.loop = None
+        self._next_refresh = 0.0
+        self._refresh_lock = asyncio.Lock()
+
+    async def start(self) -> "ChatRuntime":
+        self.loop = asyncio.get_running_loop()
+        self.checkpointer = await create_async_checkpointer()
+        await self._refresh_tools()
+        return self
+
+    async def _refresh_tools(self) -> None:
+        try:
+            mcp_tools = await fetch_mcp_tools()
+        except Exception as e:
+            logger.warning("Error loading MCP tools: %s", e)
+            self._next_refresh = time.monotonic() + self.tool_retry_seconds
+            if self.graph is not None:
+                return  # keep serving with the last good tool set
+            mcp_tools = []
+        else:
+            self._next_refresh = time.monotonic() + self.tool_refresh_seconds
+        self.tool_names = [t.name for t in mcp_tools]
+        self.graph = compile_graph(self.checkpointer, mcp_tools)
+
+    def invalidate_tools(self) -> None:
+        """Re-fetch MCP tools before the next turn (e.g. after a dropped session)."""
+        self._next_refresh = 0.0
+
+    async def get_graph(self):
+        if time.monotonic() >= self._next_refresh:
+            async with self._refresh_lock:
+                if time.monotonic() >= self._next_refresh:
+                    await self._refresh_tools()
+        return self.graph
+
+    async def close(self) -> None:
+        if self.checkpointer is not None:
+            await aclose_checkpointer(self.checkpointer)
+            self.checkpointer = None
+        self.graph = None
+
+    async def __aenter__(self) -> "ChatRuntime":
+        return await self.start()
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+
+_runtime_task: asyncio.Task | None = None
+
+
+async def get_runtime() -> ChatRuntime:
+    """The process-wide runtime, started on first use."""
+    global _runtime_task
+    loop = asyncio.get_running_loop()
+    if _runtime_task is not None and _runtime_task.get_loop() is not loop:
+        # aiosqlite and MCP sessions belong to the loop that opened them.
+        await shutdown_runtime()
+    if _runtime_task is None:
+        _runtime_task = asyncio.ensure_future(ChatRuntime().start())
+    try:
+        return await asyncio.shield(_runtime_task)
+    except Exception:
+        _runtime_task = None
+        raise
+
+
+async def shutdown_runtime() -> None:
+    """Close the shared runtime's connections; the next turn starts a new one."""
+    global _runtime_task
+    task, _runtime_task = _runtime_task, None
+    if task is None or not task.done() or task.cancelled() or task.exception() is not None:
+        return
+    try:
+        await task.result().close()
+    except Exception as e:
+        logger.warning("Error closing chat runtime: %s", e)
+
+
+async def build_graph():
+    """Compiled graph of the shared runtime."""
+    return await (await get_runtime()).get_graph()
+
+# -------------------
+# 4. Streamlit Runner
 # -------------------
 # Use this function in your frontend_mcp.py
 async def run_chat(user_input: str, thread_id: str):
-    bot = await build_graph()
+    runtime = await get_runtime()
+    bot = await runtime.get_graph()
     config = {"configurable": {"thread_id": thread_id}}
     
-    async for event in bot.astream({"messages": [("user", user_input)]}, config):
-        yield event
\ No newline at end of file
+    try:
+        async for event in bot.astream({"messages": [("user", user_input)]}, config):
+            yield event
+    except Exception:
+        # A dropped MCP connection surfaces here; reconnect before the next turn.
+        runtime.invalidate_tools()
+        raise
@@ -5,13 +5,15 @@ from langchain_core.messages import BaseMessage
 from langgraph.checkpoint.memory import MemorySaver # <--- Use Memory
 from langgraph.graph.message import add_messages
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 import uuid
 
+from conversation_window import HISTORY_PAGE_SIZE, message_window
+from llm_gateway import chat_model
+
 load_dotenv()
 
 # Setup Model
-model = ChatGoogleGenerativeAI(model="gemini-2.0-flash")
+model = chat_model("gemini-2.0-flash")
 
 # --- IN-MEMORY STORAGE (Stable for Cloud Demos) ---
 # We use global dictionaries to simulate a DB. 
@@ -79,4 +81,8 @@ def retrieve_all_threads(user_id):
 def flush_user_history(user_id):
     """Clears history for the specific user."""
     if "simulated_db" in st.session_state and user_id in st.session_state.simulated_db:
-        del st.session_state.simulated_db[user_id]
\ No newline at end of file
+        del st.session_state.simulated_db[user_id]
+
+def load_messages(thread_id, limit=HISTORY_PAGE_SIZE, before=None):
+    """The newest `limit` messages of a thread (or the page before `before`) plus the cursor for older ones."""
+    return message_window(checkpointer, thread_id, limit, before)
@@ -3,22 +3,32 @@
 from langgraph.graph import StateGraph, START, END
 from typing import TypedDict, Annotated
 from langchain_core.messages import BaseMessage, HumanMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langgraph.checkpoint.sqlite import SqliteSaver
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode, tools_condition
 from langchain_community.tools import DuckDuckGoSearchRun
 from langchain_core.tools import tool
+from langchain_core.runnables import RunnableConfig
 from dotenv import load_dotenv
-import sqlite3
 import requests
 
+from checkpointer_factory import create_checkpointer
+from conversation_summary import SUMMARY_MODE, BackgroundSummarizer, summary_message
+from conversation_window import HISTORY_PAGE_SIZE, message_window
+from history_budget import HistoryBudget
+from llm_cache import create_llm_cache
+from llm_gateway import chat_model
+
 load_dotenv()
 
 # -------------------
 # 1. LLM
 # -------------------
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash")
+LLM_MODEL = "gemini-2.0-flash"
+llm = chat_model(LLM_MODEL, cache=create_llm_cache())  # LLM_CACHE=off|exact|semantic; limits in llm_gateway
+# Caps the history sent per call (HISTORY_TOKEN_BUDGET); tool call/result pairs stay together.
+history_budget = HistoryBudget(LLM_MODEL)
+# SUMMARY_MODE=background folds older messages into `summary` off the request path.
+summarizer = BackgroundSummarizer(llm) if SUMMARY_MODE == "background" else None
 
 
 # -------------------
@@ -74,14 +84,22 @@ llm_with_tools = llm.bind_tools(tools)
 # -------------------
 class ChatState(TypedDict):
     messages: Annotated[list[BaseMessage], add_messages]
+    summary: str
 
 # -------------------
 # 4. Nodes
 # -------------------
-def chat_node(state: ChatState):
+def chat_node(state: ChatState, config: RunnableConfig):
     """LLM node that may answer or request a tool call."""
-    messages = state["messages"]
+    thread_id = config["configurable"]["thread_id"]
+    summary = state.get("summary", "")
+    history = state["messages"]
+
+    messages = history_budget.fit(history, system=summary_message(summary))
     response = llm_with_tools.invoke(messages)
+    if summarizer and not response.tool_calls:
+        # The fold is written to the thread's checkpoints when it finishes.
+        summarizer.schedule(thread_id, summary, [*history, response])
     return {"messages": [response]}
 
 tool_node = ToolNode(tools)
@@ -89,8 +107,7 @@ tool_node = ToolNode(tools)
 # -------------------
 # 5. Checkpointer
 # -------------------
-conn = sqlite3.connect(database="chatbot.db", check_same_thread=False)
-checkpointer = SqliteSaver(conn=conn)
+checkpointer = create_checkpointer()  # CHECKPOINT_BACKEND=sqlite|postgres
 
 # -------------------
 # 6. Graph
@@ -105,12 +122,22 @@ graph.add_conditional_edges("chat_node",tools_condition)
 graph.add_edge('tools', 'chat_node')
 
 chatbot = graph.compile(checkpointer=checkpointer)
+if summarizer:
+    # Turns run on the hooked copy, so folds commit once a thread's run ends.
+    chatbot = summarizer.attach(chatbot)
 
 # -------------------
 # 7. Helper
 # -------------------
 def retrieve_all_threads():
-    all_threads = set()
-    for checkpoint in checkpointer.list(None):
-        all_threads.add(checkpoint.config["configurable"]["thread_id"])
-    return list(all_threads)
\ No newline at end of file
+    return checkpointer.thread_ids()
+
+
+def list_threads(limit=50, before=None, owner=None):
+    """One page of the thread catalog, most recently updated first."""
+    return checkpointer.list_threads(limit=limit, before=before, owner=owner)
+
+
+def load_messages(thread_id, limit=HISTORY_PAGE_SIZE, before=None):
+    """The newest `limit` messages of a thread (or the page before `before`) plus the cursor for older ones."""
+    return message_window(checkpointer, thread_id, limit, before)
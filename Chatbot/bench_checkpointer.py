@@ -0,0 +1,164 @@
+"""
+Concurrency benchmark: shared-connection SqliteSaver vs PooledSqliteSaver.
+
+Every simulated session runs chat turns on its own thread id against one
+database file, the way Streamlit session threads share the backend module:
+each turn is a graph invoke (several checkpoint + pending-write puts) followed
+by a get_state read. Reports throughput, per-turn p50/p99 and errors such as
+"database is locked".
+
+    python bench_checkpointer.py --sessions 16 --turns 50 --llm-ms 0
+    python bench_checkpointer.py --backends pooled,zstd   # compression cost per turn
+    python bench_checkpointer.py --backends pooled,behind  # write-behind durability
+    docker compose up -d && python bench_checkpointer.py --backends pooled,pg1,pgpool
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Annotated, Callable, List, TypedDict
+
+import numpy as np
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.graph import START, StateGraph
+from langgraph.graph.message import add_messages
+
+from checkpoint_compression import CompressedSerializer
+from checkpointer_factory import CHECKPOINT_POSTGRES_URL, create_checkpointer
+from pooled_checkpointer import PooledSqliteSaver
+
+
+class ChatState(TypedDict):
+    messages: Annotated[list[BaseMessage], add_messages]
+
+
+def build_chatbot(checkpointer, llm_ms: float):
+    def chat_node(state: ChatState):
+        if llm_ms:
+            time.sleep(llm_ms / 1000)
+        return {"messages": [AIMessage(content="ok " * 40)]}
+
+    graph = StateGraph(ChatState)
+    graph.add_node("chat_node", chat_node)
+    graph.add_edge(START, "chat_node")
+    return graph.compile(checkpointer=checkpointer)
+
+
+def shared_sqlite(path: str):
+    return SqliteSaver(sqlite3.connect(path, check_same_thread=False))
+
+
+def pooled_sqlite(path: str):
+    return PooledSqliteSaver(path)
+
+
+def pooled_write_behind(path: str):
+    return PooledSqliteSaver(path, write_behind=True)
+
+
+def pooled_zstd(path: str):
+    return PooledSqliteSaver(path, serde=CompressedSerializer(JsonPlusSerializer(), enabled=True))
+
+
+def postgres_single(path: str):
+    """One shared connection: what PostgresSaver.from_conn_string gives you."""
+    import psycopg
+    from psycopg.rows import dict_row
+    from postgres_checkpointer import PostgresCatalogSaver
+
+    conn = psycopg.connect(CHECKPOINT_POSTGRES_URL, autocommit=True, prepare_threshold=0, row_factory=dict_row)
+    checkpointer = PostgresCatalogSaver(conn)
+    checkpointer.setup()
+    return checkpointer
+
+
+def postgres_pool(path: str):
+    return create_checkpointer("postgres")
+
+
+BACKENDS = {
+    "sqlite": shared_sqlite,
+    "pooled": pooled_sqlite,
+    "zstd": pooled_zstd,
+    "behind": pooled_write_behind,
+    "pg1": postgres_single,
+    "pgpool": postgres_pool,
+}
+
+
+def run_backend(
+    name: str, factory: Callable, sessions: int, turns: int, llm_ms: float, directory: str
+) -> None:
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        checkpointer = factory(os.path.join(tmp, "bench.db"))
+        chatbot = build_chatbot(checkpointer, llm_ms)
+        latencies: List[float] = []
+        errors: List[str] = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(sessions)
+        # Postgres outlives the temp directory; keep runs from sharing threads.
+        run_id = int(time.time())
+
+        def session(n: int) -> None:
+            config = {"configurable": {"thread_id": f"{name}-{run_id}-{n}"}}
+            barrier.wait()
+            for turn in range(turns):
+                started = time.perf_counter()
+                try:
+                    chatbot.invoke({"messages": [HumanMessage(content=f"turn {turn} " * 20)]}, config)
+                    chatbot.get_state(config)
+                except Exception as exc:  # e.g. "database is locked"
+                    with lock:
+                        errors.append(type(exc).__name__ + ": " + str(exc))
+                    continue
+                with lock:
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+        threads = [threading.Thread(target=session, args=(n,)) for n in range(sessions)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        db_bytes = sum(
+            os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp) if name.startswith("bench.db")
+        )
+        extra = f"  db_MB={db_bytes / 1e6:.2f}"
+        if hasattr(checkpointer, "stats"):
+            stats = checkpointer.stats()
+            extra += f"  avg_group_commit={stats['avg_batch']:.1f}"
+            extra += f"  state_cache_hit_rate={stats['state_cache']['hit_rate']:.2f}"
+            checkpointer.close()
+        else:
+            checkpointer.conn.close()
+
+        p50, p99 = (np.percentile(latencies, [50, 99]) if latencies else (float("nan"),) * 2)
+        print(
+            f"{name:<8} {len(latencies) / elapsed:>10.1f} {p50:>9.2f} {p99:>9.2f} "
+            f"{len(errors):>7}{extra}"
+        )
+        for error in sorted(set(errors))[:3]:
+            print(f"         {error}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--llm-ms", type=float, default=0.0, help="simulated model latency per turn")
+    parser.add_argument("--dir", default=".", help="where to create the database (fsync cost matters)")
+    parser.add_argument("--backends", default="sqlite,pooled", help=f"comma-separated, from {sorted(BACKENDS)}")
+    args = parser.parse_args()
+
+    print(f"sessions={args.sessions} turns={args.turns} llm_ms={args.llm_ms}")
+    print(f"{'backend':<8} {'turns/s':>10} {'p50_ms':>9} {'p99_ms':>9} {'errors':>7}")
+    for name in args.backends.split(","):
+        run_backend(name, BACKENDS[name], args.sessions, args.turns, args.llm_ms, args.dir)
@@ -0,0 +1,219 @@
+"""
+Load test for llm_gateway against a local fake model server.
+
+The server answers POST /generate after a long-tailed delay and returns 429
+once its own rate or concurrency limit is exceeded, like a provider under
+load. Simulated users (one of them sending --heavy-factor times more) call a
+chat model either directly, with the client's usual immediate retries, or
+through the gateway. Reports end-to-end p50/p95/p99 overall and for the light
+users, the number of 429s the server handed out, and the gateway's metrics.
+
+    python bench_llm_gateway.py --users 8 --requests 20
+    python bench_llm_gateway.py --modes gateway,hedged --tail-prob 0.1
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from llm_gateway import GatewayChatModel, LLMGateway
+
+
+# -------------------
+# Fake model server
+# -------------------
+class FakeModelServer:
+    def __init__(self, rps: float, max_concurrency: int, latency_ms: float, tail_prob: float, tail_factor: float):
+        self.rps = rps
+        self.max_concurrency = max_concurrency
+        self.latency_ms = latency_ms
+        self.tail_prob = tail_prob
+        self.tail_factor = tail_factor
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.recent: List[float] = []
+        self.served = 0
+        self.rejected = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if not server.admit():
+                    self.send_response(429)
+                    self.end_headers()
+                    return
+                try:
+                    time.sleep(server.delay())
+                    payload = json.dumps({"text": f"echo: {body['prompt'][:40]}"}).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                finally:
+                    server.leave()
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/generate"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def admit(self) -> bool:
+        now = time.monotonic()
+        with self.lock:
+            self.recent = [t for t in self.recent if now - t < 1.0]
+            if len(self.recent) >= self.rps or self.in_flight >= self.max_concurrency:
+                self.rejected += 1
+                return False
+            self.recent.append(now)
+            self.in_flight += 1
+            self.served += 1
+            return True
+
+    def leave(self) -> None:
+        with self.lock:
+            self.in_flight -= 1
+
+    def delay(self) -> float:
+        base = random.lognormvariate(0, 0.3) * self.latency_ms / 1000
+        return base * self.tail_factor if random.random() < self.tail_prob else base
+
+    def close(self) -> None:
+        self.httpd.shutdown()
+
+
+class FakeServerChatModel(BaseChatModel):
+    """Chat model that calls the fake server; `client_retries` mimics SDK-side immediate retries."""
+
+    url: str
+    client_retries: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-server"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        data = json.dumps({"prompt": messages[-1].content}).encode()
+        for attempt in range(self.client_retries + 1):
+            try:
+                with urllib.request.urlopen(urllib.request.Request(self.url, data=data), timeout=30) as response:
+                    text = json.loads(response.read())["text"]
+                return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+            except urllib.error.HTTPError as error:
+                if attempt == self.client_retries:
+                    raise
+                time.sleep(0.01)
+
+
+# -------------------
+# Load
+# -------------------
+def run(llm: BaseChatModel, users: int, requests: int, heavy_factor: int) -> Dict[str, Any]:
+    latencies: Dict[str, List[float]] = {}
+    errors = 0
+    lock = threading.Lock()
+
+    def session(user: str, count: int) -> None:
+        nonlocal errors
+        for n in range(count):
+            start = time.perf_counter()
+            try:
+                llm.invoke([HumanMessage(f"{user} question {n}")], config={"configurable": {"user_id": user}})
+            except Exception:
+                with lock:
+                    errors += 1
+                continue
+            with lock:
+                latencies.setdefault(user, []).append(time.perf_counter() - start)
+
+    sessions = [("heavy", requests * heavy_factor)] + [(f"user{i}", requests) for i in range(1, users)]
+    # The heavy user fans out over several threads, like a batch job.
+    threads = [
+        threading.Thread(target=session, args=(user, count // 4 if user == "heavy" else count))
+        for user, count in sessions
+        for _ in range(4 if user == "heavy" else 1)
+    ]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    everything = [x for values in latencies.values() for x in values]
+    light = [x for user, values in latencies.items() if user != "heavy" for x in values]
+    pct = lambda xs, q: float(np.percentile(xs, q) * 1000) if xs else float("nan")  # noqa: E731
+    return {
+        "ok": len(everything),
+        "errors": errors,
+        "seconds": elapsed,
+        "p50": pct(everything, 50),
+        "p95": pct(everything, 95),
+        "p99": pct(everything, 99),
+        "light_p95": pct(light, 95),
+    }
+
+
+def build(mode: str, url: str, args) -> tuple[BaseChatModel, Optional[LLMGateway]]:
+    if mode == "direct":
+        return FakeServerChatModel(url=url, client_retries=6), None
+    gateway = LLMGateway(
+        rate=args.gateway_rps,
+        burst=args.server_concurrency,
+        max_concurrency=args.server_concurrency,
+        retry_base=0.05,
+        retry_max=1.0,
+        max_retries=6,
+        hedge="p95" if mode == "hedged" else "off",
+    )
+    return GatewayChatModel(llm=FakeServerChatModel(url=url), gateway=gateway), gateway
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=20, help="requests per light user")
+    parser.add_argument("--heavy-factor", type=int, default=8)
+    parser.add_argument("--server-rps", type=float, default=60)
+    parser.add_argument("--server-concurrency", type=int, default=8)
+    parser.add_argument("--gateway-rps", type=float, default=55, help="kept a little under the server's limit")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--tail-prob", type=float, default=0.05)
+    parser.add_argument("--tail-factor", type=float, default=10)
+    parser.add_argument("--modes", default="direct,gateway,hedged")
+    args = parser.parse_args()
+
+    for mode in args.modes.split(","):
+        server = FakeModelServer(
+            args.server_rps, args.server_concurrency, args.latency_ms, args.tail_prob, args.tail_factor
+        )
+        llm, gateway = build(mode, server.url, args)
+        result = run(llm, args.users, args.requests, args.heavy_factor)
+        server.close()
+        print(
+            f"{mode:8s} ok={result['ok']:5d} errors={result['errors']:4d} 429s={server.rejected:5d} "
+            f"{result['seconds']:6.1f}s p50={result['p50']:7.1f}ms p95={result['p95']:7.1f}ms "
+            f"p99={result['p99']:7.1f}ms light_p95={result['light_p95']:7.1f}ms"
+        )
+        if gateway is not None:
+            stats = gateway.stats()
+            print(
+                f"         queue_wait_ms={stats['queue_wait_ms']} service_ms={stats['service_ms']} "
+                f"retries={stats['retries']} hedges={stats['hedges']} hedge_wins={stats['hedge_wins']}"
+            )
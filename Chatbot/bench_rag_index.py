@@ -0,0 +1,120 @@
+"""
+Recall-vs-latency benchmark for the RAG index types in rag_index_types.
+
+Builds synthetic "documents" from a topic vocabulary, embeds them with a
+deterministic local embedding (signed feature hashing, no network), and for
+each index type reports build time, query p50/p99, serialized index size and recall@k
+against the exact flat index.
+
+    python bench_rag_index.py --chunks 6000 --dim 768 --queries 500
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import random
+import time
+from typing import List
+
+import numpy as np
+
+from rag_index_types import INDEX_TYPES, build_index
+
+
+# -------------------
+# 1. Synthetic corpus + local embeddings
+# -------------------
+def synthetic_chunks(n_chunks: int, seed: int = 0) -> List[str]:
+    """Chunks drawn from overlapping topics, with a few exact identifiers each."""
+    rng = random.Random(seed)
+    vocab = [f"term{i}" for i in range(5000)]
+    topics = [rng.sample(vocab, 200) for _ in range(max(8, n_chunks // 50))]
+    chunks = []
+    for n in range(n_chunks):
+        words = rng.choices(rng.choice(topics), k=120) + rng.choices(vocab, k=30)
+        words += [f"PN-{n:05d}", f"clause-{n % 97}.{n % 13}"]
+        rng.shuffle(words)
+        chunks.append(" ".join(words))
+    return chunks
+
+
+class LocalHashEmbeddings:
+    """Deterministic bag-of-words embedding via signed feature hashing."""
+
+    def __init__(self, dim: int = 768) -> None:
+        self.dim = dim
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in text.split():
+                digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dim
+                out[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+
+def make_queries(chunks: List[str], n_queries: int, seed: int = 1) -> List[str]:
+    """Queries are random word subsets of random chunks (a paraphrase stand-in)."""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n_queries):
+        words = rng.choice(chunks).split()
+        queries.append(" ".join(rng.sample(words, k=min(12, len(words)))))
+    return queries
+
+
+# -------------------
+# 2. Measurements
+# -------------------
+def index_bytes(index) -> int:
+    import faiss
+
+    return len(faiss.serialize_index(index))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    return float(np.percentile(np.asarray(values), pct))
+
+
+def run(n_chunks: int, dim: int, n_queries: int, k: int) -> None:
+    chunks = synthetic_chunks(n_chunks)
+    embedder = LocalHashEmbeddings(dim)
+    vectors = embedder.embed(chunks)
+    query_vectors = embedder.embed(make_queries(chunks, n_queries))
+
+    baseline = None
+    print(f"chunks={n_chunks} dim={dim} queries={n_queries} k={k}")
+    print(f"{'type':<6} {'build_s':>8} {'p50_ms':>8} {'p99_ms':>8} {'index_MB':>10} {'recall@k':>9}")
+    for index_type in INDEX_TYPES:
+        started = time.perf_counter()
+        index = build_index(vectors, index_type)
+        build_s = time.perf_counter() - started
+
+        latencies = []
+        results = []
+        for query in query_vectors:
+            started = time.perf_counter()
+            _, ids = index.search(query.reshape(1, -1), k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            results.append(set(ids[0].tolist()))
+
+        if baseline is None:
+            baseline = results
+        recall = float(np.mean([len(r & b) / k for r, b in zip(results, baseline)]))
+
+        print(
+            f"{index_type:<6} {build_s:>8.2f} {percentile(latencies, 50):>8.3f} "
+            f"{percentile(latencies, 99):>8.3f} {index_bytes(index) / 1e6:>10.2f} {recall:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=6000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=4)
+    args = parser.parse_args()
+    run(args.chunks, args.dim, args.queries, args.k)
@@ -1,19 +1,22 @@
 from langgraph.graph import StateGraph, START, END
 from typing import TypedDict, Annotated
 from langchain_core.messages import BaseMessage, HumanMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode, tools_condition
 from langchain_community.tools import DuckDuckGoSearchRun
 from langchain_core.tools import tool, BaseTool
 from langchain_mcp_adapters.client import MultiServerMCPClient
 from dotenv import load_dotenv
-import aiosqlite
 import requests
 import asyncio
 import threading
 
+from checkpointer_factory import create_async_checkpointer
+from conversation_window import HISTORY_PAGE_SIZE, amessage_window
+from history_budget import HistoryBudget
+from llm_cache import create_llm_cache
+from llm_gateway import chat_model
+
 load_dotenv()
 
 # Dedicated async loop for backend tasks
@@ -38,7 +41,10 @@ def submit_async_task(coro):
 # -------------------
 # 1. LLM
 # -------------------
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash")
+LLM_MODEL = "gemini-2.0-flash"
+llm = chat_model(LLM_MODEL, cache=create_llm_cache())  # LLM_CACHE=off|exact|semantic; limits in llm_gateway
+# Caps the history sent per call (HISTORY_TOKEN_BUDGET); tool call/result pairs stay together.
+history_budget = HistoryBudget(LLM_MODEL)
 
 
 
@@ -103,7 +109,7 @@ class ChatState(TypedDict):
 # -------------------
 async def chat_node(state: ChatState):
     """LLM node that may answer or request a tool call."""
-    messages = state["messages"]
+    messages = history_budget.fit(state["messages"])
     response = await llm_with_tools.ainvoke(messages)
     return {"messages": [response]}
 
@@ -113,14 +119,7 @@ tool_node = ToolNode(tools) if tools else None
 # -------------------
 # 5. Checkpointer
 # -------------------
-
-
-async def _init_checkpointer():
-    conn = await aiosqlite.connect(database="chatbot.db")
-    return AsyncSqliteSaver(conn)
-
-
-checkpointer = run_async(_init_checkpointer())
+checkpointer = run_async(create_async_checkpointer())  # CHECKPOINT_BACKEND=sqlite|postgres
 
 # -------------------
 # 6. Graph
@@ -141,12 +140,15 @@ chatbot = graph.compile(checkpointer=checkpointer)
 # -------------------
 # 7. Helper
 # -------------------
-async def _alist_threads():
-    all_threads = set()
-    async for checkpoint in checkpointer.alist(None):
-        all_threads.add(checkpoint.config["configurable"]["thread_id"])
-    return list(all_threads)
+def retrieve_all_threads():
+    return run_async(checkpointer.athread_ids())
 
 
-def retrieve_all_threads():
-    return run_async(_alist_threads())
\ No newline at end of file
+def list_threads(limit=50, before=None, owner=None):
+    """One page of the thread catalog, most recently updated first."""
+    return run_async(checkpointer.alist_threads(limit=limit, before=before, owner=owner))
+
+
+def load_messages(thread_id, limit=HISTORY_PAGE_SIZE, before=None):
+    """The newest `limit` messages of a thread (or the page before `before`) plus the cursor for older ones."""
+    return run_async(amessage_window(checkpointer, thread_id, limit, before))
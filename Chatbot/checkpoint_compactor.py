@@ -0,0 +1,351 @@
+"""
+Retention + compaction for the checkpoint database.
+
+Every super-step writes a full checkpoint and nothing prunes them, while the
+frontends only ever read the latest state. The compactor keeps the newest
+CHECKPOINT_KEEP_LAST checkpoints of every (thread, namespace), plus any
+checkpoint with a pending interrupt, any checkpoint a live history cursor
+pins and any snapshot / delta a kept checkpoint's messages are rebuilt from,
+and deletes the rest with their writes.
+It works through a few threads per pass in short transactions, then hands
+freed pages back to the filesystem with `PRAGMA incremental_vacuum`.
+
+    python checkpoint_compactor.py chatbot.db --convert   # one-off full pass
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from delta_checkpoints import BASE_KEY
+from thread_catalog import CURSOR_PINS_SCHEMA
+
+logger = logging.getLogger(__name__)
+
+# -------------------
+# 1. Settings
+# -------------------
+# Only used once compaction is switched on (CHECKPOINT_COMPACTION in checkpointer_factory).
+CHECKPOINT_KEEP_LAST = int(os.getenv("CHECKPOINT_KEEP_LAST", "20"))  # <= 0 disables
+COMPACT_INTERVAL_SECONDS = float(os.getenv("COMPACT_INTERVAL_SECONDS", "300"))
+COMPACT_THREADS_PER_BATCH = int(os.getenv("COMPACT_THREADS_PER_BATCH", "25"))
+# Pages handed back per incremental_vacuum call; small steps keep the write lock short.
+VACUUM_PAGES_PER_STEP = int(os.getenv("VACUUM_PAGES_PER_STEP", "2000"))
+# Converting an existing file to auto_vacuum=INCREMENTAL needs one full VACUUM.
+CHECKPOINT_VACUUM_CONVERT = os.getenv("CHECKPOINT_VACUUM_CONVERT", "0") == "1"
+
+# Channel name LangGraph uses for interrupt writes (langgraph._internal._constants.INTERRUPT).
+INTERRUPT_CHANNEL = "__interrupt__"
+AUTO_VACUUM_INCREMENTAL = 2
+
+# Checkpoints of one (thread, ns) beyond the newest `keep`, minus pending
+# interrupts (a checkpoint with interrupt writes that nothing has resumed from
+# yet, i.e. no child checkpoint) and checkpoints a live history cursor pins
+# (see thread_catalog.cursor_pins).
+PRUNABLE_SQL = f"""
+SELECT c.checkpoint_id, LENGTH(c.checkpoint) + IFNULL(LENGTH(c.metadata), 0)
+FROM checkpoints c
+WHERE c.thread_id = ? AND c.checkpoint_ns = ?
+  AND c.checkpoint_id < (
+      SELECT checkpoint_id FROM checkpoints
+      WHERE thread_id = ? AND checkpoint_ns = ?
+      ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?
+  )
+  AND NOT (
+      EXISTS (
+          SELECT 1 FROM writes w
+          WHERE w.thread_id = c.thread_id AND w.checkpoint_ns = c.checkpoint_ns
+            AND w.checkpoint_id = c.checkpoint_id AND w.channel = '{INTERRUPT_CHANNEL}'
+      )
+      AND NOT EXISTS (
+          SELECT 1 FROM checkpoints child
+          WHERE child.thread_id = c.thread_id AND child.checkpoint_ns = c.checkpoint_ns
+            AND child.parent_checkpoint_id = c.checkpoint_id
+      )
+  )
+  AND NOT EXISTS (
+      SELECT 1 FROM cursor_pins p
+      WHERE p.thread_id = c.thread_id AND p.checkpoint_ns = c.checkpoint_ns
+        AND p.checkpoint_id = c.checkpoint_id AND p.expires_at > ?
+  )
+"""
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+# -------------------
+# 2. Compactor
+# -------------------
+class CheckpointCompactor:
+    """
+    Incremental background compactor for a SqliteSaver database.
+
+    Threads are visited in thread_id order from a persistent cursor; after the
+    first full sweep only threads whose catalog row changed since the previous
+    sweep started are revisited, so a pass costs O(recently active threads).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        keep_last: int = CHECKPOINT_KEEP_LAST,
+        interval_seconds: float = COMPACT_INTERVAL_SECONDS,
+        threads_per_batch: int = COMPACT_THREADS_PER_BATCH,
+        vacuum_pages_per_step: int = VACUUM_PAGES_PER_STEP,
+    ) -> None:
+        self.path = path
+        self.keep_last = keep_last
+        self.interval_seconds = interval_seconds
+        self.threads_per_batch = threads_per_batch
+        self.vacuum_pages_per_step = vacuum_pages_per_step
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._since: Optional[str] = None  # catalog timestamp of the last finished sweep
+        self._stats = {
+            "passes": 0,
+            "threads_visited": 0,
+            "checkpoints_deleted": 0,
+            "writes_deleted": 0,
+            "payload_bytes_deleted": 0,
+            "file_bytes_reclaimed": 0,
+            "last_pass_seconds": 0.0,
+        }
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = _connect(self.path)
+        return self._conn
+
+    def _has_tables(self) -> Tuple[bool, bool]:
+        names = {
+            row[0]
+            for row in self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' "
+                "AND name IN ('checkpoints', 'writes', 'thread_catalog')"
+            )
+        }
+        return {"checkpoints", "writes"} <= names, "thread_catalog" in names
+
+    # -------------------
+    # Vacuum
+    # -------------------
+    def enable_incremental_vacuum(self) -> bool:
+        """One-off: switch the file to auto_vacuum=INCREMENTAL (runs a full VACUUM)."""
+        with self._lock:
+            if self.conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+                return False
+            self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self.conn.execute("VACUUM")
+            return True
+
+    def _file_bytes(self) -> int:
+        page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+        return self.conn.execute("PRAGMA page_count").fetchone()[0] * page_size
+
+    def _vacuum_step(self) -> int:
+        """Release free pages a step at a time; returns bytes the file shrank by."""
+        if self.conn.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+            return 0  # freed pages are still reused by SQLite, the file just doesn't shrink
+        before = self._file_bytes()
+        while self.conn.execute("PRAGMA freelist_count").fetchone()[0] > 0:
+            self.conn.execute(f"PRAGMA incremental_vacuum({self.vacuum_pages_per_step})").fetchall()
+            if self._stop.is_set():
+                break
+        return before - self._file_bytes()
+
+    # -------------------
+    # Retention
+    # -------------------
+    def _thread_batch(self, after: str, use_catalog: bool) -> List[str]:
+        if use_catalog and self._since is not None:
+            rows = self.conn.execute(
+                "SELECT thread_id FROM thread_catalog WHERE last_updated >= ? AND thread_id > ? "
+                "ORDER BY thread_id LIMIT ?",
+                (self._since, after, self.threads_per_batch),
+            )
+        else:
+            rows = self.conn.execute(
+                "SELECT DISTINCT thread_id FROM checkpoints WHERE thread_id > ? "
+                "ORDER BY thread_id LIMIT ?",
+                (after, self.threads_per_batch),
+            )
+        return [row[0] for row in rows]
+
+    def _drop_delta_bases(self, thread_id: str, ns: str, prunable: List[tuple]) -> List[tuple]:
+        """
+        Keep every checkpoint a surviving delta-encoded checkpoint replays from
+        (see delta_checkpoints.BASE_KEY); only the metadata column is read.
+        """
+        bases = {
+            checkpoint_id: json.loads(metadata).get(BASE_KEY)
+            for checkpoint_id, metadata in self.conn.execute(
+                "SELECT checkpoint_id, metadata FROM checkpoints "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND CAST(metadata AS TEXT) LIKE ?",
+                (thread_id, ns, f'%"{BASE_KEY}"%'),
+            )
+        }
+        if not bases:
+            return prunable
+        doomed = {checkpoint_id for checkpoint_id, _ in prunable}
+        for checkpoint_id in list(bases):
+            if checkpoint_id in doomed:
+                continue
+            base = bases.get(checkpoint_id)
+            while base is not None and base in doomed:
+                doomed.discard(base)
+                base = bases.get(base)
+        return [row for row in prunable if row[0] in doomed]
+
+    def _compact_thread(self, thread_id: str) -> Tuple[int, int, int]:
+        """Apply retention to every namespace of one thread, in one transaction."""
+        deleted = writes_deleted = payload = 0
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            namespaces = [
+                row[0]
+                for row in self.conn.execute(
+                    "SELECT DISTINCT checkpoint_ns FROM checkpoints WHERE thread_id = ?", (thread_id,)
+                )
+            ]
+            for ns in namespaces:
+                prunable = self.conn.execute(
+                    PRUNABLE_SQL, (thread_id, ns, thread_id, ns, self.keep_last - 1, time.time())
+                ).fetchall()
+                prunable = self._drop_delta_bases(thread_id, ns, prunable)
+                if not prunable:
+                    continue
+                ids = [(thread_id, ns, checkpoint_id) for checkpoint_id, _ in prunable]
+                payload += sum(size or 0 for _, size in prunable)
+                payload += sum(
+                    self.conn.execute(
+                        "SELECT IFNULL(SUM(LENGTH(value)), 0) FROM writes "
+                        "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                        key,
+                    ).fetchone()[0]
+                    for key in ids
+                )
+                before = self.conn.total_changes
+                self.conn.executemany(
+                    "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    ids,
+                )
+                writes_deleted += self.conn.total_changes - before
+                self.conn.executemany(
+                    "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    ids,
+                )
+                deleted += len(ids)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return deleted, writes_deleted, payload
+
+    def run_pass(self) -> dict:
+        """One sweep over (recently changed) threads, then an online vacuum step."""
+        if self.keep_last <= 0:
+            return self.stats()
+        with self._lock:
+            started = time.perf_counter()
+            has_checkpoints, has_catalog = self._has_tables()
+            if not has_checkpoints:
+                return self.stats()
+            # Pins are written by the catalog savers; a database they never
+            # opened simply has none.
+            self.conn.executescript(CURSOR_PINS_SCHEMA)
+            self.conn.execute("DELETE FROM cursor_pins WHERE expires_at <= ?", (time.time(),))
+            sweep_started = datetime.now(timezone.utc).isoformat()  # same format as checkpoint ts
+            totals = [0, 0, 0, 0]
+            after = ""
+            while not self._stop.is_set():
+                batch = self._thread_batch(after, has_catalog)
+                if not batch:
+                    break
+                for thread_id in batch:
+                    deleted, writes_deleted, payload = self._compact_thread(thread_id)
+                    totals[0] += 1
+                    totals[1] += deleted
+                    totals[2] += writes_deleted
+                    totals[3] += payload
+                after = batch[-1]
+            else:
+                sweep_started = self._since  # interrupted: revisit the same window next time
+            self._since = sweep_started
+            reclaimed = self._vacuum_step()
+
+            self._stats["passes"] += 1
+            self._stats["threads_visited"] += totals[0]
+            self._stats["checkpoints_deleted"] += totals[1]
+            self._stats["writes_deleted"] += totals[2]
+            self._stats["payload_bytes_deleted"] += totals[3]
+            self._stats["file_bytes_reclaimed"] += reclaimed
+            self._stats["last_pass_seconds"] = time.perf_counter() - started
+            if totals[1] or reclaimed:
+                logger.info(
+                    "compacted %d checkpoints (%d bytes), reclaimed %d file bytes",
+                    totals[1], totals[3], reclaimed,
+                )
+            return self.stats()
+
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+    # -------------------
+    # Background thread
+    # -------------------
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.run_pass()
+            except sqlite3.Error:
+                logger.exception("checkpoint compaction pass failed")
+
+    def start(self) -> "CheckpointCompactor":
+        if self.keep_last <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return self
+        if CHECKPOINT_VACUUM_CONVERT:
+            self.enable_incremental_vacuum()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="checkpoint-compactor", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("database", nargs="?", default="chatbot.db")
+    parser.add_argument("--keep-last", type=int, default=CHECKPOINT_KEEP_LAST)
+    parser.add_argument(
+        "--convert", action="store_true", help="switch to auto_vacuum=INCREMENTAL first (full VACUUM)"
+    )
+    args = parser.parse_args()
+
+    compactor = CheckpointCompactor(args.database, keep_last=args.keep_last)
+    size_before = os.path.getsize(args.database)
+    if args.convert and compactor.enable_incremental_vacuum():
+        print(f"converted to incremental auto_vacuum: {size_before} -> {os.path.getsize(args.database)} bytes")
+    print(compactor.run_pass())
+    compactor.stop()
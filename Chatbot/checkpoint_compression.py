@@ -0,0 +1,313 @@
+"""
+Opt-in zstd compression for checkpoint blobs, with a dictionary trained on
+chatbot.db.
+
+Checkpoint payloads repeat the same system prompts, tool schemas and tool
+JSON (Alpha Vantage GLOBAL_QUOTE responses, search results), and after delta
+encoding most rows are small, which is where a shared dictionary pays off.
+
+Compressed rows get a "+zstd" suffix on their serde type and a versioned
+header carrying the dictionary id, so rows written before compression (or
+with an older dictionary) keep loading.
+
+    python checkpoint_compression.py train chatbot.db   # writes checkpoint_dicts/
+    python checkpoint_compression.py bench chatbot.db   # sizes, ratios, turn latency (ms)
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import statistics
+import struct
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from langgraph.checkpoint.serde.base import SerializerProtocol
+
+# -------------------
+# 1. Settings
+# -------------------
+# CHECKPOINT_COMPRESSION=zstd turns compression on for writes; reading
+# compressed rows always works.
+CHECKPOINT_COMPRESSION = os.getenv("CHECKPOINT_COMPRESSION", "none")
+CHECKPOINT_ZSTD_LEVEL = int(os.getenv("CHECKPOINT_ZSTD_LEVEL", "3"))
+CHECKPOINT_DICT_DIR = os.getenv("CHECKPOINT_DICT_DIR", "checkpoint_dicts")
+CHECKPOINT_DICT_SIZE = int(os.getenv("CHECKPOINT_DICT_SIZE", str(112 * 1024)))
+# Tiny blobs (nulls, short writes) are not worth a frame header.
+MIN_COMPRESS_BYTES = 64
+
+TYPE_SUFFIX = "+zstd"
+MAGIC = b"ZC"
+FORMAT_VERSION = 1
+# magic, format version, dictionary id (0 = no dictionary)
+_HEADER = struct.Struct(">2sBI")
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            "Checkpoint compression needs zstandard. Install it with `pip install zstandard`."
+        ) from None
+    return zstandard
+
+
+# -------------------
+# 2. Dictionaries
+# -------------------
+class DictionaryStore:
+    """Trained dictionaries as `<dict_dir>/<dict_id>.zdict`; CURRENT names the one used for writes."""
+
+    def __init__(self, dict_dir: str = CHECKPOINT_DICT_DIR) -> None:
+        self.dict_dir = dict_dir
+        self._dicts: Dict[int, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, dict_id: int) -> Any:
+        with self._lock:
+            if dict_id not in self._dicts:
+                path = os.path.join(self.dict_dir, f"{dict_id}.zdict")
+                with open(path, "rb") as fh:
+                    self._dicts[dict_id] = _zstd().ZstdCompressionDict(fh.read())
+            return self._dicts[dict_id]
+
+    def current_id(self) -> int:
+        try:
+            with open(os.path.join(self.dict_dir, "CURRENT")) as fh:
+                return int(fh.read().strip())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def save(self, dictionary: Any, make_current: bool = True) -> int:
+        os.makedirs(self.dict_dir, exist_ok=True)
+        dict_id = dictionary.dict_id()
+        path = os.path.join(self.dict_dir, f"{dict_id}.zdict")
+        with open(path + ".tmp", "wb") as fh:
+            fh.write(dictionary.as_bytes())
+        os.replace(path + ".tmp", path)
+        if make_current:
+            with open(os.path.join(self.dict_dir, "CURRENT.tmp"), "w") as fh:
+                fh.write(str(dict_id))
+            os.replace(os.path.join(self.dict_dir, "CURRENT.tmp"), os.path.join(self.dict_dir, "CURRENT"))
+        with self._lock:
+            self._dicts[dict_id] = dictionary
+        return dict_id
+
+
+# -------------------
+# 3. Serializer
+# -------------------
+class CompressedSerializer(SerializerProtocol):
+    """Wraps a serde; compresses on write when enabled, always decompresses on read."""
+
+    def __init__(
+        self,
+        serde: SerializerProtocol,
+        enabled: bool = CHECKPOINT_COMPRESSION == "zstd",
+        level: int = CHECKPOINT_ZSTD_LEVEL,
+        dictionaries: Optional[DictionaryStore] = None,
+    ) -> None:
+        self.serde = serde
+        self.enabled = enabled
+        self.level = level
+        self.dictionaries = dictionaries or DictionaryStore()
+        # zstd (de)compressor objects are not thread-safe; keep one per thread.
+        self._local = threading.local()
+        self._write_dict_id = self.dictionaries.current_id() if enabled else 0
+
+    def _compressor(self, dict_id: int) -> Any:
+        cache = self._local.__dict__.setdefault("compressors", {})
+        if dict_id not in cache:
+            zstd = _zstd()
+            kwargs = {"dict_data": self.dictionaries.get(dict_id)} if dict_id else {}
+            cache[dict_id] = zstd.ZstdCompressor(level=self.level, write_dict_id=False, **kwargs)
+        return cache[dict_id]
+
+    def _decompressor(self, dict_id: int) -> Any:
+        cache = self._local.__dict__.setdefault("decompressors", {})
+        if dict_id not in cache:
+            zstd = _zstd()
+            kwargs = {"dict_data": self.dictionaries.get(dict_id)} if dict_id else {}
+            cache[dict_id] = zstd.ZstdDecompressor(**kwargs)
+        return cache[dict_id]
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(obj)
+        if not self.enabled or len(data) < MIN_COMPRESS_BYTES:
+            return type_, data
+        dict_id = self._write_dict_id
+        compressed = self._compressor(dict_id).compress(data)
+        if len(compressed) + _HEADER.size >= len(data):
+            return type_, data
+        return type_ + TYPE_SUFFIX, _HEADER.pack(MAGIC, FORMAT_VERSION, dict_id) + compressed
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if not type_.endswith(TYPE_SUFFIX):
+            return self.serde.loads_typed(data)
+        magic, version, dict_id = _HEADER.unpack_from(payload)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"Unknown compressed checkpoint format {magic!r} v{version}.")
+        raw = self._decompressor(dict_id).decompress(payload[_HEADER.size :])
+        return self.serde.loads_typed((type_[: -len(TYPE_SUFFIX)], raw))
+
+
+# -------------------
+# 4. Training + benchmark
+# -------------------
+def sample_blobs(db_path: str, limit: int = 20000) -> List[bytes]:
+    """Raw (uncompressed) serialized checkpoints and writes from a database."""
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+    reader = CompressedSerializer(JsonPlusSerializer(), enabled=False)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT type, checkpoint FROM checkpoints ORDER BY RANDOM() LIMIT ?", (limit // 2,)
+        ).fetchall()
+        rows += conn.execute(
+            "SELECT type, value FROM writes WHERE value IS NOT NULL ORDER BY RANDOM() LIMIT ?",
+            (limit // 2,),
+        ).fetchall()
+    finally:
+        conn.close()
+    blobs = []
+    for type_, blob in rows:
+        if blob is None:
+            continue
+        if type_.endswith(TYPE_SUFFIX):
+            obj = reader.loads_typed((type_, blob))
+            blob = reader.serde.dumps_typed(obj)[1]
+        blobs.append(bytes(blob))
+    return blobs
+
+
+def train_dictionary(db_path: str, dict_size: int = CHECKPOINT_DICT_SIZE, store: Optional[DictionaryStore] = None) -> int:
+    blobs = sample_blobs(db_path)
+    if len(blobs) < 8:
+        raise ValueError(f"Need more checkpoints to train on ({len(blobs)} samples in {db_path}).")
+    dictionary = _zstd().train_dictionary(dict_size, blobs)
+    return (store or DictionaryStore()).save(dictionary)
+
+
+def sample_checkpoints(db_path: str, limit: int = 500) -> List[dict]:
+    """Deserialized checkpoints from a database, to replay through a saver."""
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+    reader = CompressedSerializer(JsonPlusSerializer(), enabled=False)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT type, checkpoint FROM checkpoints ORDER BY RANDOM() LIMIT ?", (limit,)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [reader.loads_typed((type_, blob)) for type_, blob in rows if blob is not None]
+
+
+def bench_turns(checkpoints: List[dict], serde: SerializerProtocol) -> Dict[str, float]:
+    """
+    put / get_tuple latency (ms) and stored bytes for `checkpoints` written
+    one per thread through a SqliteSaver using `serde`, i.e. the checkpoint
+    cost of one chat turn.
+    """
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    put_times, get_times = [], []
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "bench.db"), check_same_thread=False)
+        saver = SqliteSaver(conn, serde=serde)
+        saver.setup()
+        for n, checkpoint in enumerate(checkpoints):
+            config = {"configurable": {"thread_id": f"bench-{n}", "checkpoint_ns": ""}}
+            started = time.perf_counter()
+            saved = saver.put(config, checkpoint, {"source": "loop", "step": n}, {})
+            put_times.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            saver.get_tuple(saved)
+            get_times.append(time.perf_counter() - started)
+        stored = conn.execute("SELECT IFNULL(SUM(LENGTH(checkpoint)), 0) FROM checkpoints").fetchone()[0]
+        conn.close()
+    return {
+        "put_p50": _percentile(put_times, 50) * 1e3,
+        "put_p95": _percentile(put_times, 95) * 1e3,
+        "get_p50": _percentile(get_times, 50) * 1e3,
+        "get_p95": _percentile(get_times, 95) * 1e3,
+        "stored_bytes": stored,
+    }
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+def bench(db_path: str, level: int = CHECKPOINT_ZSTD_LEVEL) -> None:
+    """
+    Ratio and per-blob encode/decode time for no dict vs the current dict,
+    then per-turn checkpoint put/get latency with compression off and on.
+    """
+    zstd = _zstd()
+    blobs = sample_blobs(db_path)
+    total = sum(len(b) for b in blobs)
+    store = DictionaryStore()
+    variants = [("zstd", 0)]
+    if store.current_id():
+        variants.append(("zstd+dict", store.current_id()))
+    print(f"samples={len(blobs)} raw_MB={total / 1e6:.2f} level={level}")
+    print(f"{'variant':<10} {'ratio':>7} {'enc_us':>8} {'dec_us':>8}")
+    for name, dict_id in variants:
+        kwargs = {"dict_data": store.get(dict_id)} if dict_id else {}
+        compressor = zstd.ZstdCompressor(level=level, write_dict_id=False, **kwargs)
+        decompressor = zstd.ZstdDecompressor(**kwargs)
+        encode_times, decode_times, compressed_total = [], [], 0
+        for blob in blobs:
+            started = time.perf_counter()
+            frame = compressor.compress(blob)
+            encode_times.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            decompressor.decompress(frame)
+            decode_times.append(time.perf_counter() - started)
+            compressed_total += len(frame) + _HEADER.size
+        print(
+            f"{name:<10} {total / compressed_total:>7.2f} "
+            f"{statistics.mean(encode_times) * 1e6:>8.1f} {statistics.mean(decode_times) * 1e6:>8.1f}"
+        )
+
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+    checkpoints = sample_checkpoints(db_path)
+    if not checkpoints:
+        return
+    print(f"\nturns={len(checkpoints)} (one checkpoint put + get_tuple each, ms)")
+    print(f"{'variant':<10} {'stored_KB':>10} {'ratio':>7} {'put_p50':>8} {'put_p95':>8} {'get_p50':>8} {'get_p95':>8}")
+    with tempfile.TemporaryDirectory() as no_dicts:
+        turn_variants = [
+            ("off", CompressedSerializer(JsonPlusSerializer(), enabled=False)),
+            ("zstd", CompressedSerializer(JsonPlusSerializer(), True, level, DictionaryStore(no_dicts))),
+        ]
+        if store.current_id():
+            turn_variants.append(("zstd+dict", CompressedSerializer(JsonPlusSerializer(), True, level, store)))
+        results = [(name, bench_turns(checkpoints, serde)) for name, serde in turn_variants]
+    baseline = None
+    for name, result in results:
+        baseline = baseline or result["stored_bytes"]
+        print(
+            f"{name:<10} {result['stored_bytes'] / 1e3:>10.1f} {baseline / max(result['stored_bytes'], 1):>7.2f} "
+            f"{result['put_p50']:>8.3f} {result['put_p95']:>8.3f} {result['get_p50']:>8.3f} {result['get_p95']:>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("command", choices=["train", "bench"])
+    parser.add_argument("database", nargs="?", default="chatbot.db")
+    args = parser.parse_args()
+    if args.command == "train":
+        print(f"dictionary {train_dictionary(args.database)} written to {CHECKPOINT_DICT_DIR}/")
+    else:
+        bench(args.database)
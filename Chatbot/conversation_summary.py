@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    ToolMessage,
+)
+
+from llm_cache import bypass_llm_cache
+
+logger = logging.getLogger(__name__)
+
+# -------------------
+# 1. Settings
+# -------------------
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "off")  # off | background
+# Summarize once a thread holds more than this many messages (STM_summarization uses 6).
+SUMMARY_TRIGGER_MESSAGES = int(os.getenv("SUMMARY_TRIGGER_MESSAGES", "6"))
+# Newest messages kept verbatim after a summary.
+SUMMARY_KEEP_MESSAGES = int(os.getenv("SUMMARY_KEEP_MESSAGES", "2"))
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "2"))
+
+
+# -------------------
+# 2. Helpers
+# -------------------
+def summary_message(summary: str) -> List[BaseMessage]:
+    """The system message that carries a thread's summary into chat_node (empty if none)."""
+    return [SystemMessage(content=f"Conversation summary:\n{summary}")] if summary else []
+
+
+def _fold_point(messages: Sequence[BaseMessage], keep: int) -> int:
+    """
+    Number of leading messages to fold into the summary. The kept tail starts
+    at a user message, so no tool call is split from its results and the
+    window chat_node sends still opens with a user turn.
+    """
+    cut = len(messages) - keep
+    while cut > 0 and not isinstance(messages[cut], HumanMessage):
+        cut -= 1
+    return max(cut, 0)
+
+
+def _transcript(messages: Sequence[BaseMessage]) -> str:
+    lines = []
+    for m in messages:
+        if isinstance(m, HumanMessage):
+            lines.append(f"User: {m.content}")
+        elif isinstance(m, ToolMessage):
+            lines.append(f"Tool ({m.name or 'tool'}): {m.content}")
+        elif isinstance(m, AIMessage):
+            calls = ", ".join(tc["name"] for tc in m.tool_calls)
+            lines.append(f"Assistant: {m.content}" if not calls else f"Assistant (called {calls}): {m.content}")
+    return "\n".join(lines)
+
+
+def _prompt(existing_summary: str, messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+    # Only the messages being folded are sent: everything older is already in
+    # `existing_summary`, everything newer stays verbatim in the thread.
+    if existing_summary:
+        instruction = (
+            f"Existing summary:\n{existing_summary}\n\n"
+            "Extend the summary using the new conversation below."
+        )
+    else:
+        instruction = "Summarize the conversation below."
+    return [HumanMessage(content=f"{instruction}\n\n{_transcript(messages)}")]
+
+
+# -------------------
+# 3. Run tracking
+# -------------------
+class _RunHook(BaseCallbackHandler):
+    """
+    Reports graph runs starting and finishing, per thread, to the summarizer.
+
+    Bound to the graph's config, so the first chain it sees of a run is the
+    graph itself; chains nested under a run it tracks are children. Pregel
+    fires on_chain_end only after the run's last checkpoint is saved.
+    """
+
+    run_inline = True
+
+    def __init__(self, summarizer: "BackgroundSummarizer") -> None:
+        self.summarizer = summarizer
+        self._lock = threading.Lock()
+        # run_id -> thread_id for graph runs, None for their children.
+        self._runs: Dict[UUID, Optional[str]] = {}
+
+    def on_chain_start(
+        self,
+        serialized: Optional[Dict[str, Any]],
+        inputs: Any,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        with self._lock:
+            if parent_run_id is not None and parent_run_id in self._runs:
+                self._runs[run_id] = None
+                return
+            thread_id = (metadata or {}).get("thread_id")
+            thread_id = None if thread_id is None else str(thread_id)
+            self._runs[run_id] = thread_id
+        if thread_id is not None:
+            self.summarizer.run_started(thread_id)
+
+    def _ended(self, run_id: UUID) -> None:
+        with self._lock:
+            thread_id = self._runs.pop(run_id, None)
+        if thread_id is not None:
+            self.summarizer.run_finished(thread_id)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._ended(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._ended(run_id)
+
+
+# -------------------
+# 4. Summarizer
+# -------------------
+class BackgroundSummarizer:
+    """
+    Summarizes a thread off the request path and commits the result to the
+    thread's checkpoints as soon as the thread is idle.
+
+    `schedule` is called once a turn's answer is ready and only submits a
+    job. The job folds the messages added since the last summary into it and
+    writes the new summary plus the RemoveMessage deletions with
+    `graph.update_state`, so the fold is durable the moment it is written. A
+    fold that finishes while a run on its thread is still going (usually the
+    run that scheduled it, before its last checkpoint is saved) is parked and
+    committed when that run ends.
+
+    The commit forks from the exact checkpoint it validated, and runs on the
+    thread cannot start between that check and the write. The fold is
+    dropped if the thread moved on meanwhile (its summary changed, a folded
+    message is gone, or a run was interrupted); the next turn schedules a
+    fresh one.
+
+    The graph is attached after it is compiled, since its chat node is what
+    calls `schedule`; `attach` returns the copy of the graph to run turns on.
+    """
+
+    def __init__(
+        self,
+        llm,
+        trigger: int = SUMMARY_TRIGGER_MESSAGES,
+        keep: int = SUMMARY_KEEP_MESSAGES,
+        max_workers: int = SUMMARY_WORKERS,
+        graph=None,
+        as_node: str = "chat_node",
+    ) -> None:
+        self.llm = llm
+        self.trigger = trigger
+        self.keep = keep
+        self.graph = graph
+        self.as_node = as_node
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summarizer")
+        self._lock = threading.Lock()
+        self._running: Dict[str, Future] = {}
+        # Graph runs in flight per thread, and folds waiting for them to end.
+        self._active_runs: Dict[str, int] = {}
+        self._parked: Dict[str, Tuple[str, str, List[str]]] = {}
+        # Held from a commit's check to its write; a run starting waits on it.
+        self._commit_lock = threading.Lock()
+        self.scheduled = 0
+        self.committed = 0
+        self.discarded = 0
+        self.failed = 0
+
+    def attach(self, graph, as_node: Optional[str] = None):
+        """
+        Commit folds to `graph` (a compiled graph with a checkpointer), as
+        written by `as_node`. Returns `graph` with the run hook bound; turns
+        must run on that copy for folds to be committed.
+        """
+        self.graph = graph
+        if as_node is not None:
+            self.as_node = as_node
+        return graph.with_config(callbacks=[_RunHook(self)])
+
+    def run_started(self, thread_id: str) -> None:
+        with self._commit_lock:  # let a commit in progress finish first
+            with self._lock:
+                self._active_runs[thread_id] = self._active_runs.get(thread_id, 0) + 1
+
+    def run_finished(self, thread_id: str) -> None:
+        with self._lock:
+            left = self._active_runs.get(thread_id, 0) - 1
+            if left > 0:
+                self._active_runs[thread_id] = left
+                return
+            self._active_runs.pop(thread_id, None)
+            fold = self._parked.pop(thread_id, None)
+            if fold is None:
+                return
+            self._running[thread_id] = self._executor.submit(self._commit_parked, thread_id, fold)
+
+    def schedule(self, thread_id: str, summary: str, messages: Sequence[BaseMessage]) -> Optional[Future]:
+        """Start a background fold if the thread is over the trigger and has none in flight."""
+        thread_id = str(thread_id)
+        if self.graph is None:
+            raise RuntimeError("BackgroundSummarizer has no graph; call attach() after compiling it.")
+        if len(messages) <= self.trigger or _fold_point(messages, self.keep) == 0:
+            return None
+        with self._lock:
+            if thread_id in self._running:
+                return None
+            future = self._executor.submit(self._fold, thread_id, summary, list(messages))
+            self._running[thread_id] = future
+            self.scheduled += 1
+        return future
+
+    def _fold(self, thread_id: str, summary: str, messages: List[BaseMessage]) -> None:
+        parked = False
+        try:
+            folded = messages[: _fold_point(messages, self.keep)]
+            with bypass_llm_cache():  # one-off prompts, never worth caching
+                response = self.llm.invoke(_prompt(summary, folded))
+            parked = self._commit(thread_id, summary, response.content, [m.id for m in folded]) is None
+        except Exception as error:
+            with self._lock:
+                self.failed += 1
+            logger.error("Background summary for thread %s failed: %s", thread_id, error)
+        finally:
+            if not parked:
+                with self._lock:
+                    self._running.pop(thread_id, None)
+
+    def _commit_parked(self, thread_id: str, fold: Tuple[str, str, List[str]]) -> None:
+        parked = False
+        try:
+            parked = self._commit(thread_id, *fold) is None
+        except Exception as error:
+            with self._lock:
+                self.failed += 1
+            logger.error("Background summary for thread %s failed: %s", thread_id, error)
+        finally:
+            if not parked:
+                with self._lock:
+                    self._running.pop(thread_id, None)
+
+    def _commit(self, thread_id: str, base_summary: str, summary: str, remove_ids: List[str]) -> Optional[bool]:
+        """
+        Write the fold as a checkpoint of its own, unless the thread has moved
+        past its base. Returns None when a run is in flight and the fold was
+        parked until it finishes.
+        """
+        with self._commit_lock:
+            with self._lock:
+                if self._active_runs.get(thread_id):
+                    self._parked[thread_id] = (base_summary, summary, remove_ids)
+                    return None
+            snapshot = self.graph.get_state({"configurable": {"thread_id": thread_id}})
+            present = {m.id for m in snapshot.values.get("messages", [])}
+            if (
+                snapshot.next
+                or snapshot.values.get("summary", "") != base_summary
+                or not present.issuperset(remove_ids)
+            ):
+                with self._lock:
+                    self.discarded += 1
+                return False
+            # snapshot.config pins the checkpoint validated above, so the fold
+            # is written on top of it rather than on whatever is latest by now.
+            self.graph.update_state(
+                snapshot.config,
+                {"summary": summary, "messages": [RemoveMessage(id=message_id) for message_id in remove_ids]},
+                as_node=self.as_node,
+            )
+        with self._lock:
+            self.committed += 1
+        return True
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """Block until the folds in flight have finished."""
+        with self._lock:
+            running = list(self._running.values())
+        wait(running, timeout)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "running": len(self._running),
+                "parked": len(self._parked),
+                "scheduled": self.scheduled,
+                "committed": self.committed,
+                "discarded": self.discarded,
+                "failed": self.failed,
+            }
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import os
+from typing import Any, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage
+
+# -------------------
+# 1. Settings
+# -------------------
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "30"))
+
+# (checkpoint_id, start): the page before `start` of that checkpoint's message
+# list. Pinning the checkpoint keeps pages stable while the thread keeps
+# growing; if compaction removed it, the latest checkpoint is used instead
+# (positions of older messages do not move in an append-only chat).
+Cursor = Tuple[str, int]
+
+
+def window_bounds(total: int, limit: int, before: Optional[Cursor]) -> Tuple[int, int]:
+    stop = total if before is None else min(before[1], total)
+    return max(0, stop - limit), stop
+
+
+def next_cursor(checkpoint_id: Optional[str], start: int) -> Optional[Cursor]:
+    return (checkpoint_id, start) if checkpoint_id and start > 0 else None
+
+
+def _config(thread_id: Any, before: Optional[Cursor]) -> dict:
+    configurable = {"thread_id": str(thread_id), "checkpoint_ns": ""}
+    if before is not None:
+        configurable["checkpoint_id"] = before[0]
+    return {"configurable": configurable}
+
+
+def _slice(t: Any, limit: int, before: Optional[Cursor]) -> Tuple[List[BaseMessage], Optional[Cursor]]:
+    if t is None:
+        return [], None
+    messages: Sequence[BaseMessage] = t.checkpoint.get("channel_values", {}).get("messages") or []
+    start, stop = window_bounds(len(messages), limit, before)
+    return list(messages[start:stop]), next_cursor(t.checkpoint["id"], start)
+
+
+# -------------------
+# 2. Loading
+# -------------------
+def message_window(
+    checkpointer: Any, thread_id: Any, limit: int = HISTORY_PAGE_SIZE, before: Optional[Cursor] = None
+) -> Tuple[List[BaseMessage], Optional[Cursor]]:
+    """
+    The last `limit` messages of a thread (or the page before `before`) and the
+    cursor for the page before that, None once the start is reached.
+
+    Savers that can read part of a conversation (DeltaSqliteSaver) do so;
+    others load the checkpoint, skipping get_state's task / pending-write
+    reconstruction.
+    """
+    if hasattr(checkpointer, "message_window"):
+        return checkpointer.message_window(str(thread_id), limit, before)
+    t = checkpointer.get_tuple(_config(thread_id, before))
+    if t is None and before is not None:
+        t = checkpointer.get_tuple(_config(thread_id, None))
+    return _slice(t, limit, before)
+
+
+async def amessage_window(
+    checkpointer: Any, thread_id: Any, limit: int = HISTORY_PAGE_SIZE, before: Optional[Cursor] = None
+) -> Tuple[List[BaseMessage], Optional[Cursor]]:
+    if hasattr(checkpointer, "amessage_window"):
+        return await checkpointer.amessage_window(str(thread_id), limit, before)
+    t = await checkpointer.aget_tuple(_config(thread_id, before))
+    if t is None and before is not None:
+        t = await checkpointer.aget_tuple(_config(thread_id, None))
+    return _slice(t, limit, before)
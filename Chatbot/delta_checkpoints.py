@@ -0,0 +1,437 @@
+from __future__ import annotations
+
+import os
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.checkpoint.sqlite.utils import load_pending_writes, pending_writes_sql
+
+from checkpoint_compression import CompressedSerializer
+from conversation_window import Cursor, next_cursor, window_bounds
+from lru_cache import LRUCache
+from state_cache import LATEST_ID_SQL, LatestStateCache, is_latest_root
+
+# -------------------
+# 1. Settings
+# -------------------
+# With deltas on, a checkpoint stores only the messages added / changed since
+# its parent; every DELTA_SNAPSHOT_EVERY-th write stores the full list so a
+# read never replays more than that many steps. Rows written this way can only
+# be read back by the savers in this module (and their subclasses).
+CHECKPOINT_MESSAGE_DELTAS = os.getenv("CHECKPOINT_MESSAGE_DELTAS", "0") == "1"
+DELTA_SNAPSHOT_EVERY = int(os.getenv("DELTA_SNAPSHOT_EVERY", "25"))
+DELTA_CACHE_SIZE = int(os.getenv("DELTA_CACHE_SIZE", "512"))
+
+MESSAGES_CHANNEL = "messages"
+DELTA_MARKER = "__messages_delta__"
+# Metadata key naming the checkpoint a delta applies to; checkpoint_compactor
+# reads it so it never prunes a base that a kept checkpoint still needs.
+BASE_KEY = "messages_base"
+
+ROW_SQL = (
+    "SELECT type, checkpoint FROM checkpoints "
+    "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?"
+)
+LATEST_ROW_SQL = (
+    "SELECT checkpoint_id, type, checkpoint FROM checkpoints "
+    "WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1"
+)
+
+
+# -------------------
+# 2. Encoding
+# -------------------
+def _same(a: BaseMessage, b: BaseMessage) -> bool:
+    return a is b or a == b
+
+
+def encode_messages(base_id: str, parent: Sequence[BaseMessage], messages: Sequence[BaseMessage]) -> Optional[dict]:
+    """
+    Delta of `messages` against the parent checkpoint's list, or None when a
+    full snapshot is the better encoding.
+
+    The common case (add_messages appended a reply) stores only the tail;
+    removals and in-place updates store the id order plus changed messages.
+    """
+    n = len(parent)
+    if len(messages) >= n and all(_same(a, b) for a, b in zip(parent, messages)):
+        return {DELTA_MARKER: 1, "base": base_id, "keep": n, "append": list(messages[n:])}
+    if any(m.id is None for m in messages):
+        return None
+    by_id = {m.id: m for m in parent}
+    upsert = [m for m in messages if m.id not in by_id or not _same(by_id[m.id], m)]
+    if len(upsert) * 2 > len(messages):
+        return None
+    return {DELTA_MARKER: 1, "base": base_id, "ids": [m.id for m in messages], "upsert": upsert}
+
+
+def is_delta(value: Any) -> bool:
+    return isinstance(value, dict) and DELTA_MARKER in value
+
+
+def apply_delta(base: Sequence[BaseMessage], delta: dict) -> List[BaseMessage]:
+    if "keep" in delta:
+        return [*base[: delta["keep"]], *delta["append"]]
+    by_id = {m.id: m for m in base}
+    by_id.update((m.id, m) for m in delta["upsert"])
+    return [by_id[message_id] for message_id in delta["ids"]]
+
+
+def message_count(value: Any) -> int:
+    """Length of the list a stored `messages` value (snapshot or delta) decodes to."""
+    if not is_delta(value):
+        return len(value or [])
+    if "keep" in value:
+        return value["keep"] + len(value["append"])
+    return len(value["ids"])
+
+
+def _needs_replay(value: Any) -> bool:
+    """ids/upsert deltas can only be sliced after rebuilding the whole list."""
+    return is_delta(value) and "keep" not in value
+
+
+def _slice_step(
+    value: Any, cached: Optional[tuple], start: int, stop: int, segments: List[list]
+) -> Optional[int]:
+    """
+    One step of reading messages[start:stop] from a stored value: appends what
+    this row (or its cached list) supplies to `segments` and returns the new
+    `stop` when the rest lives in the delta's base, None when done.
+    """
+    if cached is not None:
+        segments.append(list(cached[0][start:stop]))
+        return None
+    if not is_delta(value):
+        segments.append(list((value or [])[start:stop]))
+        return None
+    keep = value["keep"]
+    if stop > keep:
+        segments.append(value["append"][max(start, keep) - keep : stop - keep])
+        stop = keep
+    return stop if start < stop else None
+
+
+def _joined(segments: List[list]) -> List[BaseMessage]:
+    return [m for segment in reversed(segments) for m in segment]
+
+
+class _DeltaState:
+    """Per-saver cache of recently written / rebuilt message lists."""
+
+    def __init__(self) -> None:
+        # (thread_id, ns, checkpoint_id) -> (messages tuple, deltas since snapshot)
+        self.cache = LRUCache(DELTA_CACHE_SIZE)
+
+    def encode(
+        self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata
+    ) -> Tuple[Checkpoint, CheckpointMetadata, Optional[tuple]]:
+        messages = checkpoint.get("channel_values", {}).get(MESSAGES_CHANNEL)
+        if not isinstance(messages, list):
+            return checkpoint, metadata, None
+        configurable = config["configurable"]
+        thread_id, ns = str(configurable["thread_id"]), configurable.get("checkpoint_ns", "")
+        parent_id = configurable.get("checkpoint_id")
+        entry_key = (thread_id, ns, checkpoint["id"])
+
+        parent = self.cache.get((thread_id, ns, parent_id)) if parent_id else None
+        delta = None
+        if parent is not None and parent[1] + 1 < DELTA_SNAPSHOT_EVERY:
+            delta = encode_messages(parent_id, parent[0], messages)
+        if delta is None:
+            return checkpoint, metadata, (entry_key, (tuple(messages), 0))
+
+        channel_values = {**checkpoint["channel_values"], MESSAGES_CHANNEL: delta}
+        return (
+            {**checkpoint, "channel_values": channel_values},
+            {**(metadata or {}), BASE_KEY: parent_id},
+            (entry_key, (tuple(messages), parent[1] + 1)),
+        )
+
+    def remember(self, entry: Optional[tuple]) -> None:
+        if entry is not None:
+            self.cache.put(*entry)
+
+    def finish(self, t: CheckpointTuple, messages: Optional[List[BaseMessage]]) -> CheckpointTuple:
+        metadata = {k: v for k, v in (t.metadata or {}).items() if k != BASE_KEY}
+        if messages is None:
+            return t._replace(metadata=metadata)
+        checkpoint = {
+            **t.checkpoint,
+            "channel_values": {**t.checkpoint["channel_values"], MESSAGES_CHANNEL: messages},
+        }
+        return t._replace(checkpoint=checkpoint, metadata=metadata)
+
+
+def _tuple_key(t: CheckpointTuple) -> Tuple[str, str, str]:
+    configurable = t.config["configurable"]
+    return (
+        str(configurable["thread_id"]),
+        configurable.get("checkpoint_ns", ""),
+        configurable["checkpoint_id"],
+    )
+
+
+# -------------------
+# 3. Sync saver
+# -------------------
+class DeltaSqliteSaver(SqliteSaver):
+    """SqliteSaver that stores `messages` as deltas between periodic snapshots."""
+
+    message_deltas = CHECKPOINT_MESSAGE_DELTAS
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._deltas = _DeltaState()
+        self.latest_cache = LatestStateCache()
+        if not isinstance(self.serde, CompressedSerializer):
+            self.serde = CompressedSerializer(self.serde)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        entry = None
+        stored, stored_metadata = checkpoint, metadata
+        if self.message_deltas:
+            stored, stored_metadata, entry = self._deltas.encode(config, checkpoint, metadata)
+        saved = super().put(config, stored, stored_metadata, new_versions)
+        # Only a committed checkpoint may serve as the base of the next delta.
+        self._after_commit(lambda: self._deltas.remember(entry))
+        self.latest_cache.record_put(config, checkpoint, metadata, saved)
+        return saved
+
+    def _after_commit(self, callback: Callable[[], None]) -> None:
+        """Run `callback` once the write just made is committed; SqliteSaver commits before returning."""
+        callback()
+
+    def _messages(self, key: Tuple[str, str, str], value: Any) -> List[BaseMessage]:
+        """Replay `value` (a delta) back to the nearest snapshot or cached list."""
+        chain = []
+        base_depth = 0
+        while is_delta(value):
+            chain.append((key, value))
+            key = (key[0], key[1], value["base"])
+            cached = self._deltas.cache.get(key)
+            if cached is not None:
+                value, base_depth = list(cached[0]), cached[1]
+                break
+            value = self._stored_messages(key)
+        messages = value
+        for depth, (chain_key, delta) in enumerate(reversed(chain), start=base_depth + 1):
+            messages = apply_delta(messages, delta)
+            self._deltas.cache.put(chain_key, (tuple(messages), depth))
+        return list(messages)
+
+    def _stored_messages(self, key: Tuple[str, str, str]) -> Any:
+        with self.cursor(transaction=False) as cur:
+            row = cur.execute(ROW_SQL, key).fetchone()
+        if row is None:
+            raise LookupError(f"Delta base checkpoint {key} is missing.")
+        return self.serde.loads_typed((row[0], row[1]))["channel_values"][MESSAGES_CHANNEL]
+
+    def message_window(
+        self, thread_id: str, limit: int, before: Optional[Cursor] = None
+    ) -> Tuple[List[BaseMessage], Optional[Cursor]]:
+        """
+        A page of the thread's messages (see conversation_window), reading only
+        the rows that hold it: for an append-only chat, the newest page comes
+        from the last delta or two instead of the snapshot plus every delta.
+        """
+        row = None
+        with self.cursor(transaction=False) as cur:
+            if before is not None:
+                row = cur.execute(ROW_SQL, (thread_id, "", before[0])).fetchone()
+                row = (before[0], *row) if row is not None else None
+            if row is None:
+                row = cur.execute(LATEST_ROW_SQL, (thread_id, "")).fetchone()
+        if row is None:
+            return [], None
+        checkpoint_id = row[0]
+        key = (thread_id, "", checkpoint_id)
+        value = self.serde.loads_typed((row[1], row[2]))["channel_values"].get(MESSAGES_CHANNEL)
+        start, stop = window_bounds(message_count(value), limit, before)
+        segments: List[list] = []
+        remaining: Optional[int] = stop
+        while remaining is not None:
+            cached = self._deltas.cache.get(key)
+            if cached is None and _needs_replay(value):
+                cached = (self._messages(key, value), 0)
+            remaining = _slice_step(value, cached, start, remaining, segments)
+            if remaining is not None:
+                key = (key[0], key[1], value["base"])
+                value = self._stored_messages(key)
+        return _joined(segments), next_cursor(checkpoint_id, start)
+
+    def _decode(self, t: CheckpointTuple) -> CheckpointTuple:
+        value = t.checkpoint.get("channel_values", {}).get(MESSAGES_CHANNEL)
+        if not is_delta(value):
+            return self._deltas.finish(t, None)
+        return self._deltas.finish(t, self._messages(_tuple_key(t), value))
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        if not (self.latest_cache.enabled and is_latest_root(config)):
+            t = super().get_tuple(config)
+            return self._decode(t) if t is not None else None
+        thread_id = str(config["configurable"]["thread_id"])
+        with self.cursor(transaction=False) as cur:
+            row = cur.execute(LATEST_ID_SQL, (thread_id,)).fetchone()
+            if row is None:
+                return None
+            cached = self.latest_cache.get(thread_id, row[0])
+            if cached is not None:
+                cur.execute(pending_writes_sql(self._has_task_path), (thread_id, "", row[0]))
+                return cached._replace(pending_writes=load_pending_writes(cur, self.serde))
+        t = super().get_tuple(config)
+        if t is None:
+            return None
+        t = self._decode(t)
+        self.latest_cache.put(t)
+        return t
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        self.latest_cache.discard(thread_id)
+
+    def list(self, config: Optional[RunnableConfig], **kwargs: Any) -> Iterator[CheckpointTuple]:
+        # Materialized first: SqliteSaver holds its connection lock while the
+        # listing generator is suspended, and replay needs to query.
+        for t in list(super().list(config, **kwargs)):
+            yield self._decode(t)
+
+
+# -------------------
+# 4. Async saver
+# -------------------
+class AsyncDeltaSqliteSaver(AsyncSqliteSaver):
+    """AsyncSqliteSaver counterpart of DeltaSqliteSaver."""
+
+    message_deltas = CHECKPOINT_MESSAGE_DELTAS
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._deltas = _DeltaState()
+        self.latest_cache = LatestStateCache()
+        if not isinstance(self.serde, CompressedSerializer):
+            self.serde = CompressedSerializer(self.serde)
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        entry = None
+        stored, stored_metadata = checkpoint, metadata
+        if self.message_deltas:
+            stored, stored_metadata, entry = self._deltas.encode(config, checkpoint, metadata)
+        saved = await super().aput(config, stored, stored_metadata, new_versions)
+        self._deltas.remember(entry)
+        self.latest_cache.record_put(config, checkpoint, metadata, saved)
+        return saved
+
+    async def _amessages(self, key: Tuple[str, str, str], value: Any) -> List[BaseMessage]:
+        chain = []
+        base_depth = 0
+        while is_delta(value):
+            chain.append((key, value))
+            key = (key[0], key[1], value["base"])
+            cached = self._deltas.cache.get(key)
+            if cached is not None:
+                value, base_depth = list(cached[0]), cached[1]
+                break
+            value = await self._astored_messages(key)
+        messages = value
+        for depth, (chain_key, delta) in enumerate(reversed(chain), start=base_depth + 1):
+            messages = apply_delta(messages, delta)
+            self._deltas.cache.put(chain_key, (tuple(messages), depth))
+        return list(messages)
+
+    async def _astored_messages(self, key: Tuple[str, str, str]) -> Any:
+        async with self.lock, self.conn.execute(ROW_SQL, key) as cur:
+            row = await cur.fetchone()
+        if row is None:
+            raise LookupError(f"Delta base checkpoint {key} is missing.")
+        return self.serde.loads_typed((row[0], row[1]))["channel_values"][MESSAGES_CHANNEL]
+
+    async def amessage_window(
+        self, thread_id: str, limit: int, before: Optional[Cursor] = None
+    ) -> Tuple[List[BaseMessage], Optional[Cursor]]:
+        await self.setup()
+        row = None
+        async with self.lock:
+            if before is not None:
+                async with self.conn.execute(ROW_SQL, (thread_id, "", before[0])) as cur:
+                    row = await cur.fetchone()
+                row = (before[0], *row) if row is not None else None
+            if row is None:
+                async with self.conn.execute(LATEST_ROW_SQL, (thread_id, "")) as cur:
+                    row = await cur.fetchone()
+        if row is None:
+            return [], None
+        checkpoint_id = row[0]
+        key = (thread_id, "", checkpoint_id)
+        value = self.serde.loads_typed((row[1], row[2]))["channel_values"].get(MESSAGES_CHANNEL)
+        start, stop = window_bounds(message_count(value), limit, before)
+        segments: List[list] = []
+        remaining: Optional[int] = stop
+        while remaining is not None:
+            cached = self._deltas.cache.get(key)
+            if cached is None and _needs_replay(value):
+                cached = (await self._amessages(key, value), 0)
+            remaining = _slice_step(value, cached, start, remaining, segments)
+            if remaining is not None:
+                key = (key[0], key[1], value["base"])
+                value = await self._astored_messages(key)
+        return _joined(segments), next_cursor(checkpoint_id, start)
+
+    async def _adecode(self, t: CheckpointTuple) -> CheckpointTuple:
+        value = t.checkpoint.get("channel_values", {}).get(MESSAGES_CHANNEL)
+        if not is_delta(value):
+            return self._deltas.finish(t, None)
+        return self._deltas.finish(t, await self._amessages(_tuple_key(t), value))
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        if not (self.latest_cache.enabled and is_latest_root(config)):
+            t = await super().aget_tuple(config)
+            return await self._adecode(t) if t is not None else None
+        await self.setup()
+        thread_id = str(config["configurable"]["thread_id"])
+        async with self.lock, self.conn.cursor() as cur:
+            await cur.execute(LATEST_ID_SQL, (thread_id,))
+            row = await cur.fetchone()
+            if row is None:
+                return None
+            cached = self.latest_cache.get(thread_id, row[0])
+            if cached is not None:
+                await cur.execute(pending_writes_sql(self._has_task_path), (thread_id, "", row[0]))
+                return cached._replace(pending_writes=load_pending_writes(await cur.fetchall(), self.serde))
+        t = await super().aget_tuple(config)
+        if t is None:
+            return None
+        t = await self._adecode(t)
+        self.latest_cache.put(t)
+        return t
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await super().adelete_thread(thread_id)
+        self.latest_cache.discard(thread_id)
+
+    async def alist(self, config: Optional[RunnableConfig], **kwargs: Any) -> AsyncIterator[CheckpointTuple]:
+        # Materialized first: AsyncSqliteSaver holds its lock across the listing.
+        tuples = [t async for t in super().alist(config, **kwargs)]
+        for t in tuples:
+            yield await self._adecode(t)
@@ -2,7 +2,7 @@ import streamlit as st
 import time
 import uuid
 from langchain_core.messages import HumanMessage
-from backend import chatbot, retrieve_all_threads, generate_title, flush_user_history
+from backend import chatbot, retrieve_all_threads, generate_title, flush_user_history, load_messages
 
 # **************************************** Page Config *************************
 
@@ -132,14 +132,22 @@ def generate_thread_id():
 def reset_chat():
     st.session_state['thread_id'] = generate_thread_id()
     st.session_state['message_history'] = []
+    st.session_state['history_cursor'] = None
 
-def load_conversation(thread_id):
-    state = chatbot.get_state(config={'configurable': {'thread_id': thread_id}})
-    return state.values.get('messages', [])
+def load_conversation(thread_id, before=None):
+    """One page of a thread as chat history, plus the cursor for the page before it."""
+    messages, cursor = load_messages(thread_id, before=before)
+    return [{
+        'role': 'user' if isinstance(m, HumanMessage) else 'assistant',
+        'content': m.content
+    } for m in messages], cursor
 
 if 'message_history' not in st.session_state:
     st.session_state['message_history'] = []
 
+if 'history_cursor' not in st.session_state:
+    st.session_state['history_cursor'] = None
+
 if 'thread_id' not in st.session_state:
     st.session_state['thread_id'] = generate_thread_id()
 
@@ -159,10 +167,9 @@ with st.sidebar:
         clean_title = thread['title'][:25] + "..." if len(thread['title']) > 25 else thread['title']
         if st.button(clean_title, key=thread['id'], use_container_width=True):
             st.session_state['thread_id'] = thread['id']
-            st.session_state['message_history'] = [{
-                'role': 'user' if isinstance(m, HumanMessage) else 'assistant',
-                'content': m.content
-            } for m in load_conversation(thread['id'])]
+            history, cursor = load_conversation(thread['id'])
+            st.session_state['message_history'] = history
+            st.session_state['history_cursor'] = cursor
             st.rerun()
 
     st.markdown("---")
@@ -170,6 +177,7 @@ with st.sidebar:
         flush_user_history(st.session_state['user_id'])
         st.session_state['chat_threads'] = []
         st.session_state['message_history'] = []
+        st.session_state['history_cursor'] = None
         st.rerun()
 
 # **************************************** MAIN *************************
@@ -183,6 +191,12 @@ if not st.session_state['message_history']:
         </div>
     """, unsafe_allow_html=True)
 
+if st.session_state['history_cursor'] is not None and st.button("Load earlier messages"):
+    earlier, cursor = load_conversation(st.session_state['thread_id'], before=st.session_state['history_cursor'])
+    st.session_state['message_history'] = earlier + st.session_state['message_history']
+    st.session_state['history_cursor'] = cursor
+    st.rerun()
+
 for message in st.session_state['message_history']:
     role = message['role']
     avatar = "⚫" if role == 'assistant' else None
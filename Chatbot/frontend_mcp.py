@@ -2,7 +2,7 @@ import queue
 import uuid
 
 import streamlit as st
-from chatbot_mcp import chatbot, retrieve_all_threads
+from chatbot_mcp import chatbot, load_messages, retrieve_all_threads
 from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 
 # =========================== Utilities ===========================
@@ -15,6 +15,7 @@ def reset_chat():
     st.session_state["thread_id"] = thread_id
     add_thread(thread_id)
     st.session_state["message_history"] = []
+    st.session_state["history_cursor"] = None
 
 
 def add_thread(thread_id):
@@ -22,16 +23,23 @@ def add_thread(thread_id):
         st.session_state["chat_threads"].append(thread_id)
 
 
-def load_conversation(thread_id):
-    state = chatbot.get_state(config={"configurable": {"thread_id": thread_id}})
-    # Check if messages key exists in state values, return empty list if not
-    return state.values.get("messages", [])
+def load_conversation(thread_id, before=None):
+    """One page of a thread as chat history, plus the cursor for the page before it."""
+    messages, cursor = load_messages(thread_id, before=before)
+    history = []
+    for msg in messages:
+        role = "user" if isinstance(msg, HumanMessage) else "assistant"
+        history.append({"role": role, "content": msg.content})
+    return history, cursor
 
 
 # ======================= Session Initialization ===================
 if "message_history" not in st.session_state:
     st.session_state["message_history"] = []
 
+if "history_cursor" not in st.session_state:
+    st.session_state["history_cursor"] = None
+
 if "thread_id" not in st.session_state:
     st.session_state["thread_id"] = generate_thread_id()
 
@@ -50,16 +58,20 @@ st.sidebar.header("My Conversations")
 for thread_id in st.session_state["chat_threads"][::-1]:
     if st.sidebar.button(str(thread_id)):
         st.session_state["thread_id"] = thread_id
-        messages = load_conversation(thread_id)
-
-        temp_messages = []
-        for msg in messages:
-            role = "user" if isinstance(msg, HumanMessage) else "assistant"
-            temp_messages.append({"role": role, "content": msg.content})
-        st.session_state["message_history"] = temp_messages
+        history, cursor = load_conversation(thread_id)
+        st.session_state["message_history"] = history
+        st.session_state["history_cursor"] = cursor
 
 # ============================ Main UI ============================
 
+if st.session_state["history_cursor"] is not None and st.button("Load earlier messages"):
+    earlier, cursor = load_conversation(
+        st.session_state["thread_id"], before=st.session_state["history_cursor"]
+    )
+    st.session_state["message_history"] = earlier + st.session_state["message_history"]
+    st.session_state["history_cursor"] = cursor
+    st.rerun()
+
 # Render history
 for message in st.session_state["message_history"]:
     with st.chat_message(message["role"]):
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import os
+from typing import Dict, Hashable, List, Optional, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+from lru_cache import LRUCache
+
+# -------------------
+# 1. Settings
+# -------------------
+# Tokens of conversation history (system prompt included) sent per LLM call.
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "8000"))
+# Per-model overrides, e.g. "gemini-2.0-flash=12000,gemini-2.5-flash=24000".
+HISTORY_TOKEN_BUDGETS = os.getenv("HISTORY_TOKEN_BUDGETS", "")
+TOKEN_COUNT_CACHE_SIZE = int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "50000"))
+
+
+def _parse_budgets(spec: str) -> Dict[str, int]:
+    budgets = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, value = item.partition("=")
+        budgets[model.strip()] = int(value)
+    return budgets
+
+
+MODEL_TOKEN_BUDGETS = _parse_budgets(HISTORY_TOKEN_BUDGETS)
+
+
+def budget_for(model: str) -> int:
+    return MODEL_TOKEN_BUDGETS.get(model, HISTORY_TOKEN_BUDGET)
+
+
+# -------------------
+# 2. Token counts
+# -------------------
+class TokenCounter:
+    """count_tokens_approximately per message, cached by message id."""
+
+    def __init__(self, maxsize: int = TOKEN_COUNT_CACHE_SIZE) -> None:
+        self.cache = LRUCache(maxsize)
+
+    @staticmethod
+    def _key(message: BaseMessage) -> Optional[Hashable]:
+        if message.id is None:
+            return None
+        # add_messages replaces a message in place by id; the length catches edits.
+        return message.id, message.type, len(message.content)
+
+    def count(self, message: BaseMessage) -> int:
+        key = self._key(message)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        tokens = count_tokens_approximately([message])
+        if key is not None:
+            self.cache.put(key, tokens)
+        return tokens
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+
+token_counter = TokenCounter()
+
+
+# -------------------
+# 3. Assembly
+# -------------------
+def _unit_start(messages: Sequence[BaseMessage], end: int) -> Optional[int]:
+    """
+    Index where the unit ending at `end` starts: the message itself, or for
+    tool results the AIMessage that requested them. None for tool results
+    whose request is gone (providers reject those).
+    """
+    start = end
+    while start >= 0 and isinstance(messages[start], ToolMessage):
+        start -= 1
+    if start == end:
+        return end
+    if start >= 0 and isinstance(messages[start], AIMessage) and messages[start].tool_calls:
+        return start
+    return None
+
+
+class HistoryBudget:
+    """Newest messages that fit a model's token budget, walking back only as far as needed."""
+
+    def __init__(self, model: str, budget: Optional[int] = None, counter: TokenCounter = token_counter) -> None:
+        self.model = model
+        self.budget = budget if budget is not None else budget_for(model)
+        self.counter = counter
+
+    def fit(self, messages: Sequence[BaseMessage], system: Sequence[BaseMessage] = ()) -> List[BaseMessage]:
+        """
+        `system` + the longest suffix of `messages` within the budget.
+
+        A tool call and its results are kept or dropped together, and the
+        window always reaches back to a user message (even past the budget)
+        so the provider sees a valid turn order.
+        """
+        remaining = self.budget - sum(self.counter.count(m) for m in system)
+        units: List[Sequence[BaseMessage]] = []
+        end = len(messages) - 1
+        while end >= 0:
+            start = _unit_start(messages, end)
+            if start is None:  # orphaned tool results
+                end -= 1
+                while end >= 0 and isinstance(messages[end], ToolMessage):
+                    end -= 1
+                continue
+            unit = messages[start : end + 1]
+            cost = sum(self.counter.count(m) for m in unit)
+            # Over budget: stop, but never before the window reaches a user turn.
+            if units and cost > remaining and isinstance(units[-1][0], HumanMessage):
+                break
+            units.append(unit)
+            remaining -= cost
+            end = start - 1
+
+        units.reverse()
+        while len(units) > 1 and not isinstance(units[0][0], HumanMessage):
+            units.pop(0)
+        return [*system, *(m for unit in units for m in unit)]
@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+import rag_pdf
+
+# -------------------
+# 1. Settings
+# -------------------
+INGEST_PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+INGEST_MAX_CONCURRENT_JOBS = int(os.getenv("INGEST_MAX_CONCURRENT_JOBS", "4"))
+INGEST_PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "16"))
+INGEST_JOB_RETENTION_SECONDS = 3600
+
+
+class IngestionCancelled(Exception):
+    """Raised inside a job's progress hook to stop an ingestion that was cancelled."""
+
+
+# -------------------
+# 2. Job record
+# -------------------
+@dataclass
+class IngestJob:
+    job_id: str
+    thread_id: str
+    filename: Optional[str]
+    state: str = "queued"  # queued | running | done | failed | cancelled
+    pages_done: int = 0
+    total_pages: int = 0
+    summary: Optional[dict] = None
+    error: Optional[str] = None
+    finished_at: Optional[float] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+
+    def snapshot(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "thread_id": self.thread_id,
+            "filename": self.filename,
+            "state": self.state,
+            "pages_done": self.pages_done,
+            "total_pages": self.total_pages,
+            "summary": self.summary,
+            "error": self.error,
+        }
+
+
+# -------------------
+# 3. Parallel parsing
+# -------------------
+def parallel_page_chunks(
+    pool: ProcessPoolExecutor,
+    file_bytes: bytes,
+    source: str,
+    doc_id: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    pages_per_task: int = INGEST_PAGES_PER_TASK,
+    window: int = INGEST_PARSE_WORKERS * 2,
+) -> Iterator[Tuple[int, List[Document]]]:
+    """
+    Parse page ranges in worker processes and yield (total_pages, page chunks)
+    in page order. At most `window` ranges are in flight, so parsed-but-not-yet
+    embedded text stays bounded.
+    """
+    total_pages = pool.submit(rag_pdf.count_pages, file_bytes).result()
+    ranges = deque(
+        (start, min(start + pages_per_task, total_pages))
+        for start in range(0, total_pages, pages_per_task)
+    )
+    in_flight: deque[Future] = deque()
+
+    def fill() -> None:
+        while ranges and len(in_flight) < max(1, window):
+            start, stop = ranges.popleft()
+            in_flight.append(
+                pool.submit(
+                    rag_pdf.parse_page_range,
+                    file_bytes, source, doc_id, start, stop, chunk_size, chunk_overlap,
+                )
+            )
+
+    try:
+        fill()
+        while in_flight:
+            pages = in_flight.popleft().result()
+            fill()
+            for chunks in pages:
+                yield total_pages, chunks
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+# -------------------
+# 4. Job manager
+# -------------------
+class IngestionJobs:
+    """
+    Submit / poll / cancel API for PDF ingestion off the Streamlit script run.
+
+    Parsing and splitting (CPU-bound, GIL-holding) run in a process pool shared
+    by all jobs; each job's embedding stage runs on a background job thread, so
+    a large upload never blocks another session's chat.
+
+    A job cancelled after its last page was indexed still ends "cancelled":
+    `remove_document(thread_id, doc_id)` takes the document back out.
+    """
+
+    def __init__(
+        self,
+        ingest: Callable[..., dict],
+        settings: Callable[[], Tuple[int, int]],
+        document_id: Callable[[bytes], str],
+        remove_document: Callable[[str, str], bool],
+        parse_workers: int = INGEST_PARSE_WORKERS,
+        max_concurrent_jobs: int = INGEST_MAX_CONCURRENT_JOBS,
+    ) -> None:
+        self._ingest = ingest
+        self._settings = settings
+        self._document_id = document_id
+        self._remove_document = remove_document
+        self._parse_workers = parse_workers
+        self._parse_pool: Optional[ProcessPoolExecutor] = None
+        self._job_pool = ThreadPoolExecutor(
+            max_workers=max_concurrent_jobs, thread_name_prefix="ingest-job"
+        )
+        self._jobs: Dict[str, IngestJob] = {}
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._parse_pool is None:
+                # "spawn" keeps workers clear of the parent's threads and sockets.
+                self._parse_pool = ProcessPoolExecutor(
+                    max_workers=self._parse_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._parse_pool
+
+    def submit(self, file_bytes: bytes, thread_id: str, filename: Optional[str] = None) -> str:
+        if not file_bytes:
+            raise ValueError("No bytes received for ingestion.")
+        job = IngestJob(job_id=uuid.uuid4().hex, thread_id=str(thread_id), filename=filename)
+        with self._lock:
+            self._prune()
+            self._jobs[job.job_id] = job
+        self._job_pool.submit(self._run, job, file_bytes)
+        return job.job_id
+
+    def status(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.snapshot() if job else None
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state in ("done", "failed", "cancelled"):
+                return False
+            job.cancel_event.set()
+            if job.state == "queued":
+                self._finish(job, "cancelled")
+            return True
+
+    def jobs_for_thread(self, thread_id: str) -> List[dict]:
+        with self._lock:
+            return [
+                job.snapshot() for job in self._jobs.values() if job.thread_id == str(thread_id)
+            ]
+
+    def shutdown(self) -> None:
+        with self._lock:
+            job_ids = list(self._jobs)
+        for job_id in job_ids:
+            self.cancel(job_id)
+        self._job_pool.shutdown(wait=True)
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown(wait=True, cancel_futures=True)
+
+    def _run(self, job: IngestJob, file_bytes: bytes) -> None:
+        with self._lock:
+            if job.state != "queued":
+                return
+            job.state = "running"
+
+        def on_progress(pages_done: int, total_pages: int) -> None:
+            job.pages_done, job.total_pages = pages_done, total_pages
+            if job.cancel_event.is_set():
+                raise IngestionCancelled(job.job_id)
+
+        chunk_size, chunk_overlap = self._settings()
+        source = job.filename or "uploaded.pdf"
+        try:
+            summary = self._ingest(
+                file_bytes,
+                job.thread_id,
+                job.filename,
+                on_progress=on_progress,
+                page_chunks=parallel_page_chunks(
+                    self._pool(),
+                    file_bytes,
+                    source,
+                    self._document_id(file_bytes),
+                    chunk_size,
+                    chunk_overlap,
+                    window=self._parse_workers * 2,
+                ),
+            )
+        except IngestionCancelled:
+            with self._lock:
+                self._finish(job, "cancelled")
+        except Exception as exc:
+            with self._lock:
+                job.error = str(exc)
+                self._finish(job, "failed")
+        else:
+            # Checked under the lock so cancel() either sees "done" and returns
+            # False, or sets the event before this check.
+            with self._lock:
+                cancelled = job.cancel_event.is_set()
+                if not cancelled:
+                    job.summary = summary
+                    self._finish(job, "done")
+            if cancelled:
+                self._roll_back(job, summary)
+
+    def _roll_back(self, job: IngestJob, summary: dict) -> None:
+        """Detach a document whose job was cancelled after its last page."""
+        try:
+            self._remove_document(job.thread_id, summary["doc_id"])
+        except Exception as exc:
+            with self._lock:
+                job.error = f"cancelled, but the document could not be removed: {exc}"
+                self._finish(job, "failed")
+        else:
+            with self._lock:
+                self._finish(job, "cancelled")
+
+    def _finish(self, job: IngestJob, state: str) -> None:
+        job.state = state
+        job.finished_at = time.time()
+
+    def _prune(self) -> None:
+        cutoff = time.time() - INGEST_JOB_RETENTION_SECONDS
+        for job_id in [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]:
+            del self._jobs[job_id]
@@ -0,0 +1,377 @@
+"""
+Response cache for the chat models, plugged in through LangChain's `cache=`:
+
+    llm = chat_model(LLM_MODEL, cache=create_llm_cache())  # llm_gateway
+
+Two tiers, both keyed on the model's llm_string (model name, parameters and
+bound tools) plus the messages:
+
+- exact: the same messages, byte for byte, ignoring message ids, response
+  metadata and tool call ids (which differ per thread and per run);
+- semantic: the same context except the last user message, which only has
+  to be close enough (cosine >= LLM_CACHE_SIMILARITY) to a cached one.
+  Only answers without tool calls are reused this way, since tool-call
+  arguments are specific to the question that produced them.
+
+Entries live in SQLite with a TTL and an LRU size cap, so they survive
+restarts and are shared by every worker using the same file. Notebooks can
+turn it on globally with `set_llm_cache(create_llm_cache("exact"))`.
+"""
+from __future__ import annotations
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.caches import BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+from lru_cache import LRUCache
+from rag_query_cache import CachedQueryEmbeddings, normalize_query
+
+# -------------------
+# 1. Settings
+# -------------------
+LLM_CACHE = os.getenv("LLM_CACHE", "off")  # off | exact | semantic
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+# Cosine similarity a new question needs to reuse a cached answer.
+LLM_CACHE_SIMILARITY = float(os.getenv("LLM_CACHE_SIMILARITY", "0.95"))
+LLM_CACHE_EMBEDDING_MODEL = os.getenv("LLM_CACHE_EMBEDDING_MODEL", "gemini-embedding-001")
+# Expired and over-cap rows are pruned once per this many writes.
+PRUNE_EVERY = 64
+# Message fields that vary between threads asking the same thing; dropped
+# from the key (see _canonical).
+VOLATILE_FIELDS = ("id", "response_metadata", "usage_metadata")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    context TEXT NOT NULL,
+    vector BLOB,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS llm_cache_context ON llm_cache (context);
+CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used);
+"""
+
+
+# -------------------
+# 2. Per-node opt-out
+# -------------------
+_bypass: ContextVar[bool] = ContextVar("llm_cache_bypass", default=False)
+
+
+@contextmanager
+def bypass_llm_cache() -> Iterator[None]:
+    """LLM calls made inside the block neither read nor fill the cache."""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def uncached(node):
+    """Node decorator: the node's LLM calls skip the response cache."""
+    if inspect.iscoroutinefunction(node):
+
+        @functools.wraps(node)
+        async def async_wrapper(*args, **kwargs):
+            with bypass_llm_cache():
+                return await node(*args, **kwargs)
+
+        return async_wrapper
+
+    @functools.wraps(node)
+    def wrapper(*args, **kwargs):
+        with bypass_llm_cache():
+            return node(*args, **kwargs)
+
+    return wrapper
+
+
+# -------------------
+# 3. Keys
+# -------------------
+def _digest(*parts: str) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def _canonical(prompt: str) -> Optional[List[dict]]:
+    """
+    The serialized messages without what differs between otherwise identical
+    conversations: message ids, provider response / usage metadata, and the
+    random tool call ids (renumbered in order of appearance). None if the
+    prompt is not a serialized message list.
+    """
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return None
+    if not isinstance(messages, list):
+        return None
+    call_ids: Dict[str, str] = {}
+
+    def call_id(value: str) -> str:
+        return call_ids.setdefault(value, f"call_{len(call_ids)}")
+
+    for message in messages:
+        kwargs = message.get("kwargs", {}) if isinstance(message, dict) else {}
+        for field in VOLATILE_FIELDS:
+            kwargs.pop(field, None)
+        for tool_call in kwargs.get("tool_calls") or []:
+            if tool_call.get("id"):
+                tool_call["id"] = call_id(tool_call["id"])
+        if kwargs.get("tool_call_id"):
+            kwargs["tool_call_id"] = call_id(kwargs["tool_call_id"])
+    return messages
+
+
+def _prompt_keys(prompt: str) -> Tuple[str, str, Optional[str]]:
+    """
+    (exact key text, context key text, last user message) for a prompt as
+    serialized by BaseChatModel; the question is None unless the last message
+    is a plain text HumanMessage.
+    """
+    messages = _canonical(prompt)
+    if not messages:
+        return prompt, prompt, None
+    exact = json.dumps(messages, sort_keys=True)
+    last = messages[-1]
+    content = last.get("kwargs", {}).get("content")
+    if last.get("id", [""])[-1] != "HumanMessage" or not isinstance(content, str):
+        return exact, exact, None
+    return exact, json.dumps(messages[:-1], sort_keys=True), normalize_query(content)
+
+
+def _dump(generations: Sequence[Generation]) -> str:
+    return json.dumps(
+        [{"message": message_to_dict(g.message), "generation_info": g.generation_info} for g in generations]
+    )
+
+
+def _load(response: str) -> List[Generation]:
+    items = json.loads(response)
+    messages = messages_from_dict([item["message"] for item in items])
+    return [
+        ChatGeneration(message=message, generation_info=item["generation_info"])
+        for message, item in zip(messages, items)
+    ]
+
+
+def _unit(vector: Sequence[float]) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(v))
+    return v / norm if norm else v
+
+
+# -------------------
+# 4. Cache
+# -------------------
+class LLMResponseCache(BaseCache):
+    """Exact + semantic response cache persisted in SQLite."""
+
+    def __init__(
+        self,
+        path: str = LLM_CACHE_PATH,
+        embeddings: Any = None,
+        embedding_model: str = LLM_CACHE_EMBEDDING_MODEL,
+        similarity: float = LLM_CACHE_SIMILARITY,
+        ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(SCHEMA)
+            self.conn.commit()
+        # A miss embeds the question once for lookup and again for update; the
+        # LRU makes the second one free.
+        self.embeddings = (
+            CachedQueryEmbeddings(embeddings, embedding_model, LRUCache(1024)) if embeddings is not None else None
+        )
+        self.similarity = similarity
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # context -> (highest rowid loaded, keys, unit vectors); topped up from
+        # the table on each lookup so other workers' entries show up too.
+        self._vectors: Dict[str, Tuple[int, List[str], np.ndarray]] = {}
+        self._writes = 0
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    @property
+    def semantic(self) -> bool:
+        return self.embeddings is not None
+
+    # ---- storage ----
+    def _fetch(self, key: str) -> Optional[List[Generation]]:
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl_seconds:
+                self.evictions += self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,)).rowcount
+                self.conn.commit()
+                return None
+            self.conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+        return _load(row[0])
+
+    def _nearest(self, context_key: str, question: str) -> Optional[str]:
+        with self.lock:
+            last_rowid, keys, matrix = self._vectors.get(context_key, (0, [], np.empty((0, 0), np.float32)))
+            rows = self.conn.execute(
+                "SELECT rowid, key, vector FROM llm_cache "
+                "WHERE context = ? AND rowid > ? AND vector IS NOT NULL ORDER BY rowid",
+                (context_key, last_rowid),
+            ).fetchall()
+            if rows:
+                fresh = np.stack([np.frombuffer(blob, dtype=np.float32) for _, _, blob in rows])
+                matrix = fresh if not keys else np.vstack([matrix, fresh])
+                keys = keys + [key for _, key, _ in rows]
+                self._vectors[context_key] = (rows[-1][0], keys, matrix)
+        if not keys:
+            return None
+        scores = matrix @ _unit(self.embeddings.embed_query(question))
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.similarity else None
+
+    def _prune(self) -> None:
+        with self.lock:
+            expired = self.conn.execute(
+                "DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            ).rowcount
+            over_cap = self.conn.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            self.conn.commit()
+            self.evictions += expired + over_cap
+            if expired or over_cap:
+                # Rebuilt from the table on the next semantic lookup.
+                self._vectors.clear()
+
+    # ---- BaseCache ----
+    def lookup(self, prompt: str, llm_string: str) -> Optional[List[Generation]]:
+        if _bypass.get():
+            with self.lock:
+                self.bypassed += 1
+            return None
+
+        exact, context, question = _prompt_keys(prompt)
+        cached = self._fetch(_digest(llm_string, exact))
+        if cached is not None:
+            with self.lock:
+                self.exact_hits += 1
+            return cached
+
+        if self.semantic:
+            if question is not None:
+                context_key = _digest(llm_string, context)
+                key = self._nearest(context_key, question)
+                cached = self._fetch(key) if key is not None else None
+                if cached is not None:
+                    with self.lock:
+                        self.semantic_hits += 1
+                    return cached
+                if key is not None:  # evicted since the index was loaded
+                    with self.lock:
+                        self._vectors.pop(context_key, None)
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        if _bypass.get():
+            return
+        if not all(isinstance(g, ChatGeneration) for g in return_val):
+            return
+        for generation in return_val:
+            # Replayed answers get fresh ids; a shared id would make
+            # add_messages overwrite the earlier copy in the same thread.
+            generation.message.id = None
+
+        exact, context, question = _prompt_keys(prompt)
+        vector = None
+        tool_calls = any(getattr(g.message, "tool_calls", None) for g in return_val)
+        if self.semantic and question is not None and not tool_calls:
+            vector = _unit(self.embeddings.embed_query(question)).tobytes()
+
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, context, vector, response, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (_digest(llm_string, exact), _digest(llm_string, context), vector, _dump(return_val), now, now),
+            )
+            self.conn.commit()
+            self._writes += 1
+            prune = self._writes % PRUNE_EVERY == 0
+        if prune:
+            self._prune()
+
+    def clear(self, **kwargs: Any) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM llm_cache")
+            self.conn.commit()
+            self._vectors.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            hits = self.exact_hits + self.semantic_hits
+            total = hits + self.misses
+            return {
+                "entries": entries,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "hit_rate": hits / total if total else 0.0,
+            }
+
+
+# -------------------
+# 5. Factory
+# -------------------
+def create_llm_cache(mode: Optional[str] = None) -> Optional[LLMResponseCache]:
+    """The cache selected by LLM_CACHE (off | exact | semantic), or None when off."""
+    mode = mode or LLM_CACHE
+    if mode == "off":
+        return None
+    if mode == "exact":
+        return LLMResponseCache()
+    if mode == "semantic":
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        return LLMResponseCache(embeddings=GoogleGenerativeAIEmbeddings(model=LLM_CACHE_EMBEDDING_MODEL))
+    raise ValueError(f"Unknown LLM_CACHE mode {mode!r}; expected off, exact or semantic")
@@ -0,0 +1,521 @@
+"""
+Process-wide gateway in front of the chat model provider.
+
+Backends build their model with `chat_model(LLM_MODEL, ...)`, so every
+provider call in the process shares one set of limits:
+
+- a token bucket (LLM_RATE_LIMIT_RPS, bursts up to LLM_RATE_BURST);
+- a concurrency cap (LLM_MAX_CONCURRENCY);
+- fair queuing: waiting calls are granted round-robin per user (the
+  `user_id` in the run config, else the thread_id), so one busy user
+  cannot starve the rest;
+- retries with full-jitter exponential backoff on 429/5xx/timeouts. A retry
+  queues again like any other call, so retries are rate limited instead of
+  piling onto a provider that is already pushing back;
+- optional hedging (LLM_HEDGE=p95): a non-streaming call still running
+  after the recent p95 service time gets one duplicate, but only if a slot
+  and a token are free right now. The first answer wins.
+
+Response-cache hits (llm_cache) are answered in front of the gateway and
+cost nothing. `stats()` reports queue-wait and service-time percentiles;
+bench_llm_gateway.py runs it against a local fake model server.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures import wait
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, TypeVar
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.runnables.config import ensure_config
+
+T = TypeVar("T")
+
+# -------------------
+# 1. Settings
+# -------------------
+LLM_RATE_LIMIT_RPS = float(os.getenv("LLM_RATE_LIMIT_RPS", "10"))  # 0 = no rate limit
+LLM_RATE_BURST = int(os.getenv("LLM_RATE_BURST", "20"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "off")  # off | p95
+# Service-time samples needed before the p95 is trusted for hedging.
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+METRIC_WINDOW = 1024
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RETRYABLE_NAMES = {"ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "InternalServerError"}
+
+
+class GatewayTimeout(TimeoutError):
+    """Raised when a call waited longer than the queue timeout for a slot."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Rate limits, server errors and transport timeouts; never our own queue timeout."""
+    if isinstance(error, GatewayTimeout):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    for source in (error, getattr(error, "response", None)):
+        for attr in ("code", "status_code", "status"):
+            value = getattr(source, attr, None)
+            if isinstance(value, int) and value in RETRYABLE_STATUS:
+                return True
+    return type(error).__name__ in RETRYABLE_NAMES
+
+
+def current_user() -> str:
+    """Fair-queuing key for the running call, from the LangChain run config."""
+    config = ensure_config()
+    configurable = config.get("configurable", {})
+    metadata = config.get("metadata", {})
+    user = configurable.get("user_id") or metadata.get("user_id") or configurable.get("thread_id")
+    return str(user) if user else "anonymous"
+
+
+def _percentiles(samples: Deque[float]) -> Dict[str, Optional[float]]:
+    values = sorted(samples)
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    pick = lambda q: round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 2)  # noqa: E731
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+# -------------------
+# 2. Fair limiter
+# -------------------
+class _Ticket:
+    __slots__ = ("granted",)
+
+    def __init__(self) -> None:
+        self.granted = False
+
+
+class FairLimiter:
+    """Token bucket + concurrency cap, granting waiters round-robin per user."""
+
+    def __init__(self, rate: float, burst: int, max_concurrency: int) -> None:
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_concurrency = max_concurrency
+        self._cond = threading.Condition()
+        self._queues: "OrderedDict[str, Deque[_Ticket]]" = OrderedDict()
+        self._in_flight = 0
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _take(self) -> None:
+        self._in_flight += 1
+        if self.rate > 0:
+            self._tokens -= 1
+
+    def _dispatch(self) -> Optional[float]:
+        """Grant waiters while capacity lasts; seconds until the next token if that is what blocks."""
+        self._refill(time.monotonic())
+        granted = False
+        delay = None
+        while self._queues and self._in_flight < self.max_concurrency:
+            if self.rate > 0 and self._tokens < 1:
+                delay = (1 - self._tokens) / self.rate
+                break
+            user, queue = next(iter(self._queues.items()))
+            queue.popleft().granted = True
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            self._take()
+            granted = True
+        if granted:
+            self._cond.notify_all()
+        return delay
+
+    def acquire(self, user: str, timeout: Optional[float] = None) -> float:
+        """Block until this call may run; returns the time spent waiting."""
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+        ticket = _Ticket()
+        with self._cond:
+            self._queues.setdefault(user, deque()).append(ticket)
+            while True:
+                delay = self._dispatch()
+                if ticket.granted:
+                    return time.monotonic() - start
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        queue = self._queues.get(user)
+                        queue.remove(ticket)
+                        if not queue:
+                            del self._queues[user]
+                        raise GatewayTimeout(f"No LLM slot within {timeout:g}s")
+                    delay = remaining if delay is None else min(delay, remaining)
+                self._cond.wait(delay)
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now and nobody is waiting for it."""
+        with self._cond:
+            self._refill(time.monotonic())
+            if self._queues or self._in_flight >= self.max_concurrency:
+                return False
+            if self.rate > 0 and self._tokens < 1:
+                return False
+            self._take()
+            return True
+
+    def release(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._dispatch()
+            self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "in_flight": self._in_flight,
+                "queued": sum(len(q) for q in self._queues.values()),
+                "queued_users": len(self._queues),
+            }
+
+
+# -------------------
+# 3. Gateway
+# -------------------
+class LLMGateway:
+    def __init__(
+        self,
+        rate: float = LLM_RATE_LIMIT_RPS,
+        burst: int = LLM_RATE_BURST,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        queue_timeout: Optional[float] = LLM_QUEUE_TIMEOUT_SECONDS,
+        max_retries: int = LLM_MAX_RETRIES,
+        retry_base: float = LLM_RETRY_BASE_SECONDS,
+        retry_max: float = LLM_RETRY_MAX_SECONDS,
+        hedge: str = LLM_HEDGE,
+        hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+    ) -> None:
+        self.limiter = FairLimiter(rate, burst, max_concurrency)
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        # Sync hedging runs both attempts off the caller's thread. Every task
+        # already holds a limiter slot, so it never waits for a worker.
+        self._hedge_pool = (
+            ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm-hedge")
+            if hedge != "off"
+            else None
+        )
+        self._lock = threading.Lock()
+        self.queue_wait: Deque[float] = deque(maxlen=METRIC_WINDOW)
+        self.service_time: Deque[float] = deque(maxlen=METRIC_WINDOW)
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failures = 0
+        self.timeouts = 0
+
+    # ---- bookkeeping ----
+    def _acquired(self, waited: float) -> None:
+        with self._lock:
+            self.calls += 1
+            self.queue_wait.append(waited)
+
+    def _served(self, seconds: float) -> None:
+        with self._lock:
+            self.service_time.append(seconds)
+
+    def _failed(self, error: BaseException) -> None:
+        with self._lock:
+            self.failures += 1
+            self.timeouts += isinstance(error, GatewayTimeout)
+
+    def _backoff(self, attempt: int) -> float:
+        with self._lock:
+            self.retries += 1
+        return random.uniform(0, min(self.retry_max, self.retry_base * 2**attempt))
+
+    def hedge_delay(self) -> Optional[float]:
+        """Recent p95 service time, once there are enough samples to trust it."""
+        if self.hedge == "off":
+            return None
+        with self._lock:
+            if len(self.service_time) < self.hedge_min_samples:
+                return None
+            values = sorted(self.service_time)
+        return values[int(0.95 * (len(values) - 1))]
+
+    # ---- sync ----
+    @contextmanager
+    def slot(self, user: str) -> Iterator[None]:
+        self._acquired(self.limiter.acquire(user, self.queue_timeout))
+        try:
+            yield
+        finally:
+            self.limiter.release()
+
+    def _run_acquired(self, fn: Callable[[], T]) -> T:
+        try:
+            start = time.monotonic()
+            result = fn()
+            self._served(time.monotonic() - start)
+            return result
+        finally:
+            self.limiter.release()
+
+    def _attempt(self, user: str, fn: Callable[[], T]) -> T:
+        self._acquired(self.limiter.acquire(user, self.queue_timeout))
+        return self._run_acquired(fn)
+
+    def _hedged(self, user: str, fn: Callable[[], T], delay: float) -> T:
+        # The slot is taken here, in the caller's fair-queue turn; only the
+        # provider call goes to the pool, and the hedge timer starts once the
+        # slot is granted, so queue wait never counts toward it.
+        self._acquired(self.limiter.acquire(user, self.queue_timeout))
+        primary = self._hedge_pool.submit(self._run_acquired, fn)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        if not self.limiter.try_acquire():
+            return primary.result()
+        self._acquired(0.0)
+        with self._lock:
+            self.hedges += 1
+        backup = self._hedge_pool.submit(self._run_acquired, fn)
+        done, _ = wait([primary, backup], return_when=FIRST_COMPLETED)
+        first = done.pop()
+        if first.exception() is None:
+            if first is backup:
+                with self._lock:
+                    self.hedge_wins += 1
+            # The loser cannot be interrupted; it releases its slot when it ends.
+            return first.result()
+        return (backup if first is primary else primary).result()
+
+    def call(self, user: str, fn: Callable[[], T]) -> T:
+        """Run `fn` (one provider request) under the limits, with retries and hedging."""
+        attempt = 0
+        while True:
+            try:
+                delay = self.hedge_delay()
+                return self._hedged(user, fn, delay) if delay is not None else self._attempt(user, fn)
+            except Exception as error:
+                if attempt >= self.max_retries or not is_retryable(error):
+                    self._failed(error)
+                    raise
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def stream(self, user: str, fn: Callable[[], Iterator[T]]) -> Iterator[T]:
+        """Yield from `fn()` holding one slot; retried only until the first chunk arrives."""
+        attempt = 0
+        while True:
+            started = False
+            try:
+                with self.slot(user):
+                    start = time.monotonic()
+                    for chunk in fn():
+                        started = True
+                        yield chunk
+                    self._served(time.monotonic() - start)
+                    return
+            except Exception as error:
+                if started or attempt >= self.max_retries or not is_retryable(error):
+                    self._failed(error)
+                    raise
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    # ---- async ----
+    async def _aacquire(self, user: str) -> None:
+        # The limiter blocks, so waiting happens on an executor thread.
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, self.limiter.acquire, user, self.queue_timeout)
+        try:
+            self._acquired(await asyncio.shield(future))
+        except asyncio.CancelledError:
+            future.add_done_callback(self._release_abandoned)
+            raise
+
+    def _release_abandoned(self, future: "asyncio.Future[float]") -> None:
+        if not future.cancelled() and future.exception() is None:
+            self.limiter.release()
+
+    async def _arun_acquired(self, afn: Callable[[], Awaitable[T]]) -> T:
+        try:
+            start = time.monotonic()
+            result = await afn()
+            self._served(time.monotonic() - start)
+            return result
+        finally:
+            self.limiter.release()
+
+    async def _aattempt(self, user: str, afn: Callable[[], Awaitable[T]]) -> T:
+        await self._aacquire(user)
+        return await self._arun_acquired(afn)
+
+    async def _ahedged(self, user: str, afn: Callable[[], Awaitable[T]], delay: float) -> T:
+        await self._aacquire(user)  # the hedge timer starts once the slot is granted
+        primary = asyncio.ensure_future(self._arun_acquired(afn))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not self.limiter.try_acquire():
+            return await primary
+        self._acquired(0.0)
+        with self._lock:
+            self.hedges += 1
+        backup = asyncio.ensure_future(self._arun_acquired(afn))
+        done, _ = await asyncio.wait({primary, backup}, return_when=asyncio.FIRST_COMPLETED)
+        first = done.pop()
+        other = backup if first is primary else primary
+        if first.exception() is None:
+            other.cancel()
+            if first is backup:
+                with self._lock:
+                    self.hedge_wins += 1
+            return first.result()
+        return await other
+
+    async def acall(self, user: str, afn: Callable[[], Awaitable[T]]) -> T:
+        attempt = 0
+        while True:
+            try:
+                delay = self.hedge_delay()
+                if delay is not None:
+                    return await self._ahedged(user, afn, delay)
+                return await self._aattempt(user, afn)
+            except Exception as error:
+                if attempt >= self.max_retries or not is_retryable(error):
+                    self._failed(error)
+                    raise
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def astream(self, user: str, fn: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        attempt = 0
+        while True:
+            started = False
+            try:
+                await self._aacquire(user)
+                try:
+                    start = time.monotonic()
+                    async for chunk in fn():
+                        started = True
+                        yield chunk
+                    self._served(time.monotonic() - start)
+                    return
+                finally:
+                    self.limiter.release()
+            except Exception as error:
+                if started or attempt >= self.max_retries or not is_retryable(error):
+                    self._failed(error)
+                    raise
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = {
+                "calls": self.calls,
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "failures": self.failures,
+                "timeouts": self.timeouts,
+                "queue_wait_ms": _percentiles(self.queue_wait),
+                "service_ms": _percentiles(self.service_time),
+            }
+        return {**self.limiter.snapshot(), **counters}
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """The process-wide gateway, built from the LLM_* settings on first use."""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+        return _gateway
+
+
+# -------------------
+# 4. Chat model
+# -------------------
+class GatewayChatModel(BaseChatModel):
+    """
+    Chat model that sends every provider request of `llm` through `gateway`.
+
+    Bind tools and set `cache=` on this wrapper: cache hits are then answered
+    without touching the gateway, and streamed tokens are reported once.
+    """
+
+    llm: BaseChatModel
+    gateway: LLMGateway
+
+    @property
+    def _llm_type(self) -> str:
+        return f"gateway-{self.llm._llm_type}"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return self.llm._identifying_params
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(**self.llm.bind_tools(tools, **kwargs).kwargs)
+
+    def _generate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any
+    ) -> ChatResult:
+        return self.gateway.call(current_user(), lambda: self.llm._generate(messages, stop=stop, **kwargs))
+
+    def _stream(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        yield from self.gateway.stream(current_user(), lambda: self.llm._stream(messages, stop=stop, **kwargs))
+
+    async def _agenerate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any
+    ) -> ChatResult:
+        return await self.gateway.acall(current_user(), lambda: self.llm._agenerate(messages, stop=stop, **kwargs))
+
+    async def _astream(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        async for chunk in self.gateway.astream(
+            current_user(), lambda: self.llm._astream(messages, stop=stop, **kwargs)
+        ):
+            yield chunk
+
+
+def chat_model(model: str, cache: Any = None, **kwargs: Any) -> GatewayChatModel:
+    """A ChatGoogleGenerativeAI behind the process-wide gateway."""
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    # The gateway owns retries; the client's own would multiply them.
+    provider = ChatGoogleGenerativeAI(model=model, max_retries=1, **kwargs)
+    return GatewayChatModel(llm=provider, gateway=get_gateway(), cache=cache)
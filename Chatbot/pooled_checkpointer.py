@@ -0,0 +1,425 @@
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+
+from checkpoint_compactor import INTERRUPT_CHANNEL
+from conversation_window import Cursor
+from thread_catalog import CatalogSqliteSaver
+
+logger = logging.getLogger(__name__)
+
+# -------------------
+# 1. Settings
+# -------------------
+CHECKPOINT_READ_POOL_SIZE = int(os.getenv("CHECKPOINT_READ_POOL_SIZE", "4"))
+CHECKPOINT_MAX_BATCH = int(os.getenv("CHECKPOINT_MAX_BATCH", "64"))
+# How long the writer lingers for more work before committing a batch. 0 means
+# "commit whatever queued up while the previous commit was running".
+CHECKPOINT_BATCH_WAIT_MS = float(os.getenv("CHECKPOINT_BATCH_WAIT_MS", "0"))
+# "sync": put() returns once its write is committed (SqliteSaver semantics).
+# "write-behind": put() returns once its write is queued; a crash can lose at
+# most CHECKPOINT_MAX_LOSS_MS of accepted writes. Interrupt writes are always
+# committed before put_writes returns.
+CHECKPOINT_DURABILITY = os.getenv("CHECKPOINT_DURABILITY", "sync")
+CHECKPOINT_MAX_LOSS_MS = float(os.getenv("CHECKPOINT_MAX_LOSS_MS", "250"))
+# Queued write-behind batches before put() blocks.
+CHECKPOINT_MAX_PENDING = int(os.getenv("CHECKPOINT_MAX_PENDING", "1024"))
+SQLITE_BUSY_TIMEOUT_SECONDS = 30.0
+
+
+def _connect(path: str, *, readonly: bool) -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        path,
+        timeout=SQLITE_BUSY_TIMEOUT_SECONDS,
+        check_same_thread=False,
+        isolation_level=None,  # transactions are explicit
+    )
+    if not readonly:
+        # Only takes effect on a new file; lets checkpoint_compactor shrink it online.
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    # In WAL mode NORMAL only fsyncs at checkpoints: a commit survives an app
+    # crash, and the last few may be lost on power failure.
+    conn.execute("PRAGMA synchronous=NORMAL")
+    if readonly:
+        conn.execute("PRAGMA query_only=ON")
+    return conn
+
+
+# -------------------
+# 2. Write batches
+# -------------------
+class _WriteBatch:
+    """Statements recorded by one logical write, committed by the writer thread."""
+
+    def __init__(self) -> None:
+        self.statements: List[Tuple[str, bool, Any]] = []
+        self.done: Future = Future()
+
+    def execute(self, sql: str, params: Any = ()) -> None:
+        self.statements.append((sql, False, tuple(params)))
+
+    def executemany(self, sql: str, seq_of_params: Any) -> None:
+        self.statements.append((sql, True, [tuple(p) for p in seq_of_params]))
+
+    def close(self) -> None:
+        pass
+
+
+# -------------------
+# 3. Saver
+# -------------------
+class PooledSqliteSaver(CatalogSqliteSaver):
+    """
+    CatalogSqliteSaver over a WAL database with a pool of reader connections
+    and one writer thread.
+
+    Reads (get_tuple, list, thread listing) borrow a connection from the pool
+    and never wait on writers. Writes are recorded in the caller's thread and
+    handed to the writer, which commits everything that queued up, from every
+    session, in one transaction (group commit). Each statement batch runs in
+    its own savepoint, so one bad write fails only its caller. By default
+    callers block until their write is committed, so durability is the same as
+    SqliteSaver's.
+
+    With `write_behind=True` a write returns as soon as it is queued, keeping
+    fsync off the streaming path. Reads of a thread wait for that thread's
+    queued writes, a write blocks once the oldest queued write is
+    `max_loss_ms` old, and writes carrying an interrupt are committed (with
+    everything queued before them) before they return, so a paused HITL run
+    is on disk while it waits for a human.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        read_pool_size: int = CHECKPOINT_READ_POOL_SIZE,
+        max_batch: int = CHECKPOINT_MAX_BATCH,
+        batch_wait_ms: float = CHECKPOINT_BATCH_WAIT_MS,
+        write_behind: bool = CHECKPOINT_DURABILITY == "write-behind",
+        max_loss_ms: float = CHECKPOINT_MAX_LOSS_MS,
+        max_pending: int = CHECKPOINT_MAX_PENDING,
+        serde: Any = None,
+    ) -> None:
+        if path == ":memory:" or path.startswith("file::memory:"):
+            raise ValueError("PooledSqliteSaver needs a database file; use SqliteSaver for :memory:.")
+        self._local = threading.local()
+        super().__init__(_connect(path, readonly=False), serde=serde)
+        self.path = path
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait_ms / 1000
+        self.setup()
+
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        for _ in range(max(1, read_pool_size)):
+            self._readers.put(_connect(path, readonly=True))
+        self._all_readers = list(self._readers.queue)
+
+        self.write_behind = write_behind
+        self.max_loss = max_loss_ms / 1000
+        self._writes: "queue.Queue[Optional[_WriteBatch]]" = queue.Queue(max_pending if write_behind else 0)
+        # Write-behind bookkeeping: queued batches oldest first, and each
+        # thread's newest queued batch (what a read of that thread waits for).
+        self._queued: Deque[Tuple[float, Future]] = deque()
+        self._unflushed: Dict[str, Future] = {}
+        self._interrupted: set = set()
+        self._queue_lock = threading.Lock()
+        self._enqueue_lock = threading.Lock()
+        self._stats = {"writes": 0, "commits": 0, "failed_writes": 0, "loss_window_waits": 0}
+        self._stats_lock = threading.Lock()
+        self._closed = False
+        self._writer = threading.Thread(
+            target=self._writer_loop, name="checkpoint-writer", daemon=True
+        )
+        self._writer.start()
+        if write_behind:
+            atexit.register(self.close)  # the writer is a daemon thread
+
+    # SqliteSaver reaches for `self.conn` directly in places (e.g. the pending
+    # writes cursor in `list`); inside a read scope that must be the borrowed
+    # reader, everywhere else it is the writer connection.
+    @property
+    def conn(self) -> sqlite3.Connection:
+        reader = getattr(self._local, "reader", None)
+        return reader if reader is not None else self._writer_conn
+
+    @conn.setter
+    def conn(self, value: sqlite3.Connection) -> None:
+        self._writer_conn = value
+
+    @contextmanager
+    def cursor(self, transaction: bool = True) -> Iterator[Any]:
+        if not transaction:
+            with self._read_scope() as conn:
+                cur = conn.cursor()
+                try:
+                    yield cur
+                finally:
+                    cur.close()
+            return
+
+        batch = getattr(self._local, "batch", None)
+        if batch is not None:  # part of an enclosing write_batch()
+            yield batch
+            return
+        with self.write_batch() as batch:
+            yield batch
+
+    @contextmanager
+    def _read_scope(self) -> Iterator[sqlite3.Connection]:
+        reader = getattr(self._local, "reader", None)
+        if reader is not None:  # nested read on the same thread
+            yield reader
+            return
+        reader = self._readers.get()
+        self._local.reader = reader
+        try:
+            yield reader
+        finally:
+            self._local.reader = None
+            if reader.in_transaction:
+                reader.rollback()
+            self._readers.put(reader)
+
+    @contextmanager
+    def write_batch(self, thread_id: Optional[str] = None, *, durable: bool = True) -> Iterator[_WriteBatch]:
+        """
+        Collect every write made inside the block into one atomic batch.
+
+        Blocks until it is committed unless the saver is write-behind and
+        `durable` is False.
+        """
+        if self._closed:
+            raise RuntimeError("Checkpointer is closed.")
+        outer = getattr(self._local, "batch", None)
+        if outer is not None:
+            yield outer
+            return
+        batch = _WriteBatch()
+        self._local.batch = batch
+        try:
+            yield batch
+        finally:
+            self._local.batch = None
+        if not batch.statements:
+            return
+        if not self.write_behind:
+            self._writes.put(batch)
+            batch.done.result()
+            return
+        self._hold_loss_window()
+        # `_enqueue_lock` keeps `_queued` in queue order; `_queue_lock` is not
+        # held across put(), which can block on a full queue while the writer
+        # needs it to report progress.
+        with self._enqueue_lock:
+            with self._queue_lock:
+                self._queued.append((time.monotonic(), batch.done))
+                if thread_id is not None:
+                    self._unflushed[thread_id] = batch.done
+            batch.done.add_done_callback(lambda done: self._flushed(thread_id, done))
+            self._writes.put(batch)
+        if durable:
+            batch.done.result()
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        # Checkpoint row and catalog row land in the same transaction.
+        thread_id = str(config["configurable"]["thread_id"])
+        with self._queue_lock:
+            durable = thread_id in self._interrupted
+            self._interrupted.discard(thread_id)
+        with self.write_batch(thread_id, durable=durable):
+            return super().put(config, checkpoint, metadata, new_versions)
+
+    def _after_commit(self, callback: Callable[[], None]) -> None:
+        # Inside put() the write is only recorded; run the callback from the
+        # writer once the batch commits, and not at all if it fails.
+        batch = getattr(self._local, "batch", None)
+        if batch is None:
+            callback()
+            return
+
+        def committed(done: Future) -> None:
+            if done.exception() is None:
+                callback()
+
+        batch.done.add_done_callback(committed)
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = str(config["configurable"]["thread_id"])
+        interrupted = any(channel == INTERRUPT_CHANNEL for channel, _ in writes)
+        if interrupted:
+            # A run that exits on this interrupt may still put its final
+            # checkpoint (durability="exit"); make that one durable too.
+            with self._queue_lock:
+                self._interrupted.add(thread_id)
+        with self.write_batch(thread_id, durable=interrupted):
+            super().put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.write_batch(str(thread_id)):
+            super().delete_thread(thread_id)
+
+    # -------------------
+    # Write-behind
+    # -------------------
+    def _flushed(self, thread_id: Optional[str], done: Future) -> None:
+        with self._queue_lock:
+            while self._queued and self._queued[0][1].done():
+                self._queued.popleft()
+            if thread_id is not None and self._unflushed.get(thread_id) is done:
+                del self._unflushed[thread_id]
+        error = done.exception()
+        if error is not None and self.write_behind:
+            logger.error("Write-behind checkpoint write failed: %s", error)
+
+    def _hold_loss_window(self) -> None:
+        """Backpressure: accept no new write while the oldest queued one is past the loss window."""
+        with self._queue_lock:
+            oldest = self._queued[0] if self._queued else None
+        if oldest is not None and time.monotonic() - oldest[0] > self.max_loss:
+            with self._stats_lock:
+                self._stats["loss_window_waits"] += 1
+            oldest[1].exception()  # wait; failures are reported by _flushed
+
+    def _await_thread(self, thread_id: Optional[Any]) -> None:
+        """Read-your-writes: wait for the thread's queued writes (all of them for None)."""
+        if not self.write_behind:
+            return
+        if thread_id is None:
+            self.flush()
+            return
+        with self._queue_lock:
+            pending = self._unflushed.get(str(thread_id))
+        if pending is not None:
+            pending.exception()
+
+    def flush(self) -> None:
+        """Wait until every write queued so far is committed."""
+        with self._queue_lock:
+            last = self._queued[-1][1] if self._queued else None
+        if last is not None:
+            last.exception()
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        self._await_thread(config["configurable"].get("thread_id"))
+        return super().get_tuple(config)
+
+    def list(self, config: Optional[RunnableConfig], **kwargs: Any) -> Iterator[CheckpointTuple]:
+        self._await_thread(config["configurable"].get("thread_id") if config else None)
+        return super().list(config, **kwargs)
+
+    def message_window(
+        self, thread_id: str, limit: int, before: Optional[Cursor] = None
+    ) -> Tuple[List[BaseMessage], Optional[Cursor]]:
+        self._await_thread(thread_id)
+        return super().message_window(thread_id, limit, before)
+
+    def list_threads(self, *args: Any, **kwargs: Any) -> List[dict]:
+        self._await_thread(None)
+        return super().list_threads(*args, **kwargs)
+
+    def thread_ids(self, owner: Optional[str] = None) -> List[str]:
+        self._await_thread(None)
+        return super().thread_ids(owner)
+
+    # -------------------
+    # Writer thread
+    # -------------------
+    def _next_batches(self) -> List[_WriteBatch]:
+        first = self._writes.get()
+        if first is None:
+            return []
+        batches = [first]
+        while len(batches) < self.max_batch:
+            try:
+                batch = self._writes.get(timeout=self.batch_wait) if self.batch_wait else self._writes.get_nowait()
+            except queue.Empty:
+                break
+            if batch is None:
+                self._writes.put(None)  # handle shutdown after this commit
+                break
+            batches.append(batch)
+        return batches
+
+    def _writer_loop(self) -> None:
+        conn = self._writer_conn
+        while True:
+            batches = self._next_batches()
+            if not batches:
+                return
+            results: List[Optional[BaseException]] = []
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for batch in batches:
+                    conn.execute("SAVEPOINT write")
+                    try:
+                        for sql, many, params in batch.statements:
+                            (conn.executemany if many else conn.execute)(sql, params)
+                    except Exception as exc:
+                        conn.execute("ROLLBACK TO write")
+                        results.append(exc)
+                    else:
+                        results.append(None)
+                    conn.execute("RELEASE write")
+                conn.execute("COMMIT")
+            except Exception as exc:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                results = [exc] * len(batches)
+
+            with self._stats_lock:
+                self._stats["commits"] += 1
+                self._stats["writes"] += len(batches)
+                self._stats["failed_writes"] += sum(r is not None for r in results)
+            for batch, error in zip(batches, results):
+                if error is None:
+                    batch.done.set_result(None)
+                else:
+                    batch.done.set_exception(error)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["avg_batch"] = stats["writes"] / stats["commits"] if stats["commits"] else 0.0
+        stats["readers"] = len(self._all_readers)
+        with self._queue_lock:
+            stats["queued"] = len(self._queued)
+        stats["state_cache"] = self.latest_cache.stats()
+        return stats
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._writes.put(None)
+        self._writer.join()
+        for reader in self._all_readers:
+            reader.close()
+        self._writer_conn.close()
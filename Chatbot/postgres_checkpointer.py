@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Iterator, List, Optional, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata
+from langgraph.checkpoint.postgres import PostgresSaver
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+
+from checkpoint_compression import CompressedSerializer
+from thread_catalog import catalog_row
+
+# Imported lazily by checkpointer_factory, so the SQLite-only setup never needs
+# psycopg / langgraph-checkpoint-postgres installed.
+
+# Same shape as thread_catalog's SQLite table.
+CATALOG_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS thread_catalog (
+        thread_id TEXT PRIMARY KEY,
+        created_at TEXT NOT NULL,
+        last_updated TEXT NOT NULL,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        title TEXT,
+        owner TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS thread_catalog_recent ON thread_catalog (last_updated, thread_id)",
+    "CREATE INDEX IF NOT EXISTS thread_catalog_owner ON thread_catalog (owner, last_updated, thread_id)",
+]
+
+# Threads written before the catalog existed get a row from checkpoint
+# timestamps alone (message count / title fill in on their next write).
+BACKFILL_SQL = """
+INSERT INTO thread_catalog (thread_id, created_at, last_updated)
+SELECT thread_id, MIN(checkpoint->>'ts'), MAX(checkpoint->>'ts')
+FROM checkpoints
+WHERE checkpoint_ns = ''
+GROUP BY thread_id
+ON CONFLICT (thread_id) DO NOTHING
+"""
+
+UPSERT_SQL = """
+INSERT INTO thread_catalog (thread_id, created_at, last_updated, message_count, title, owner)
+VALUES (%s, %s, %s, %s, %s, %s)
+ON CONFLICT (thread_id) DO UPDATE SET
+    last_updated = GREATEST(thread_catalog.last_updated, EXCLUDED.last_updated),
+    message_count = EXCLUDED.message_count,
+    title = COALESCE(thread_catalog.title, EXCLUDED.title),
+    owner = COALESCE(thread_catalog.owner, EXCLUDED.owner)
+"""
+
+_COLUMNS = "thread_id, created_at, last_updated, message_count, title, owner"
+
+
+def _page_query(limit: int, before: Optional[Tuple[str, str]], owner: Optional[str]) -> Tuple[str, list]:
+    clauses, params = [], []
+    if owner is not None:
+        clauses.append("owner = %s")
+        params.append(owner)
+    if before is not None:
+        clauses.append("(last_updated, thread_id) < (%s, %s)")
+        params.extend(before)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    params.append(limit)
+    return (
+        f"SELECT {_COLUMNS} FROM thread_catalog {where} "
+        "ORDER BY last_updated DESC, thread_id DESC LIMIT %s",
+        params,
+    )
+
+
+def _ids_query(owner: Optional[str]) -> Tuple[str, list]:
+    if owner is None:
+        return "SELECT thread_id FROM thread_catalog ORDER BY last_updated, thread_id", []
+    return (
+        "SELECT thread_id FROM thread_catalog WHERE owner = %s ORDER BY last_updated, thread_id",
+        [owner],
+    )
+
+
+# -------------------
+# 1. Sync saver
+# -------------------
+class PostgresCatalogSaver(PostgresSaver):
+    """PostgresSaver with the same thread catalog API as CatalogSqliteSaver."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        if not isinstance(self.serde, CompressedSerializer):
+            self.serde = CompressedSerializer(self.serde)
+
+    @contextmanager
+    def _cursor(self, *, pipeline: bool = False) -> Iterator[Any]:
+        if not isinstance(self.conn, ConnectionPool):
+            with super()._cursor(pipeline=pipeline) as cur:
+                yield cur
+            return
+        # Every pool checkout is its own connection; PostgresSaver's saver-wide
+        # lock would serialize all sessions of this worker onto one of them.
+        with self.conn.connection() as conn:
+            if pipeline and self.supports_pipeline:
+                with conn.pipeline(), conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+            elif pipeline:
+                with conn.transaction(), conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+            else:
+                with conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+
+    def setup(self) -> None:
+        super().setup()
+        with self._cursor() as cur:
+            for statement in CATALOG_SCHEMA:
+                cur.execute(statement)
+            cur.execute(BACKFILL_SQL)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        if config["configurable"].get("checkpoint_ns", "") == "":
+            with self._cursor() as cur:
+                cur.execute(
+                    UPSERT_SQL,
+                    catalog_row(config["configurable"]["thread_id"], checkpoint, metadata, config),
+                )
+        return saved
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        with self._cursor() as cur:
+            cur.execute("DELETE FROM thread_catalog WHERE thread_id = %s", (str(thread_id),))
+
+    def list_threads(
+        self,
+        limit: int = 50,
+        before: Optional[Tuple[str, str]] = None,
+        owner: Optional[str] = None,
+    ) -> List[dict]:
+        sql, params = _page_query(limit, before, owner)
+        with self._cursor() as cur:
+            return [dict(row) for row in cur.execute(sql, params).fetchall()]
+
+    def thread_ids(self, owner: Optional[str] = None) -> List[str]:
+        sql, params = _ids_query(owner)
+        with self._cursor() as cur:
+            return [row["thread_id"] for row in cur.execute(sql, params).fetchall()]
+
+
+# -------------------
+# 2. Async saver
+# -------------------
+class AsyncPostgresCatalogSaver(AsyncPostgresSaver):
+    """AsyncPostgresSaver with the same thread catalog API as AsyncCatalogSqliteSaver."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        if not isinstance(self.serde, CompressedSerializer):
+            self.serde = CompressedSerializer(self.serde)
+
+    @asynccontextmanager
+    async def _cursor(self, *, pipeline: bool = False) -> AsyncIterator[Any]:
+        if not isinstance(self.conn, AsyncConnectionPool):
+            async with super()._cursor(pipeline=pipeline) as cur:
+                yield cur
+            return
+        async with self.conn.connection() as conn:
+            if pipeline and self.supports_pipeline:
+                async with conn.pipeline(), conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+            elif pipeline:
+                async with conn.transaction(), conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+            else:
+                async with conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+
+    async def setup(self) -> None:
+        await super().setup()
+        async with self._cursor() as cur:
+            for statement in CATALOG_SCHEMA:
+                await cur.execute(statement)
+            await cur.execute(BACKFILL_SQL)
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        saved = await super().aput(config, checkpoint, metadata, new_versions)
+        if config["configurable"].get("checkpoint_ns", "") == "":
+            async with self._cursor() as cur:
+                await cur.execute(
+                    UPSERT_SQL,
+                    catalog_row(config["configurable"]["thread_id"], checkpoint, metadata, config),
+                )
+        return saved
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await super().adelete_thread(thread_id)
+        async with self._cursor() as cur:
+            await cur.execute("DELETE FROM thread_catalog WHERE thread_id = %s", (str(thread_id),))
+
+    async def alist_threads(
+        self,
+        limit: int = 50,
+        before: Optional[Tuple[str, str]] = None,
+        owner: Optional[str] = None,
+    ) -> List[dict]:
+        sql, params = _page_query(limit, before, owner)
+        async with self._cursor() as cur:
+            await cur.execute(sql, params)
+            return [dict(row) for row in await cur.fetchall()]
+
+    async def athread_ids(self, owner: Optional[str] = None) -> List[str]:
+        sql, params = _ids_query(owner)
+        async with self._cursor() as cur:
+            await cur.execute(sql, params)
+            return [row["thread_id"] for row in await cur.fetchall()]
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+logger = logging.getLogger(__name__)
+
+# -------------------
+# 1. Settings
+# -------------------
+PROMPT_CONTEXT_CACHE = os.getenv("PROMPT_CONTEXT_CACHE", "off")  # off | gemini
+PROMPT_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("PROMPT_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+# Gemini rejects cached contents below a per-model minimum; shorter prefixes
+# are sent inline (and still benefit from implicit prefix caching).
+PROMPT_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("PROMPT_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+# Recreate the cached content this long before it expires; after a failed
+# create, wait this long before trying again.
+REFRESH_MARGIN_SECONDS = 60
+
+
+def tool_schemas(tools: Sequence[Any]) -> List[dict]:
+    return [convert_to_openai_tool(t) for t in tools]
+
+
+def gemini_create_context_cache() -> Optional[Callable[..., str]]:
+    """langchain_google_genai.create_context_cache, or None if this install lacks it."""
+    try:
+        from langchain_google_genai import create_context_cache
+    except ImportError:
+        return None
+    return create_context_cache
+
+
+# -------------------
+# 2. Static prefix
+# -------------------
+class StaticPrefix:
+    """
+    The system prompt and tool schemas, identical on every call and every
+    thread. Per-thread data has to travel out of band (the tools read the
+    thread_id from their RunnableConfig), otherwise the prefix forks per
+    thread and neither provider nor local caches can reuse it.
+
+    With PROMPT_CONTEXT_CACHE=gemini and a prefix above the minimum size, the
+    prefix is uploaded once as Gemini cached content and calls reference it
+    by name instead of resending it. `create_cache(model, messages, tools=,
+    ttl=)` does the upload (langchain_google_genai's create_context_cache by
+    default; if that is missing the prefix is sent inline). The tests drive
+    this path with a fake; the live Gemini upload is not covered by them.
+    """
+
+    def __init__(
+        self,
+        llm,
+        system_prompt: str,
+        tools: Sequence[Any],
+        context_cache: str = PROMPT_CONTEXT_CACHE,
+        ttl_seconds: int = PROMPT_CONTEXT_CACHE_TTL_SECONDS,
+        min_tokens: int = PROMPT_CONTEXT_CACHE_MIN_TOKENS,
+        create_cache: Optional[Callable[..., str]] = None,
+    ) -> None:
+        self.llm = llm
+        self.tools = list(tools)
+        self.system_message = SystemMessage(content=system_prompt)
+        self.inline = llm.bind_tools(self.tools)
+        schemas = json.dumps(tool_schemas(self.tools), sort_keys=True)
+        self.fingerprint = hashlib.sha256(f"{system_prompt}\x00{schemas}".encode("utf-8")).hexdigest()
+        self.tokens = count_tokens_approximately([self.system_message, SystemMessage(content=schemas)])
+        self.context_cache = context_cache if self.tokens >= min_tokens else "off"
+        self.create_cache = create_cache
+        if self.context_cache == "gemini" and self.create_cache is None:
+            self.create_cache = gemini_create_context_cache()
+            if self.create_cache is None:
+                logger.warning(
+                    "PROMPT_CONTEXT_CACHE=gemini needs a langchain-google-genai with "
+                    "create_context_cache; sending the prompt prefix inline."
+                )
+                self.context_cache = "off"
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._cached_name: Optional[str] = None
+        self._cached_until = 0.0
+        self._retry_at = 0.0
+        self.inline_calls = 0
+        self.cached_calls = 0
+        self.cache_creates = 0
+        self.cache_failures = 0
+
+    def _create_cached_content(self) -> str:
+        # Behind llm_gateway the provider model is `llm.llm`.
+        provider = getattr(self.llm, "llm", self.llm)
+        return self.create_cache(provider, [self.system_message], tools=self.tools, ttl=f"{self.ttl_seconds}s")
+
+    def _cached_content(self) -> Optional[str]:
+        """Name of live cached content for this prefix, creating it when due; None to send inline."""
+        now = time.monotonic()
+        with self._lock:
+            if self._cached_name and now < self._cached_until - REFRESH_MARGIN_SECONDS:
+                return self._cached_name
+            if now < self._retry_at:
+                return None
+            try:
+                self._cached_name = self._create_cached_content()
+            except Exception as error:
+                self._cached_name = None
+                self._retry_at = now + REFRESH_MARGIN_SECONDS
+                self.cache_failures += 1
+                logger.error("Creating cached content for the prompt prefix failed: %s", error)
+                return None
+            self._cached_until = now + self.ttl_seconds
+            self.cache_creates += 1
+            return self._cached_name
+
+    def model(self) -> Tuple[Any, List[BaseMessage]]:
+        """(runnable, system messages) for the next call."""
+        name = self._cached_content() if self.context_cache == "gemini" else None
+        with self._lock:
+            if name is None:
+                self.inline_calls += 1
+                return self.inline, [self.system_message]
+            self.cached_calls += 1
+        # Cached content already carries the system instruction and tools;
+        # Gemini rejects requests that repeat them.
+        return self.llm.bind(cached_content=name), []
+
+    def invoke(self, history: Sequence[BaseMessage], fit=None, **kwargs: Any):
+        """Call the model with the prefix + `history` (passed through `fit(history, system=...)` if given)."""
+        model, system = self.model()
+        messages = fit(history, system=system) if fit else [*system, *history]
+        return model.invoke(messages, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "fingerprint": self.fingerprint[:12],
+                "tokens": self.tokens,
+                "context_cache": self.context_cache,
+                "inline_calls": self.inline_calls,
+                "cached_calls": self.cached_calls,
+                "cache_creates": self.cache_creates,
+                "cache_failures": self.cache_failures,
+            }
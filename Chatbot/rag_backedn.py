@@ -1,92 +1,334 @@
 from __future__ import annotations
 
-import os
-import sqlite3
-import tempfile
-from typing import Annotated, Any, Dict, Optional, TypedDict
+import threading
+from typing import Annotated, Any, Callable, Dict, Iterable, Optional, TypedDict
 
 from dotenv import load_dotenv
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
 from langchain_community.tools import DuckDuckGoSearchRun
 from langchain_community.vectorstores import FAISS
-from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.documents import Document
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langgraph.checkpoint.sqlite import SqliteSaver
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langgraph.graph import START, StateGraph
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode, tools_condition
 import requests
 
+from ingest_jobs import IngestionJobs
+import rag_embeddings
+import rag_index_store
+import rag_index_types
+import rag_pdf
+from rag_context import pack_context
+from rag_lexical import BM25Index
+from lru_cache import LRUCache
+from rag_query_cache import (
+    RAG_QUERY_CACHE_SIZE,
+    CachedQueryEmbeddings,
+    document_set_version,
+    normalize_query,
+)
+from rag_registry import IndexRegistry
+from rag_retriever import DocumentIndex, ThreadRetriever
+from checkpointer_factory import create_checkpointer
+from conversation_window import HISTORY_PAGE_SIZE, message_window
+from history_budget import HistoryBudget
+from llm_cache import create_llm_cache
+from llm_gateway import chat_model
+from prompt_prefix import StaticPrefix
+
 load_dotenv()
 
 # -------------------
 # 1. LLM + embeddings
 # -------------------
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash")
-embeddings = GoogleGenerativeAIEmbeddings(model="gemini-embedding-001")
+LLM_MODEL = "gemini-2.0-flash"
+llm = chat_model(LLM_MODEL, cache=create_llm_cache())  # LLM_CACHE=off|exact|semantic; limits in llm_gateway
+# Caps the history sent per call (HISTORY_TOKEN_BUDGET); tool call/result pairs stay together.
+history_budget = HistoryBudget(LLM_MODEL)
+EMBEDDING_MODEL = "gemini-embedding-001"
+embeddings = GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL)
 
 
 # -------------------
 # 2. PDF retriever store (per thread)
 # -------------------
-_THREAD_RETRIEVERS: Dict[str, Any] = {}
-_THREAD_METADATA: Dict[str, dict] = {}
+# Each uploaded PDF gets its own content-addressed index on disk (see
+# rag_index_store); a thread's document set is the list of index keys recorded
+# in its catalog. In memory we only keep a budgeted LRU of loaded stores keyed
+# by index key (threads that uploaded the same PDF share one entry), plus the
+# stores of ingestions that have not finished yet.
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+_INDEX_REGISTRY = IndexRegistry(sizer=DocumentIndex.approx_bytes)
+_PENDING_INDEXES: Dict[str, Dict[str, tuple[DocumentIndex, dict]]] = {}
+# Ingest threads add / remove pending entries while rag_tool and the UI read
+# them; every access goes through this lock.
+_PENDING_LOCK = threading.Lock()
+
+# Repeated rag_tool queries skip both the query-embedding round trip and the
+# search. Retrieval results are keyed by the thread's document-set version, so
+# adding or removing a document invalidates them automatically.
+_QUERY_VECTORS = LRUCache(RAG_QUERY_CACHE_SIZE)
+_RETRIEVAL_CACHE = LRUCache(RAG_QUERY_CACHE_SIZE)
+query_embeddings = CachedQueryEmbeddings(embeddings, EMBEDDING_MODEL, _QUERY_VECTORS)
+
+
+def _index_settings() -> dict:
+    return {
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "embedding_model": EMBEDDING_MODEL,
+        **rag_index_types.index_settings(),
+    }
+
+
+def _read_index(key: str) -> Optional[DocumentIndex]:
+    vector_store = rag_index_store.load_index(key, embeddings)
+    if vector_store is None:
+        return None
+    lexical = rag_index_store.load_lexical(key)
+    if lexical is None:
+        return DocumentIndex.from_vectors(vector_store)
+    return DocumentIndex(vector_store, lexical)
+
+
+def _load_index(key: str) -> Optional[DocumentIndex]:
+    return _INDEX_REGISTRY.get_or_load(key, lambda: _read_index(key))
+
+
+def _pending_entries(thread_id: str) -> list[tuple[str, DocumentIndex, dict]]:
+    """Snapshot of a thread's unfinished ingestions as [(doc_id, index, summary copy), ...]."""
+    with _PENDING_LOCK:
+        return [
+            (doc_id, index, dict(summary))
+            for doc_id, (index, summary) in _PENDING_INDEXES.get(thread_id, {}).items()
+        ]
+
+
+def _thread_indexes(thread_id: str) -> list[tuple[str, DocumentIndex, dict]]:
+    """Return [(doc_id, index, summary), ...] for a thread, reloading evicted indexes."""
+    entries = []
+    for doc_id, key, summary in rag_index_store.thread_documents(thread_id):
+        index = _load_index(key)
+        if index is not None:
+            entries.append((doc_id, index, summary))
+    entries.extend(_pending_entries(thread_id))
+    return entries
+
+
+def _get_retriever(thread_id: Optional[str]) -> Optional[ThreadRetriever]:
+    """Fetch the retriever over every document in a thread, if it has any."""
+    if not thread_id:
+        return None
+    entries = _thread_indexes(str(thread_id))
+    if not entries:
+        return None
+    return ThreadRetriever(
+        [(doc_id, index) for doc_id, index, _ in entries], query_embeddings, k=4
+    )
+
+
+def _search_thread(
+    thread_id: str, query: str, doc_ids: Optional[list[str]] = None
+) -> Optional[list[Document]]:
+    """Run a thread retrieval through the result cache."""
+    thread_id = str(thread_id)
+    # Partial indexes change under us while ingestion runs; don't cache them.
+    with _PENDING_LOCK:
+        cacheable = thread_id not in _PENDING_INDEXES
+    index_keys = [key for _, key, _ in rag_index_store.thread_documents(thread_id)]
+    cache_key = (
+        thread_id,
+        document_set_version(index_keys),
+        normalize_query(query),
+        tuple(sorted(doc_ids or ())),
+    )
+    if cacheable:
+        cached = _RETRIEVAL_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+
+    retriever = _get_retriever(thread_id)
+    if retriever is None:
+        return None
+    result = retriever.invoke(query, doc_ids=doc_ids)
+    if cacheable:
+        _RETRIEVAL_CACHE.put(cache_key, result)
+    return result
+
 
+def _invalidate_thread_cache(thread_id: str) -> None:
+    _RETRIEVAL_CACHE.discard_where(lambda key: key[0] == str(thread_id))
 
-def _get_retriever(thread_id: Optional[str]):
-    """Fetch the retriever for a thread if available."""
-    if thread_id and thread_id in _THREAD_RETRIEVERS:
-        return _THREAD_RETRIEVERS[thread_id]
-    return None
 
+def retriever_registry_stats() -> dict:
+    return _INDEX_REGISTRY.stats()
 
-def ingest_pdf(file_bytes: bytes, thread_id: str, filename: Optional[str] = None) -> dict:
+
+def rag_cache_stats() -> dict:
+    return {
+        "query_vectors": _QUERY_VECTORS.stats(),
+        "retrievals": _RETRIEVAL_CACHE.stats(),
+        "prompt_prefix": prompt_prefix.stats(),
+    }
+
+
+def delete_document(thread_id: str, doc_id: str) -> bool:
     """
-    Build a FAISS retriever for the uploaded PDF and store it for the thread.
+    Remove one document's vectors from a thread without touching the others.
+
+    The index files are deleted once no thread references them any more.
+    """
+    key = rag_index_store.remove_document(str(thread_id), doc_id)
+    if key is None:
+        return False
+    _invalidate_thread_cache(thread_id)
+    if not rag_index_store.index_in_use(key):
+        _INDEX_REGISTRY.discard(key)
+        rag_index_store.delete_index(key)
+    return True
+
+
+def ingest_pdf(
+    file_bytes: bytes,
+    thread_id: str,
+    filename: Optional[str] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    page_chunks: Optional[Iterable[tuple[int, list[Document]]]] = None,
+) -> dict:
+    """
+    Index the uploaded PDF and add it to the thread's document set.
+
+    Pages are parsed, split and embedded a few batches at a time (enough to
+    keep EMBED_MAX_CONCURRENCY requests in flight), so peak memory depends on
+    the embedding batch size rather than on the document. The partial index
+    is attached to the thread after every flush, letting the chat answer
+    questions about early pages while the rest is still indexing.
+    `on_progress(pages_done, total_pages)` is called after each page.
+
+    `page_chunks` lets a caller supply the split pages (e.g. parsed in a
+    process pool, see ingest_jobs); it must yield (total_pages, chunks) per
+    page in order and is only consumed when the index is not cached yet.
+
+    Indexes are cached on disk by content hash, so a PDF that was already
+    embedded (in any thread, by any worker) is reused without re-embedding.
 
     Returns a summary dict that can be surfaced in the UI.
     """
     if not file_bytes:
         raise ValueError("No bytes received for ingestion.")
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-        temp_file.write(file_bytes)
-        temp_path = temp_file.name
+    thread_id = str(thread_id)
+    source = filename or "uploaded.pdf"
+    key = rag_index_store.index_key(file_bytes, _index_settings())
+    doc_id = rag_index_store.document_id(key)
+    if _load_index(key) is not None:
+        summary = dict(rag_index_store.load_summary(key))
+        summary["filename"] = source
+        summary["doc_id"] = doc_id
+        # Report (and let a cancelled job bail out) before attaching, so a
+        # job that ends up "cancelled" never leaves the document behind.
+        if on_progress:
+            on_progress(summary.get("documents", 0), summary.get("documents", 0))
+        rag_index_store.add_document(thread_id, key, summary)
+        _invalidate_thread_cache(thread_id)
+        return summary
+
+    if page_chunks is None:
+        page_chunks = rag_pdf.split_pages(
+            file_bytes, source, doc_id, CHUNK_SIZE, CHUNK_OVERLAP
+        )
+    summary = {"filename": source, "doc_id": doc_id, "documents": 0, "chunks": 0}
+    pending: list[Document] = []
+    index: Optional[DocumentIndex] = None
+    # Flush once every concurrent embedding request can get a full batch;
+    # flushing at a single batch would leave embed_texts nothing to overlap.
+    flush_size = rag_embeddings.EMBED_BATCH_SIZE * rag_embeddings.EMBED_MAX_CONCURRENCY
+
+    def flush() -> None:
+        nonlocal index
+        if not pending:
+            return
+        texts = [chunk.page_content for chunk in pending]
+        vectors = rag_embeddings.embed_texts(texts, embeddings, EMBEDDING_MODEL)
+        metadatas = [chunk.metadata for chunk in pending]
+        start = summary["chunks"]
+        ids = [f"{doc_id}-{start + n}" for n in range(len(pending))]
+        if index is None:
+            index = DocumentIndex(
+                FAISS.from_embeddings(
+                    list(zip(texts, vectors)), embeddings, metadatas=metadatas, ids=ids
+                ),
+                BM25Index(),
+            )
+            with _PENDING_LOCK:
+                _PENDING_INDEXES.setdefault(thread_id, {})[doc_id] = (index, summary)
+        else:
+            index.vectors.add_embeddings(
+                list(zip(texts, vectors)), metadatas=metadatas, ids=ids
+            )
+        index.lexical.add_many(zip(ids, texts))
+        summary["chunks"] += len(pending)
+        pending.clear()
 
     try:
-        loader = PyPDFLoader(temp_path)
-        docs = loader.load()
-
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000, chunk_overlap=200, separators=["\n\n", "\n", " ", ""]
+        for total_pages, chunks in page_chunks:
+            pending.extend(chunks)
+            summary["documents"] += 1
+            if len(pending) >= flush_size:
+                flush()
+            if on_progress:
+                on_progress(summary["documents"], total_pages)
+        flush()
+
+        if index is None:
+            raise ValueError("No text could be extracted from this PDF.")
+
+        # Large documents swap the exact index for IVF before saving.
+        summary["index_type"] = rag_index_types.compress_store(
+            index.vectors, rag_index_types.RAG_INDEX_TYPE
         )
-        chunks = splitter.split_documents(docs)
 
-        vector_store = FAISS.from_documents(chunks, embeddings)
-        retriever = vector_store.as_retriever(
-            search_type="similarity", search_kwargs={"k": 4}
-        )
+        rag_index_store.save_index(key, index.vectors, summary, lexical=index.lexical)
+        rag_index_store.add_document(thread_id, key, summary)
+        _INDEX_REGISTRY.put(key, index)
+        _invalidate_thread_cache(thread_id)
+    finally:
+        with _PENDING_LOCK:
+            thread_pending = _PENDING_INDEXES.get(thread_id, {})
+            thread_pending.pop(doc_id, None)
+            if not thread_pending:
+                _PENDING_INDEXES.pop(thread_id, None)
 
-        _THREAD_RETRIEVERS[str(thread_id)] = retriever
-        _THREAD_METADATA[str(thread_id)] = {
-            "filename": filename or os.path.basename(temp_path),
-            "documents": len(docs),
-            "chunks": len(chunks),
-        }
+    return summary
+
+
+# Background ingestion: rag_frontend submits uploads here and polls status.
+ingestion_jobs = IngestionJobs(
+    ingest_pdf,
+    settings=lambda: (CHUNK_SIZE, CHUNK_OVERLAP),
+    document_id=lambda file_bytes: rag_index_store.document_id(
+        rag_index_store.index_key(file_bytes, _index_settings())
+    ),
+    remove_document=delete_document,
+)
+
+
+def submit_ingestion(file_bytes: bytes, thread_id: str, filename: Optional[str] = None) -> str:
+    """Queue a PDF for background ingestion and return its job id."""
+    return ingestion_jobs.submit(file_bytes, thread_id, filename)
+
+
+def ingestion_status(job_id: str) -> Optional[dict]:
+    return ingestion_jobs.status(job_id)
 
-        return {
-            "filename": filename or os.path.basename(temp_path),
-            "documents": len(docs),
-            "chunks": len(chunks),
-        }
-    finally:
-        # The FAISS store keeps copies of the text, so the temp file is safe to remove.
-        try:
-            os.remove(temp_path)
-        except OSError:
-            pass
+
+def cancel_ingestion(job_id: str) -> bool:
+    return ingestion_jobs.cancel(job_id)
 
 
 # -------------------
@@ -140,32 +382,63 @@ def get_stock_price(symbol: str) -> dict:
 
 
 @tool
-def rag_tool(query: str, thread_id: Optional[str] = None) -> dict:
+def rag_tool(query: str, config: RunnableConfig, document: Optional[str] = None) -> dict:
     """
-    Retrieve relevant information from the uploaded PDF for this chat thread.
-    Always include the thread_id when calling this tool.
+    Retrieve relevant information from the PDFs uploaded to this chat thread.
+    Pass `document` (a filename or doc_id) to search only that PDF.
     """
-    retriever = _get_retriever(thread_id)
-    if retriever is None:
+    # The thread comes from the run config, not the model, so the prompt and
+    # tool schema stay identical across threads.
+    thread_id = config.get("configurable", {}).get("thread_id")
+    docs = thread_documents(thread_id) if thread_id else []
+    if not docs:
         return {
             "error": "No document indexed for this chat. Upload a PDF first.",
             "query": query,
         }
 
-    result = retriever.invoke(query)
-    context = [doc.page_content for doc in result]
-    metadata = [doc.metadata for doc in result]
+    doc_ids = None
+    if document:
+        doc_ids = [
+            meta["doc_id"]
+            for meta in docs
+            if document in (meta.get("doc_id"), meta.get("filename"))
+        ]
+        if not doc_ids:
+            return {
+                "error": f"No document named '{document}' in this chat.",
+                "query": query,
+                "documents": [meta.get("filename") for meta in docs],
+            }
+
+    result = _search_thread(thread_id, query, doc_ids) or []
+    context, metadata, token_stats = pack_context(result)
+    # Indexes are shared by content, so chunks carry the filename of whoever
+    # uploaded the PDF first; report the name this thread gave it.
+    filenames = {meta.get("doc_id"): meta.get("filename") for meta in docs}
+    for meta in metadata:
+        meta["source"] = filenames.get(meta.get("doc_id")) or meta.get("source")
 
     return {
         "query": query,
         "context": context,
         "metadata": metadata,
-        "source_file": _THREAD_METADATA.get(str(thread_id), {}).get("filename"),
+        "source_files": sorted({meta.get("source") for meta in metadata if meta.get("source")}),
+        "tokens": token_stats,
     }
 
 
 tools = [search_tool, get_stock_price, calculator, rag_tool]
-llm_with_tools = llm.bind_tools(tools)
+
+# Static on purpose: anything per-thread here would fork the prompt prefix.
+SYSTEM_PROMPT = (
+    "You are a helpful assistant. For questions about the uploaded PDFs, call "
+    "the `rag_tool`; pass `document` to search a single file. "
+    "You can also use the web search, stock price, and "
+    "calculator tools when helpful. If no document is available, ask the user "
+    "to upload a PDF."
+)
+prompt_prefix = StaticPrefix(llm, SYSTEM_PROMPT, tools)  # PROMPT_CONTEXT_CACHE=off|gemini
 
 # -------------------
 # 4. State
@@ -179,22 +452,7 @@ class ChatState(TypedDict):
 # -------------------
 def chat_node(state: ChatState, config=None):
     """LLM node that may answer or request a tool call."""
-    thread_id = None
-    if config and isinstance(config, dict):
-        thread_id = config.get("configurable", {}).get("thread_id")
-
-    system_message = SystemMessage(
-        content=(
-            "You are a helpful assistant. For questions about the uploaded PDF, call "
-            "the `rag_tool` and include the thread_id "
-            f"`{thread_id}`. You can also use the web search, stock price, and "
-            "calculator tools when helpful. If no document is available, ask the user "
-            "to upload a PDF."
-        )
-    )
-
-    messages = [system_message, *state["messages"]]
-    response = llm_with_tools.invoke(messages, config=config)
+    response = prompt_prefix.invoke(state["messages"], fit=history_budget.fit, config=config)
     return {"messages": [response]}
 
 
@@ -203,8 +461,7 @@ tool_node = ToolNode(tools)
 # -------------------
 # 6. Checkpointer
 # -------------------
-conn = sqlite3.connect(database="chatbot.db", check_same_thread=False)
-checkpointer = SqliteSaver(conn=conn)
+checkpointer = create_checkpointer()  # CHECKPOINT_BACKEND=sqlite|postgres
 
 # -------------------
 # 7. Graph
@@ -223,15 +480,32 @@ chatbot = graph.compile(checkpointer=checkpointer)
 # 8. Helpers
 # -------------------
 def retrieve_all_threads():
-    all_threads = set()
-    for checkpoint in checkpointer.list(None):
-        all_threads.add(checkpoint.config["configurable"]["thread_id"])
-    return list(all_threads)
+    return checkpointer.thread_ids()
+
+
+def list_threads(limit: int = 50, before=None, owner: Optional[str] = None) -> list[dict]:
+    """One page of the thread catalog, most recently updated first."""
+    return checkpointer.list_threads(limit=limit, before=before, owner=owner)
+
+
+def load_messages(thread_id, limit=HISTORY_PAGE_SIZE, before=None):
+    """The newest `limit` messages of a thread (or the page before `before`) plus the cursor for older ones."""
+    return message_window(checkpointer, thread_id, limit, before)
 
 
 def thread_has_document(thread_id: str) -> bool:
-    return str(thread_id) in _THREAD_RETRIEVERS
+    return bool(thread_documents(thread_id))
+
+
+def thread_documents(thread_id: str) -> list[dict]:
+    """Summaries of every document indexed for a thread, oldest first."""
+    thread_id = str(thread_id)
+    summaries = [summary for _, _, summary in rag_index_store.thread_documents(thread_id)]
+    summaries.extend(summary for _, _, summary in _pending_entries(thread_id))
+    return summaries
 
 
 def thread_document_metadata(thread_id: str) -> dict:
-    return _THREAD_METADATA.get(str(thread_id), {})
\ No newline at end of file
+    """Summary of the most recently added document for a thread."""
+    docs = thread_documents(thread_id)
+    return docs[-1] if docs else {}
\ No newline at end of file
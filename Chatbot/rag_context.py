@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import math
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+# -------------------
+# 1. Settings
+# -------------------
+RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1500"))
+NEAR_DUPLICATE_THRESHOLD = 0.9
+MIN_OVERLAP_CHARS = 20
+# Chunk boundaries fall on separators the splitter strips, so "adjacent"
+# chunks can be a few characters apart.
+MAX_ADJACENT_GAP = 2
+
+
+def count_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token), same spirit as count_tokens_approximately."""
+    return math.ceil(len(text) / 4)
+
+
+# -------------------
+# 2. Merging
+# -------------------
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of `left` that is a prefix of `right`."""
+    longest = min(len(left), len(right))
+    for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _merge_pair(left: dict, right: dict) -> Optional[str]:
+    """Merged text if `right` continues or overlaps `left` on the same page."""
+    left_start = left["metadata"].get("start_index")
+    right_start = right["metadata"].get("start_index")
+    if left_start is not None and right_start is not None:
+        left_end = left_start + len(left["text"])
+        if right_start > left_end + MAX_ADJACENT_GAP:
+            return None
+        if right_start + len(right["text"]) <= left_end:
+            return left["text"]  # fully contained
+        if right_start >= left_end:
+            return left["text"] + " " + right["text"]
+        return left["text"] + right["text"][left_end - right_start :]
+
+    size = _overlap(left["text"], right["text"])
+    if size:
+        return left["text"] + right["text"][size:]
+    if right["text"] in left["text"]:
+        return left["text"]
+    return None
+
+
+def _merge_page(passages: List[dict]) -> List[dict]:
+    passages = sorted(passages, key=lambda p: p["metadata"].get("start_index", 0))
+    merged = [passages[0]]
+    for passage in passages[1:]:
+        text = _merge_pair(merged[-1], passage)
+        if text is None:
+            merged.append(passage)
+            continue
+        merged[-1] = {
+            "text": text,
+            "metadata": merged[-1]["metadata"],
+            "rank": min(merged[-1]["rank"], passage["rank"]),
+            "chunks": merged[-1]["chunks"] + passage["chunks"],
+        }
+    return merged
+
+
+# -------------------
+# 3. Near-duplicate filter
+# -------------------
+def _shingles(text: str, size: int = 3) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {" ".join(words)}
+    return {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+# -------------------
+# 4. Packing
+# -------------------
+def pack_context(
+    docs: Sequence[Document], token_budget: int = RAG_CONTEXT_TOKEN_BUDGET
+) -> Tuple[List[str], List[dict], Dict[str, int]]:
+    """
+    Turn ranked retrieval hits into the context actually sent back to the LLM.
+
+    Overlapping or adjacent chunks from the same page are stitched together,
+    near-duplicate passages (e.g. the same boilerplate in two PDFs) are
+    dropped, and passages are added in rank order until `token_budget` is used
+    up. Returns (texts, metadatas, token stats).
+    """
+    retrieved_tokens = sum(count_tokens(doc.page_content) for doc in docs)
+
+    pages: Dict[tuple, List[dict]] = {}
+    for rank, doc in enumerate(docs):
+        key = (doc.metadata.get("doc_id"), doc.metadata.get("source"), doc.metadata.get("page"))
+        pages.setdefault(key, []).append(
+            {"text": doc.page_content, "metadata": dict(doc.metadata), "rank": rank, "chunks": 1}
+        )
+
+    passages = [p for group in pages.values() for p in _merge_page(group)]
+    passages.sort(key=lambda p: p["rank"])
+
+    kept: List[dict] = []
+    kept_shingles: List[set] = []
+    for passage in passages:
+        shingles = _shingles(passage["text"])
+        if any(_jaccard(shingles, seen) >= NEAR_DUPLICATE_THRESHOLD for seen in kept_shingles):
+            continue
+        kept.append(passage)
+        kept_shingles.append(shingles)
+
+    texts: List[str] = []
+    metadatas: List[dict] = []
+    used = 0
+    for passage in kept:
+        remaining = token_budget - used
+        if remaining <= 0:
+            break
+        text = passage["text"]
+        if count_tokens(text) > remaining:
+            text = text[: remaining * 4 - 2].rsplit(" ", 1)[0] + " …"
+        metadata = {k: v for k, v in passage["metadata"].items() if k != "start_index"}
+        metadata["merged_chunks"] = passage["chunks"]
+        texts.append(text)
+        metadatas.append(metadata)
+        used += count_tokens(text)
+
+    return texts, metadatas, {
+        "retrieved_tokens": retrieved_tokens,
+        "context_tokens": used,
+        "tokens_saved": retrieved_tokens - used,
+    }
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import rag_index_store
+
+# -------------------
+# 1. Settings
+# -------------------
+EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "64"))
+EMBED_MAX_CONCURRENCY = int(os.getenv("RAG_EMBED_MAX_CONCURRENCY", "4"))
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# -------------------
+# 2. Chunk-level embedding cache
+# -------------------
+class EmbeddingCache:
+    """Persistent (model, chunk-text hash) -> vector map backed by SQLite."""
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        if path is None:
+            os.makedirs(rag_index_store.INDEX_DIR, exist_ok=True)
+            path = os.path.join(rag_index_store.INDEX_DIR, "embeddings.db")
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                )
+                """
+            )
+            self.conn.commit()
+
+    def get_many(self, model: str, hashes: Sequence[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        # Stay well under SQLite's bound-parameter limit.
+        for start in range(0, len(hashes), 500):
+            batch = list(hashes[start : start + 500])
+            placeholders = ",".join("?" * len(batch))
+            with self.lock:
+                rows = self.conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    (model, *batch),
+                ).fetchall()
+            for digest, blob in rows:
+                found[digest] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, model: str, items: Dict[str, Sequence[float]]) -> None:
+        if not items:
+            return
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [
+                    (model, digest, array("f", vector).tobytes())
+                    for digest, vector in items.items()
+                ],
+            )
+            self.conn.commit()
+
+
+_default_cache: Optional[EmbeddingCache] = None
+
+
+def default_cache() -> EmbeddingCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = EmbeddingCache()
+    return _default_cache
+
+
+# -------------------
+# 3. Batched embedding
+# -------------------
+def embed_texts(
+    texts: Sequence[str],
+    embeddings: Any,
+    model: str,
+    *,
+    batch_size: int = EMBED_BATCH_SIZE,
+    max_concurrency: int = EMBED_MAX_CONCURRENCY,
+    cache: Optional[EmbeddingCache] = None,
+) -> List[List[float]]:
+    """
+    Embed `texts` in order, only calling the provider for text it has never seen.
+
+    Identical chunks (repeated headers/footers, re-uploaded documents) are
+    embedded once; the remaining misses go out in `batch_size` requests with at
+    most `max_concurrency` in flight.
+    """
+    cache = cache or default_cache()
+    hashes = [text_hash(text) for text in texts]
+
+    unique: Dict[str, str] = {}
+    for digest, text in zip(hashes, texts):
+        unique.setdefault(digest, text)
+
+    vectors = cache.get_many(model, list(unique))
+    missing = [digest for digest in unique if digest not in vectors]
+
+    batches = [
+        missing[start : start + batch_size]
+        for start in range(0, len(missing), max(1, batch_size))
+    ]
+
+    def embed_batch(batch: List[str]) -> Dict[str, List[float]]:
+        result = embeddings.embed_documents([unique[digest] for digest in batch])
+        fresh = dict(zip(batch, result))
+        cache.put_many(model, fresh)
+        return fresh
+
+    if len(batches) == 1 or max_concurrency <= 1:
+        for batch in batches:
+            vectors.update(embed_batch(batch))
+    elif batches:
+        with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+            for fresh in pool.map(embed_batch, batches):
+                vectors.update(fresh)
+
+    return [vectors[digest] for digest in hashes]
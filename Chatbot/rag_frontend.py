@@ -4,10 +4,15 @@ import streamlit as st
 from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 
 from rag_backedn import (
+    cancel_ingestion,
     chatbot,
-    ingest_pdf,
+    delete_document,
+    ingestion_status,
+    load_messages,
     retrieve_all_threads,
+    submit_ingestion,
     thread_document_metadata,
+    thread_documents,
 )
 
 
@@ -21,6 +26,7 @@ def reset_chat():
     st.session_state["thread_id"] = thread_id
     add_thread(thread_id)
     st.session_state["message_history"] = []
+    st.session_state["history_cursor"] = None
 
 
 def add_thread(thread_id):
@@ -28,15 +34,23 @@ def add_thread(thread_id):
         st.session_state["chat_threads"].append(thread_id)
 
 
-def load_conversation(thread_id):
-    state = chatbot.get_state(config={"configurable": {"thread_id": thread_id}})
-    return state.values.get("messages", [])
+def load_conversation(thread_id, before=None):
+    """One page of a thread as chat history, plus the cursor for the page before it."""
+    messages, cursor = load_messages(thread_id, before=before)
+    history = []
+    for msg in messages:
+        role = "user" if isinstance(msg, HumanMessage) else "assistant"
+        history.append({"role": role, "content": msg.content})
+    return history, cursor
 
 
 # ======================= Session Initialization ===================
 if "message_history" not in st.session_state:
     st.session_state["message_history"] = []
 
+if "history_cursor" not in st.session_state:
+    st.session_state["history_cursor"] = None
+
 if "thread_id" not in st.session_state:
     st.session_state["thread_id"] = generate_thread_id()
 
@@ -46,10 +60,21 @@ if "chat_threads" not in st.session_state:
 if "ingested_docs" not in st.session_state:
     st.session_state["ingested_docs"] = {}
 
+if "ingest_jobs" not in st.session_state:
+    st.session_state["ingest_jobs"] = {}
+
+if "ingest_outcomes" not in st.session_state:
+    st.session_state["ingest_outcomes"] = {}
+
+if "uploader_keys" not in st.session_state:
+    st.session_state["uploader_keys"] = {}
+
 add_thread(st.session_state["thread_id"])
 
 thread_key = str(st.session_state["thread_id"])
 thread_docs = st.session_state["ingested_docs"].setdefault(thread_key, {})
+thread_jobs = st.session_state["ingest_jobs"].setdefault(thread_key, {})
+thread_outcomes = st.session_state["ingest_outcomes"].setdefault(thread_key, {})
 threads = st.session_state["chat_threads"][::-1]
 selected_thread = None
 
@@ -61,28 +86,92 @@ if st.sidebar.button("New Chat", use_container_width=True):
     reset_chat()
     st.rerun()
 
-if thread_docs:
-    latest_doc = list(thread_docs.values())[-1]
-    st.sidebar.success(
-        f"Using `{latest_doc.get('filename')}` "
-        f"({latest_doc.get('chunks')} chunks from {latest_doc.get('documents')} pages)"
-    )
+indexed_docs = thread_documents(thread_key)
+if indexed_docs:
+    for doc in indexed_docs:
+        doc_col, remove_col = st.sidebar.columns([4, 1])
+        doc_col.success(
+            f"`{doc.get('filename')}` "
+            f"({doc.get('chunks')} chunks from {doc.get('documents')} pages)"
+        )
+        if remove_col.button("✕", key=f"remove-doc-{thread_key}-{doc.get('doc_id')}"):
+            delete_document(thread_key, doc.get("doc_id"))
+            thread_docs.pop(doc.get("filename"), None)
+            # A fresh uploader key drops the file from the widget, otherwise
+            # the next rerun would see it again and re-ingest it.
+            st.session_state["uploader_keys"][thread_key] = (
+                st.session_state["uploader_keys"].get(thread_key, 0) + 1
+            )
+            st.rerun()
 else:
     st.sidebar.info("No PDF indexed yet.")
 
-uploaded_pdf = st.sidebar.file_uploader("Upload a PDF for this chat", type=["pdf"])
+uploaded_pdf = st.sidebar.file_uploader(
+    "Upload a PDF for this chat",
+    type=["pdf"],
+    key=f"pdf-uploader-{thread_key}-{st.session_state['uploader_keys'].get(thread_key, 0)}",
+)
 if uploaded_pdf:
+    outcome = thread_outcomes.get(uploaded_pdf.name)
     if uploaded_pdf.name in thread_docs:
         st.sidebar.info(f"`{uploaded_pdf.name}` already processed for this chat.")
-    else:
-        with st.sidebar.status("Indexing PDF…", expanded=True) as status_box:
-            summary = ingest_pdf(
+    elif outcome and outcome["file_id"] == uploaded_pdf.file_id:
+        # Failed or cancelled: stays that way until the file is uploaded again.
+        pass
+    elif uploaded_pdf.name not in thread_jobs:
+        thread_outcomes.pop(uploaded_pdf.name, None)
+        thread_jobs[uploaded_pdf.name] = {
+            "job_id": submit_ingestion(
                 uploaded_pdf.getvalue(),
                 thread_id=thread_key,
                 filename=uploaded_pdf.name,
+            ),
+            "file_id": uploaded_pdf.file_id,
+        }
+
+for filename, outcome in thread_outcomes.items():
+    if outcome["state"] == "failed":
+        st.sidebar.error(f"Indexing `{filename}` failed: {outcome['error']}")
+    else:
+        st.sidebar.warning(f"Indexing `{filename}` was cancelled.")
+
+
+# Ingestion runs in the backend's job pool; this fragment only polls it, so the
+# rest of the page (and every other session) stays responsive meanwhile.
+@st.fragment(run_every=1.0)
+def show_ingestion_jobs(thread_key):
+    jobs = st.session_state["ingest_jobs"].get(thread_key, {})
+    docs = st.session_state["ingested_docs"].setdefault(thread_key, {})
+    outcomes = st.session_state["ingest_outcomes"].setdefault(thread_key, {})
+    for filename, entry in list(jobs.items()):
+        job_id = entry["job_id"]
+        job = ingestion_status(job_id)
+        if job is not None and job["state"] == "done":
+            docs[filename] = job["summary"]
+            jobs.pop(filename, None)
+            st.rerun(scope="app")
+        elif job is None or job["state"] in ("failed", "cancelled"):
+            # Remembered against this upload so the rerun does not resubmit it.
+            outcomes[filename] = {
+                "file_id": entry["file_id"],
+                "state": job["state"] if job else "cancelled",
+                "error": job["error"] if job else None,
+            }
+            jobs.pop(filename, None)
+            st.rerun(scope="app")
+        else:
+            total_pages = job["total_pages"]
+            st.progress(
+                job["pages_done"] / max(total_pages, 1),
+                text=f"Indexing `{filename}` – {job['pages_done']}/{total_pages or '?'} pages",
             )
-            thread_docs[uploaded_pdf.name] = summary
-            status_box.update(label="✅ PDF indexed", state="complete", expanded=False)
+            if st.button("Cancel", key=f"cancel-ingest-{job_id}"):
+                cancel_ingestion(job_id)
+
+
+if thread_jobs:
+    with st.sidebar:
+        show_ingestion_jobs(thread_key)
 
 st.sidebar.subheader("Past conversations")
 if not threads:
@@ -96,6 +185,14 @@ else:
 st.title("Multi Utility Chatbot")
 
 # Chat area
+if st.session_state["history_cursor"] is not None and st.button("Load earlier messages"):
+    earlier, cursor = load_conversation(
+        st.session_state["thread_id"], before=st.session_state["history_cursor"]
+    )
+    st.session_state["message_history"] = earlier + st.session_state["message_history"]
+    st.session_state["history_cursor"] = cursor
+    st.rerun()
+
 for message in st.session_state["message_history"]:
     with st.chat_message(message["role"]):
         st.text(message["content"])
@@ -160,12 +257,8 @@ st.divider()
 
 if selected_thread:
     st.session_state["thread_id"] = selected_thread
-    messages = load_conversation(selected_thread)
-
-    temp_messages = []
-    for msg in messages:
-        role = "user" if isinstance(msg, HumanMessage) else "assistant"
-        temp_messages.append({"role": role, "content": msg.content})
-    st.session_state["message_history"] = temp_messages
+    history, cursor = load_conversation(selected_thread)
+    st.session_state["message_history"] = history
+    st.session_state["history_cursor"] = cursor
     st.session_state["ingested_docs"].setdefault(str(selected_thread), {})
     st.rerun()
\ No newline at end of file
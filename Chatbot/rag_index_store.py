@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Optional
+
+from langchain_community.vectorstores import FAISS
+
+from rag_lexical import BM25Index
+
+# -------------------
+# 1. Layout
+# -------------------
+# rag_indexes/
+#   catalog.db            (thread_id, doc_id) -> index_key (+ summary) mapping
+#   <index_key>/
+#     index.faiss         raw FAISS index, memory-mapped on load
+#     index.pkl           docstore + id mapping written by FAISS.save_local
+#     lexical.json        BM25 inverted index over the same chunk ids
+#     meta.json           summary dict returned by ingest_pdf
+INDEX_DIR = os.getenv("RAG_INDEX_DIR", "rag_indexes")
+
+_LOCK = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+
+
+def _catalog() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        _conn = sqlite3.connect(
+            os.path.join(INDEX_DIR, "catalog.db"), check_same_thread=False
+        )
+        _conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS thread_documents (
+                thread_id TEXT NOT NULL,
+                doc_id TEXT NOT NULL,
+                index_key TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                added_at REAL NOT NULL,
+                PRIMARY KEY (thread_id, doc_id)
+            )
+            """
+        )
+        _conn.execute(
+            "CREATE INDEX IF NOT EXISTS thread_documents_by_key ON thread_documents (index_key)"
+        )
+        _conn.commit()
+    return _conn
+
+
+# -------------------
+# 2. Keys
+# -------------------
+def index_key(file_bytes: bytes, settings: dict) -> str:
+    """
+    Content address for an index: hash of the PDF bytes plus every setting that
+    changes the resulting vectors (chunking and embedding model).
+    """
+    digest = hashlib.sha256(file_bytes)
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def document_id(key: str) -> str:
+    """Short, stable id for the document behind an index key."""
+    return key[:16]
+
+
+def _index_path(key: str) -> str:
+    return os.path.join(INDEX_DIR, key)
+
+
+def has_index(key: str) -> bool:
+    return os.path.exists(os.path.join(_index_path(key), "meta.json"))
+
+
+# -------------------
+# 3. Index files
+# -------------------
+def save_index(
+    key: str, vector_store: FAISS, summary: dict, lexical: Optional[BM25Index] = None
+) -> None:
+    """Persist a FAISS store (and its lexical index) under its key, atomically."""
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f".{key}-", dir=INDEX_DIR)
+    try:
+        vector_store.save_local(staging)
+        if lexical is not None:
+            with open(os.path.join(staging, "lexical.json"), "w", encoding="utf-8") as f:
+                json.dump(lexical.to_dict(), f)
+        with open(os.path.join(staging, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f)
+        try:
+            os.replace(staging, _index_path(key))
+        except OSError:
+            # Another worker published the same content first; theirs is identical.
+            shutil.rmtree(staging, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def load_index(key: str, embeddings: Any) -> Optional[FAISS]:
+    """
+    Open a saved index with the vectors memory-mapped instead of read into RAM.
+
+    The returned store is read-only: never add vectors to it directly.
+    """
+    if not has_index(key):
+        return None
+    import faiss
+
+    return FAISS.load_local(
+        _index_path(key),
+        embeddings,
+        allow_dangerous_deserialization=True,  # files are only ever written by save_index
+        io_flags=getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_READ_ONLY),
+    )
+
+
+def load_lexical(key: str) -> Optional[BM25Index]:
+    """Lexical index saved next to the vectors, or None for indexes built without one."""
+    try:
+        with open(os.path.join(_index_path(key), "lexical.json"), encoding="utf-8") as f:
+            return BM25Index.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def load_summary(key: str) -> dict:
+    try:
+        with open(os.path.join(_index_path(key), "meta.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+# -------------------
+# 4. Thread catalog
+# -------------------
+def add_document(thread_id: str, key: str, summary: dict) -> str:
+    """Attach an index to a thread's document set and return its doc id."""
+    doc_id = document_id(key)
+    with _LOCK:
+        conn = _catalog()
+        conn.execute(
+            "INSERT OR REPLACE INTO thread_documents (thread_id, doc_id, index_key, summary, added_at) VALUES (?, ?, ?, ?, ?)",
+            (str(thread_id), doc_id, key, json.dumps(summary), time.time()),
+        )
+        conn.commit()
+    return doc_id
+
+
+def remove_document(thread_id: str, doc_id: str) -> Optional[str]:
+    """Detach a document from a thread; returns its index key if it was attached."""
+    with _LOCK:
+        conn = _catalog()
+        row = conn.execute(
+            "SELECT index_key FROM thread_documents WHERE thread_id = ? AND doc_id = ?",
+            (str(thread_id), doc_id),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "DELETE FROM thread_documents WHERE thread_id = ? AND doc_id = ?",
+            (str(thread_id), doc_id),
+        )
+        conn.commit()
+    return row[0]
+
+
+def thread_documents(thread_id: str) -> list[tuple[str, str, dict]]:
+    """Return [(doc_id, index_key, summary), ...] for a thread, oldest first."""
+    with _LOCK:
+        rows = _catalog().execute(
+            "SELECT doc_id, index_key, summary FROM thread_documents WHERE thread_id = ? ORDER BY added_at",
+            (str(thread_id),),
+        ).fetchall()
+    return [(doc_id, key, json.loads(summary)) for doc_id, key, summary in rows]
+
+
+def index_in_use(key: str) -> bool:
+    with _LOCK:
+        row = _catalog().execute(
+            "SELECT 1 FROM thread_documents WHERE index_key = ? LIMIT 1", (key,)
+        ).fetchone()
+    return row is not None
+
+
+def delete_index(key: str) -> None:
+    shutil.rmtree(_index_path(key), ignore_errors=True)
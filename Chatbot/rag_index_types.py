@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import math
+import os
+from typing import Any
+
+import numpy as np
+
+# -------------------
+# 1. Settings
+# -------------------
+# RAG_INDEX_TYPE: "auto" picks flat or ivf by chunk count; "flat", "ivf" or
+# "pq" force one. Auto never picks pq: its recall is too low to be a default.
+RAG_INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "auto")
+RAG_IVF_MIN_CHUNKS = int(os.getenv("RAG_IVF_MIN_CHUNKS", "2000"))
+
+INDEX_TYPES = ("flat", "ivf", "pq")
+
+
+def index_settings() -> dict:
+    """Settings that change the saved index, folded into its content address."""
+    return {
+        "index_type": RAG_INDEX_TYPE,
+        "ivf_min_chunks": RAG_IVF_MIN_CHUNKS,
+    }
+
+
+def choose_index_type(n_vectors: int, requested: str = RAG_INDEX_TYPE) -> str:
+    """
+    flat: exact search, 4*d bytes per vector; right for ordinary PDFs.
+    ivf:  inverted lists over k-means cells holding 8-bit scalar-quantized
+          vectors; d bytes per vector (4x smaller), sub-linear queries.
+    pq:   inverted lists holding 4-bit fast-scan product-quantization codes;
+          d/8 bytes per vector (32x smaller before centroid overhead), but
+          recall@4 drops to ~0.54 against ~0.97 for ivf, so only an explicit
+          RAG_INDEX_TYPE=pq selects it.
+
+    bench_rag_index.py measures what each step costs in recall.
+    """
+    if requested in INDEX_TYPES:
+        index_type = requested
+    elif n_vectors >= RAG_IVF_MIN_CHUNKS:
+        index_type = "ivf"
+    else:
+        index_type = "flat"
+    # k-means needs enough points per centroid; tiny inputs always stay exact.
+    if index_type != "flat" and n_vectors < 256:
+        index_type = "flat"
+    return index_type
+
+
+# -------------------
+# 2. Builders
+# -------------------
+def _nlist(n_vectors: int) -> int:
+    # ~4*sqrt(n) cells, with at least 39 training points per cell.
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def _pq_subquantizers(dim: int) -> int:
+    """Largest even divisor of dim that is <= dim/4 (4 bits for every 4+ dims)."""
+    for m in range(max(2, dim // 4), 1, -1):
+        if dim % m == 0 and m % 2 == 0:
+            return m
+    raise ValueError(f"Cannot product-quantize {dim}-dimensional vectors.")
+
+
+def build_index(vectors: np.ndarray, index_type: str) -> Any:
+    """Train (if needed) and fill a FAISS index of the given type with L2 metric."""
+    import faiss
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n_vectors, dim = vectors.shape
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    else:
+        nlist = _nlist(n_vectors)
+        if index_type == "ivf":
+            description = f"IVF{nlist},SQ8"
+        elif index_type == "pq":
+            description = f"IVF{nlist},PQ{_pq_subquantizers(dim)}x4fs"
+        else:
+            raise ValueError(f"Unknown index type '{index_type}'.")
+        index = faiss.index_factory(dim, description, faiss.METRIC_L2)
+        index.train(vectors)
+        # Probe enough cells to keep recall close to exact search.
+        faiss.extract_index_ivf(index).nprobe = min(nlist, max(8, nlist // 8))
+    index.add(vectors)
+    return index
+
+
+def compress_store(vector_store: Any, index_type: str) -> str:
+    """
+    Replace a LangChain FAISS store's flat index with one of `index_type`.
+
+    Row order is preserved, so the docstore id mapping stays valid. Returns the
+    type actually used.
+    """
+    flat = vector_store.index
+    index_type = choose_index_type(flat.ntotal, index_type)
+    if index_type == "flat":
+        return index_type
+    vectors = flat.reconstruct_n(0, flat.ntotal)
+    vector_store.index = build_index(vectors, index_type)
+    return index_type
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+# Keep identifiers such as "PN-001-008", "4.2.1" or "ISO_9001" as one token and
+# also index their parts, so both exact and partial lookups match.
+_TOKEN_RE = re.compile(r"[0-9A-Za-z]+(?:[-_./][0-9A-Za-z]+)*")
+_PART_RE = re.compile(r"[0-9A-Za-z]+")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        token = match.group(0)
+        tokens.append(token)
+        parts = _PART_RE.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    """Small in-memory inverted index with Okapi BM25 scoring."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.lengths: Dict[str, int] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def add(self, chunk_id: str, text: str) -> None:
+        counts = Counter(tokenize(text))
+        for term, freq in counts.items():
+            self.postings[term][chunk_id] = freq
+        length = sum(counts.values())
+        self.lengths[chunk_id] = length
+        self.total_length += length
+
+    def add_many(self, items: Iterable[Tuple[str, str]]) -> None:
+        for chunk_id, text in items:
+            self.add(chunk_id, text)
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[str, float]]:
+        """Return up to k (chunk_id, score) pairs, best first."""
+        n_docs = len(self.lengths)
+        if not n_docs:
+            return []
+        avg_length = self.total_length / n_docs
+        scores: Dict[str, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, freq in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / avg_length)
+                scores[chunk_id] += idf * freq * (self.k1 + 1) / (freq + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def approx_bytes(self) -> int:
+        return sum(64 + 48 * len(postings) for postings in self.postings.values())
+
+    def to_dict(self) -> dict:
+        return {
+            "k1": self.k1,
+            "b": self.b,
+            "postings": self.postings,
+            "lengths": self.lengths,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BM25Index":
+        index = cls(k1=data.get("k1", 1.5), b=data.get("b", 0.75))
+        index.postings = defaultdict(dict, data["postings"])
+        index.lengths = dict(data["lengths"])
+        index.total_length = sum(index.lengths.values())
+        return index
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[str]], k: int = 60
+) -> List[Tuple[str, float]]:
+    """Fuse several ranked id lists into one, best first (Cormack et al., 2009)."""
+    fused: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            fused[item] += 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import io
+from typing import Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from pypdf import PdfReader
+
+# Kept free of LLM / vector-store imports so process-pool workers can import it
+# cheaply.
+
+
+def make_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", " ", ""],
+        # Lets rag_context stitch overlapping chunks of a page back together.
+        add_start_index=True,
+    )
+
+
+def count_pages(file_bytes: bytes) -> int:
+    return len(PdfReader(io.BytesIO(file_bytes)).pages)
+
+
+def read_pages(
+    file_bytes: bytes,
+    source: str,
+    doc_id: str,
+    start: int = 0,
+    stop: Optional[int] = None,
+) -> Iterator[Tuple[int, Document]]:
+    """Yield (total_pages, page Document) lazily from an in-memory buffer."""
+    reader = PdfReader(io.BytesIO(file_bytes))
+    total_pages = len(reader.pages)
+    for page_number in range(start, min(stop or total_pages, total_pages)):
+        yield total_pages, Document(
+            page_content=reader.pages[page_number].extract_text() or "",
+            metadata={
+                "source": source,
+                "doc_id": doc_id,
+                "page": page_number,
+                "total_pages": total_pages,
+            },
+        )
+
+
+def split_pages(
+    file_bytes: bytes, source: str, doc_id: str, chunk_size: int, chunk_overlap: int
+) -> Iterator[Tuple[int, List[Document]]]:
+    """Yield (total_pages, chunks of one page) for every page, in order."""
+    splitter = make_splitter(chunk_size, chunk_overlap)
+    for total_pages, page in read_pages(file_bytes, source, doc_id):
+        yield total_pages, splitter.split_documents([page])
+
+
+def parse_page_range(
+    file_bytes: bytes,
+    source: str,
+    doc_id: str,
+    start: int,
+    stop: int,
+    chunk_size: int,
+    chunk_overlap: int,
+) -> List[List[Document]]:
+    """Process-pool entry point: parse and split pages [start, stop)."""
+    splitter = make_splitter(chunk_size, chunk_overlap)
+    return [
+        splitter.split_documents([page])
+        for _, page in read_pages(file_bytes, source, doc_id, start, stop)
+    ]
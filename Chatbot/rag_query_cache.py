@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from typing import Any, List, Sequence
+
+from lru_cache import LRUCache
+
+# -------------------
+# 1. Settings
+# -------------------
+RAG_QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", "2048"))
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a query, used as a cache key."""
+    return " ".join(query.lower().split())
+
+
+def document_set_version(index_keys: Sequence[str]) -> str:
+    """Changes whenever a document is added to or removed from a thread."""
+    return hashlib.sha1("|".join(sorted(index_keys)).encode("utf-8")).hexdigest()
+
+
+# -------------------
+# 2. Query-vector cache
+# -------------------
+class CachedQueryEmbeddings:
+    """Wraps an Embeddings object so repeated queries skip the network round trip."""
+
+    def __init__(self, embeddings: Any, model: str, cache: LRUCache) -> None:
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+
+    def embed_query(self, text: str) -> List[float]:
+        key = (self.model, normalize_query(text))
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put(key, vector)
+        return vector
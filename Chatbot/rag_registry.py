@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+# -------------------
+# 1. Settings
+# -------------------
+RAG_MEMORY_BUDGET_MB = int(os.getenv("RAG_MEMORY_BUDGET_MB", "512"))
+RAG_INDEX_TTL_SECONDS = int(os.getenv("RAG_INDEX_TTL_SECONDS", "3600"))
+
+
+def estimate_store_bytes(vector_store: Any) -> int:
+    """Approximate resident size of a LangChain FAISS store (vectors + chunk text)."""
+    index = vector_store.index
+    try:
+        code_size = index.sa_code_size()
+    except Exception:
+        code_size = index.d * 4
+    size = index.ntotal * code_size
+
+    docs = getattr(vector_store.docstore, "_dict", {})
+    for doc in docs.values():
+        size += len(doc.page_content) + 64 * len(doc.metadata)
+    # Python dict/Document overhead per chunk, roughly.
+    size += 256 * len(docs)
+    return size
+
+
+# -------------------
+# 2. Registry
+# -------------------
+@dataclass
+class _Entry:
+    value: Any
+    size: int
+    last_used: float
+
+
+class IndexRegistry:
+    """
+    LRU + TTL cache of loaded vector stores with an approximate memory budget.
+
+    Only stores that can be reloaded from durable storage belong here; an
+    evicted store is simply dropped and `get_or_load` brings it back.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = RAG_MEMORY_BUDGET_MB * 1024 * 1024,
+        ttl_seconds: float = RAG_INDEX_TTL_SECONDS,
+        sizer: Callable[[Any], int] = estimate_store_bytes,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.sizer = sizer
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.evictions = 0
+        self.loads = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry.last_used = time.monotonic()
+            self._entries.move_to_end(key)
+            return entry.value
+
+    def get_or_load(self, key: str, loader: Callable[[], Optional[Any]]) -> Optional[Any]:
+        value = self.get(key)
+        if value is not None:
+            return value
+        value = loader()
+        if value is not None:
+            with self._lock:
+                self.loads += 1
+            self.put(key, value)
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        size = self.sizer(value)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = _Entry(value, size, time.monotonic())
+            self._bytes += size
+            self._shrink(keep=key)
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._drop(key)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "loads": self.loads,
+            }
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _expire(self) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.last_used >= cutoff:
+                break
+            self._drop(key)
+            self.evictions += 1
+
+    def _shrink(self, keep: str) -> None:
+        self._expire()
+        # Always keep the entry just added, even if it alone exceeds the budget.
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            self._drop(key)
+            self.evictions += 1
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+
+from rag_lexical import BM25Index, reciprocal_rank_fusion
+from rag_registry import estimate_store_bytes
+
+
+@dataclass
+class DocumentIndex:
+    """Vector and lexical indexes for one PDF, keyed by the same chunk ids."""
+
+    vectors: FAISS
+    lexical: BM25Index
+
+    @classmethod
+    def from_vectors(cls, vectors: FAISS) -> "DocumentIndex":
+        """Build the lexical side from the chunks already in a FAISS docstore."""
+        lexical = BM25Index()
+        for chunk_id in vectors.index_to_docstore_id.values():
+            doc = vectors.docstore.search(chunk_id)
+            if isinstance(doc, Document):
+                lexical.add(chunk_id, doc.page_content)
+        return cls(vectors, lexical)
+
+    def approx_bytes(self) -> int:
+        return estimate_store_bytes(self.vectors) + self.lexical.approx_bytes()
+
+
+class ThreadRetriever:
+    """
+    Searches every document index attached to a thread and merges the hits.
+
+    Each document keeps its own (shared, content-addressed) index, so adding or
+    removing a document never rebuilds the others. The query is embedded once;
+    dense hits are merged by distance, lexical hits by BM25 score, and the two
+    rankings are combined with reciprocal-rank fusion so exact identifiers
+    (part numbers, clause ids, names) surface even when embeddings miss them.
+    """
+
+    def __init__(
+        self,
+        indexes: Sequence[Tuple[str, DocumentIndex]],
+        embeddings: Any,
+        k: int = 4,
+        fetch_k: int = 20,
+    ) -> None:
+        self.indexes = list(indexes)
+        self.embeddings = embeddings
+        self.k = k
+        self.fetch_k = max(fetch_k, k)
+
+    def invoke(self, query: str, doc_ids: Optional[Sequence[str]] = None) -> List[Document]:
+        indexes = [
+            (doc_id, index)
+            for doc_id, index in self.indexes
+            if not doc_ids or doc_id in doc_ids
+        ]
+        if not indexes:
+            return []
+
+        found: Dict[Tuple[str, str], Document] = {}
+        dense = self._dense_ranking(query, indexes, found)
+        lexical = self._lexical_ranking(query, indexes, found)
+
+        fused = reciprocal_rank_fusion([dense, lexical])
+        return [found[key] for key, _ in fused[: self.k]]
+
+    def _dense_ranking(self, query, indexes, found) -> List[Tuple[str, str]]:
+        vector = self.embeddings.embed_query(query)
+        scored = []
+        for doc_id, index in indexes:
+            store = index.vectors
+            higher_is_better = store.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT
+            for doc, score in store.similarity_search_with_score_by_vector(
+                vector, k=self.fetch_k
+            ):
+                key = (doc_id, doc.id)
+                found.setdefault(key, _tag(doc, doc_id))
+                scored.append((-score if higher_is_better else score, key))
+        scored.sort(key=lambda item: item[0])
+        return [key for _, key in scored[: self.fetch_k]]
+
+    def _lexical_ranking(self, query, indexes, found) -> List[Tuple[str, str]]:
+        scored = []
+        for doc_id, index in indexes:
+            for chunk_id, score in index.lexical.search(query, k=self.fetch_k):
+                key = (doc_id, chunk_id)
+                if key not in found:
+                    doc = index.vectors.docstore.search(chunk_id)
+                    if not isinstance(doc, Document):
+                        continue
+                    found[key] = _tag(doc, doc_id)
+                scored.append((score, key))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [key for _, key in scored[: self.fetch_k]]
+
+
+def _tag(doc: Document, doc_id: str) -> Document:
+    return Document(page_content=doc.page_content, metadata={**doc.metadata, "doc_id": doc_id})
+
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_metadata,
+)
+
+from lru_cache import LRUCache
+
+# -------------------
+# 1. Settings
+# -------------------
+# Threads whose newest root checkpoint is kept deserialized; 0 disables.
+LATEST_STATE_CACHE_SIZE = int(os.getenv("LATEST_STATE_CACHE_SIZE", "256"))
+
+# Index-only probe used to validate a cached entry: checkpoint rows are
+# immutable once written, so an unchanged newest id means an unchanged
+# checkpoint, whichever worker wrote it. Pending writes are not cached; they
+# are re-read on every hit (usually zero rows).
+LATEST_ID_SQL = (
+    "SELECT checkpoint_id FROM checkpoints "
+    "WHERE thread_id = ? AND checkpoint_ns = '' ORDER BY checkpoint_id DESC LIMIT 1"
+)
+
+
+def is_latest_root(config: RunnableConfig) -> bool:
+    """True for "newest checkpoint of the root graph" reads (get_state, graph start)."""
+    configurable = config.get("configurable", {})
+    return not configurable.get("checkpoint_id") and configurable.get("checkpoint_ns", "") == ""
+
+
+def _detached(t: CheckpointTuple) -> CheckpointTuple:
+    """Fresh containers around shared values, so callers cannot edit the cached entry."""
+    channel_values = {
+        key: list(value) if isinstance(value, list) else value
+        for key, value in t.checkpoint.get("channel_values", {}).items()
+    }
+    return t._replace(
+        checkpoint={**t.checkpoint, "channel_values": channel_values},
+        metadata=dict(t.metadata or {}),
+        pending_writes=[],
+    )
+
+
+# -------------------
+# 2. Cache
+# -------------------
+class LatestStateCache:
+    """Newest root checkpoint per thread, updated on write and validated on read."""
+
+    def __init__(self, maxsize: int = LATEST_STATE_CACHE_SIZE) -> None:
+        self._entries = LRUCache(maxsize)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # entries found but superseded (another worker, or a failed commit)
+        self.stale = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._entries.maxsize > 0
+
+    def get(self, thread_id: str, latest_id: str) -> Optional[CheckpointTuple]:
+        t = self._entries.get(thread_id)
+        hit = t is not None and t.config["configurable"]["checkpoint_id"] == latest_id
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self.stale += t is not None
+        return _detached(t) if hit else None
+
+    def put(self, t: CheckpointTuple) -> None:
+        if self.enabled:
+            self._entries.put(str(t.config["configurable"]["thread_id"]), _detached(t))
+
+    def record_put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        saved: RunnableConfig,
+    ) -> None:
+        """Cache what a root-graph put just wrote, shaped as get_tuple would return it."""
+        if not self.enabled or saved["configurable"].get("checkpoint_ns", "") != "":
+            return
+        parent_id = config["configurable"].get("checkpoint_id")
+        parent_config = (
+            {"configurable": {**saved["configurable"], "checkpoint_id": parent_id}} if parent_id else None
+        )
+        # The JSON round trip matches what the savers store for metadata.
+        stored_metadata = json.loads(json.dumps(get_checkpoint_metadata(config, metadata), ensure_ascii=False))
+        self.put(CheckpointTuple(saved, checkpoint, stored_metadata, parent_config, []))
+
+    def discard(self, thread_id: str) -> None:
+        self._entries.discard_where(lambda key: key == str(thread_id))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": self._entries.stats()["entries"],
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,104 @@
+import threading
+from typing import Annotated, TypedDict
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import add_messages
+
+from conversation_summary import BackgroundSummarizer
+
+
+class ChatState(TypedDict):
+    messages: Annotated[list[BaseMessage], add_messages]
+    summary: str
+
+
+class SummaryLLM:
+    """Answers every summary prompt with a fixed text, optionally after a gate opens."""
+
+    def __init__(self) -> None:
+        self.gate = threading.Event()
+        self.gate.set()
+        self.answered = threading.Event()
+
+    def invoke(self, messages):
+        self.gate.wait(10)
+        self.answered.set()
+        return AIMessage(content="summary")
+
+
+def build(summarizer: BackgroundSummarizer, in_node: threading.Event):
+    """A one-node chat graph that schedules a fold and then waits on `in_node`."""
+
+    def chat_node(state: ChatState, config: RunnableConfig):
+        response = AIMessage(content=f"answer {len(state['messages'])}")
+        summarizer.schedule(
+            config["configurable"]["thread_id"], state.get("summary", ""), [*state["messages"], response]
+        )
+        in_node.wait(10)
+        return {"messages": [response]}
+
+    graph = StateGraph(ChatState)
+    graph.add_node("chat_node", chat_node)
+    graph.add_edge(START, "chat_node")
+    graph.add_edge("chat_node", END)
+    return summarizer.attach(graph.compile(checkpointer=InMemorySaver()))
+
+
+def seed(chatbot, config, turns: int) -> None:
+    history = []
+    for n in range(turns):
+        history += [HumanMessage(content=f"q{n}", id=f"h{n}"), AIMessage(content=f"a{n}", id=f"a{n}")]
+    chatbot.update_state(config, {"messages": history, "summary": ""}, as_node="chat_node")
+
+
+def test_fold_ready_mid_run_commits_after_the_run_ends():
+    llm = SummaryLLM()
+    summarizer = BackgroundSummarizer(llm, trigger=4, keep=2)
+    in_node = threading.Event()
+    chatbot = build(summarizer, in_node)
+    config = {"configurable": {"thread_id": "t1"}}
+    seed(chatbot, config, turns=3)
+
+    run = threading.Thread(target=chatbot.invoke, args=({"messages": [HumanMessage(content="q3", id="h3")]}, config))
+    run.start()
+    assert llm.answered.wait(10)
+    summarizer.wait(10)
+    # The fold is ready while the run still has its last checkpoint to write.
+    assert summarizer.stats()["parked"] == 1
+
+    in_node.set()
+    run.join(10)
+    summarizer.wait(10)
+    stats = summarizer.stats()
+    assert (stats["committed"], stats["discarded"], stats["parked"], stats["running"]) == (1, 0, 0, 0)
+
+    state = chatbot.get_state(config).values
+    assert state["summary"] == "summary"
+    # Only the folded prefix is gone; the run's own answer survived the fold.
+    assert [m.content for m in state["messages"]] == ["q3", "answer 7"]
+    summarizer.close()
+
+
+def test_fold_is_dropped_when_a_newer_turn_changed_the_thread():
+    llm = SummaryLLM()
+    llm.gate.clear()
+    summarizer = BackgroundSummarizer(llm, trigger=4, keep=2)
+    in_node = threading.Event()
+    in_node.set()
+    chatbot = build(summarizer, in_node)
+    config = {"configurable": {"thread_id": "t2"}}
+    seed(chatbot, config, turns=3)
+
+    chatbot.invoke({"messages": [HumanMessage(content="q3", id="h3")]}, config)
+    # Another writer folds the same messages before the background job commits.
+    chatbot.update_state(config, {"summary": "someone else's"}, as_node="chat_node")
+    llm.gate.set()
+    summarizer.wait(10)
+
+    stats = summarizer.stats()
+    assert (stats["committed"], stats["discarded"]) == (0, 1)
+    assert chatbot.get_state(config).values["summary"] == "someone else's"
+    summarizer.close()
@@ -0,0 +1,45 @@
+import threading
+import time
+
+from ingest_jobs import IngestionJobs
+
+
+def wait_for(predicate, timeout: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_cancel_after_the_last_page_rolls_the_document_back():
+    indexed = threading.Event()
+    cancelled = threading.Event()
+    removed = []
+
+    def ingest(file_bytes, thread_id, filename, on_progress=None, page_chunks=None):
+        on_progress(3, 3)
+        # Every page is in; the cancel lands before the job reports "done".
+        indexed.set()
+        cancelled.wait(10)
+        return {"doc_id": "doc-1", "documents": 3}
+
+    jobs = IngestionJobs(
+        ingest,
+        settings=lambda: (1000, 100),
+        document_id=lambda file_bytes: "doc-1",
+        remove_document=lambda thread_id, doc_id: removed.append((thread_id, doc_id)) or True,
+    )
+    try:
+        job_id = jobs.submit(b"%PDF", "t1", "a.pdf")
+        assert indexed.wait(10)
+        assert jobs.cancel(job_id)
+        cancelled.set()
+
+        assert wait_for(lambda: jobs.status(job_id)["state"] != "running")
+        status = jobs.status(job_id)
+        assert (status["state"], status["summary"]) == ("cancelled", None)
+        assert removed == [("t1", "doc-1")]
+    finally:
+        jobs.shutdown()
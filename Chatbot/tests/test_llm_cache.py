@@ -0,0 +1,49 @@
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from llm_cache import LLMResponseCache, _prompt_keys
+
+
+def thread_history(thread: str):
+    """The same conversation as two threads store it: only ids and metadata differ."""
+    return [
+        SystemMessage(content="You are helpful.", id=f"{thread}-sys"),
+        HumanMessage(content="What is in the report?", id=f"{thread}-h1"),
+        AIMessage(
+            content="",
+            id=f"run-{thread}",
+            tool_calls=[{"name": "rag_tool", "args": {"query": "report"}, "id": f"call-{thread}"}],
+            response_metadata={"finish_reason": "STOP", "model_name": f"gemini-{thread}"},
+            usage_metadata={"input_tokens": 10, "output_tokens": len(thread), "total_tokens": 10 + len(thread)},
+        ),
+        ToolMessage(content="Revenue grew 4%.", tool_call_id=f"call-{thread}", id=f"{thread}-t1"),
+        AIMessage(content="Revenue grew 4%.", id=f"run-{thread}-2"),
+        HumanMessage(content="And costs?", id=f"{thread}-h2"),
+    ]
+
+
+def test_same_question_in_two_threads_gets_the_same_key():
+    a = _prompt_keys(dumps(thread_history("thread-a")))
+    b = _prompt_keys(dumps(thread_history("thread-b")))
+    assert a == b
+    assert a[2] == "and costs?"
+
+
+def test_different_content_gets_a_different_key():
+    history = thread_history("thread-a")
+    other = [*history[:-1], HumanMessage(content="And margins?", id="thread-a-h2")]
+    assert _prompt_keys(dumps(history))[0] != _prompt_keys(dumps(other))[0]
+
+
+def test_second_thread_is_served_from_the_cache(tmp_path):
+    cache = LLMResponseCache(path=str(tmp_path / "llm_cache.db"))
+    llm = GenericFakeChatModel(messages=iter([AIMessage(content="Costs fell 2%.")]), cache=cache)
+
+    first = llm.invoke(thread_history("thread-a"))
+    # The fake model has a single answer; a miss here would raise StopIteration.
+    second = llm.invoke(thread_history("thread-b"))
+
+    assert first.content == second.content == "Costs fell 2%."
+    assert cache.stats()["exact_hits"] == 1
+    assert cache.stats()["misses"] == 1
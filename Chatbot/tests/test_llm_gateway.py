@@ -0,0 +1,149 @@
+import threading
+import time
+
+import pytest
+
+from llm_gateway import FairLimiter, GatewayTimeout, LLMGateway
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_waiters_are_granted_round_robin_per_user():
+    limiter = FairLimiter(rate=0, burst=1, max_concurrency=1)
+    limiter.acquire("holder")
+    order = []
+
+    def waiter(user):
+        limiter.acquire(user)
+        order.append(user)
+        limiter.release()
+
+    threads = []
+    # A heavy user queues six calls before a light user queues two.
+    for user in ["heavy"] * 6 + ["light"] * 2:
+        queued = limiter.snapshot()["queued"]
+        thread = threading.Thread(target=waiter, args=(user,))
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: limiter.snapshot()["queued"] == queued + 1)
+
+    limiter.release()
+    for thread in threads:
+        thread.join(5)
+
+    assert order == ["heavy", "light", "heavy", "light", "heavy", "heavy", "heavy", "heavy"]
+    assert limiter.snapshot() == {"in_flight": 0, "queued": 0, "queued_users": 0}
+
+
+def test_token_bucket_allows_a_burst_then_the_steady_rate():
+    limiter = FairLimiter(rate=20, burst=5, max_concurrency=100)
+    waits = []
+    started = time.monotonic()
+    for _ in range(15):
+        waits.append(limiter.acquire("user"))
+        limiter.release()
+    elapsed = time.monotonic() - started
+
+    assert max(waits[:5]) < 0.02  # the burst is free
+    # The other 10 calls need 10 tokens at 20/s.
+    assert 0.4 <= elapsed < 1.5
+    assert not limiter.try_acquire()
+
+
+def test_queue_timeout_raises_and_leaves_the_queue_clean():
+    limiter = FairLimiter(rate=0, burst=1, max_concurrency=1)
+    limiter.acquire("holder")
+    with pytest.raises(GatewayTimeout):
+        limiter.acquire("user", timeout=0.05)
+    assert limiter.snapshot()["queued"] == 0
+    limiter.release()
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+def test_retryable_errors_are_retried_with_backoff():
+    gateway = LLMGateway(rate=0, max_concurrency=2, max_retries=3, retry_base=0.001, retry_max=0.01)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RateLimited()
+        return "ok"
+
+    def bad_request():
+        raise ValueError("bad request")
+
+    assert gateway.call("user", flaky) == "ok"
+    assert gateway.stats()["retries"] == 2
+    with pytest.raises(ValueError):
+        gateway.call("user", bad_request)
+    assert gateway.stats()["retries"] == 2  # not retryable
+
+
+def test_slow_call_is_hedged_and_the_faster_copy_wins():
+    gateway = LLMGateway(rate=0, max_concurrency=4, hedge="p95", hedge_min_samples=5)
+    for _ in range(5):
+        gateway.call("user", lambda: time.sleep(0.01))
+    attempts = []
+
+    def first_attempt_stalls():
+        attempts.append(1)
+        if len(attempts) == 1:
+            time.sleep(1.0)
+            return "slow"
+        return "fast"
+
+    started = time.monotonic()
+    assert gateway.call("user", first_attempt_stalls) == "fast"
+    assert time.monotonic() - started < 0.5
+    stats = gateway.stats()
+    assert stats["hedges"] == 1
+    assert stats["hedge_wins"] == 1
+
+
+def test_no_hedge_without_a_free_slot():
+    gateway = LLMGateway(rate=0, max_concurrency=1, hedge="p95", hedge_min_samples=5)
+    for _ in range(5):
+        gateway.call("user", lambda: time.sleep(0.01))
+
+    assert gateway.call("user", lambda: time.sleep(0.1) or "done") == "done"
+    assert gateway.stats()["hedges"] == 0
+
+
+@pytest.mark.parametrize("hedge", ["off", "p95"])
+def test_hedging_keeps_the_round_robin_order(hedge):
+    gateway = LLMGateway(rate=0, max_concurrency=1, hedge=hedge, hedge_min_samples=5, queue_timeout=10)
+    for _ in range(5):
+        gateway.call("warmup", lambda: time.sleep(0.005))
+    order = []
+
+    def provider_call(user):
+        order.append(user)
+        time.sleep(0.02)  # slower than the warm-up p95, so a hedge would be due
+
+    gateway.limiter.acquire("holder")
+    threads = []
+    for user in ["heavy"] * 6 + ["light"]:
+        queued = gateway.limiter.snapshot()["queued"]
+        thread = threading.Thread(
+            target=gateway.call, args=(user, lambda user=user: provider_call(user)), daemon=True
+        )
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: gateway.limiter.snapshot()["queued"] == queued + 1)
+
+    gateway.limiter.release()
+    for thread in threads:
+        thread.join(5)
+
+    assert order == ["heavy", "light", "heavy", "heavy", "heavy", "heavy", "heavy"]
+    # With one slot and callers waiting there is never room for a backup.
+    assert gateway.stats()["hedges"] == 0
@@ -0,0 +1,110 @@
+from typing import Any, List
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import tool
+
+from prompt_prefix import StaticPrefix, tool_schemas
+
+SYSTEM_PROMPT = "You are a helpful assistant. Call `lookup` for questions about the uploaded PDFs."
+
+
+@tool
+def lookup(query: str, config: RunnableConfig) -> str:
+    """Search this thread's documents."""
+    return f"{config['configurable']['thread_id']}: {query}"
+
+
+class RecordingChatModel(BaseChatModel):
+    """Records, per call, the serialized system prefix and the kwargs it was bound with."""
+
+    calls: List[dict] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "recording"
+
+    def bind_tools(self, tools, **kwargs: Any):
+        return self.bind(tools=tool_schemas(tools), **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        system = [m for m in messages if m.type == "system"]
+        self.calls.append(
+            {
+                "prefix": dumps(system) + dumps(kwargs.get("tools")),
+                "cached_content": kwargs.get("cached_content"),
+                "messages": len(messages),
+            }
+        )
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="ok"))])
+
+
+def chat(prefix: StaticPrefix, thread_id: str, turns: int) -> None:
+    history = []
+    for turn in range(turns):
+        history.append(HumanMessage(content=f"{thread_id} question {turn}"))
+        history.append(prefix.invoke(history, config={"configurable": {"thread_id": thread_id}}))
+
+
+def test_prefix_is_byte_identical_across_threads_and_turns():
+    llm = RecordingChatModel(calls=[])
+    prefix = StaticPrefix(llm, SYSTEM_PROMPT, [lookup])
+
+    chat(prefix, "thread-a", 3)
+    chat(prefix, "thread-b", 2)
+
+    prefixes = {call["prefix"] for call in llm.calls}
+    assert len(llm.calls) == 5
+    assert len(prefixes) == 1
+    assert "thread-a" not in prefixes.pop()
+    # The thread_id reaches the tool through its config, not through the schema.
+    assert "config" not in dumps(tool_schemas([lookup]))
+    assert prefix.stats()["inline_calls"] == 5
+
+
+def test_cached_content_is_created_once_and_replaces_the_prefix():
+    created = []
+
+    def create_cache(model, messages, tools, ttl):
+        created.append((dumps(messages), ttl))
+        return "cachedContents/prefix"
+
+    llm = RecordingChatModel(calls=[])
+    prefix = StaticPrefix(llm, SYSTEM_PROMPT, [lookup], context_cache="gemini", min_tokens=0, create_cache=create_cache)
+
+    chat(prefix, "thread-a", 2)
+    chat(prefix, "thread-b", 2)
+
+    assert len(created) == 1
+    assert all(call["cached_content"] == "cachedContents/prefix" for call in llm.calls)
+    # Cached content already holds the system prompt and tools.
+    assert all(call["prefix"] == dumps([]) + dumps(None) for call in llm.calls)
+    assert prefix.stats()["cached_calls"] == 4
+
+
+def test_failed_cache_create_falls_back_to_the_inline_prefix():
+    def create_cache(model, messages, tools, ttl):
+        raise RuntimeError("cached content too small")
+
+    llm = RecordingChatModel(calls=[])
+    prefix = StaticPrefix(llm, SYSTEM_PROMPT, [lookup], context_cache="gemini", min_tokens=0, create_cache=create_cache)
+
+    chat(prefix, "thread-a", 2)
+
+    stats = prefix.stats()
+    # One failed create, then no retry until REFRESH_MARGIN_SECONDS have passed.
+    assert stats["cache_failures"] == 1
+    assert stats["inline_calls"] == 2
+    assert len({call["prefix"] for call in llm.calls}) == 1
+
+
+def test_missing_gemini_support_sends_the_prefix_inline(monkeypatch):
+    import prompt_prefix
+
+    monkeypatch.setattr(prompt_prefix, "gemini_create_context_cache", lambda: None)
+    prefix = StaticPrefix(RecordingChatModel(calls=[]), SYSTEM_PROMPT, [lookup], context_cache="gemini", min_tokens=0)
+
+    assert prefix.context_cache == "off"
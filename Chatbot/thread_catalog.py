@@ -0,0 +1,316 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata
+
+from conversation_window import Cursor
+from delta_checkpoints import AsyncDeltaSqliteSaver, DeltaSqliteSaver
+
+# A history cursor handed to a frontend pins its checkpoint for this long
+# (renewed on every page read), so checkpoint_compactor does not prune it.
+HISTORY_CURSOR_TTL_SECONDS = int(os.getenv("HISTORY_CURSOR_TTL_SECONDS", "86400"))
+
+# One row per conversation, upserted on every root-graph checkpoint write, so
+# listing threads is an indexed read instead of a scan that deserializes every
+# checkpoint ever written.
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS thread_catalog (
+    thread_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    last_updated TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    title TEXT,
+    owner TEXT
+);
+CREATE INDEX IF NOT EXISTS thread_catalog_recent ON thread_catalog (last_updated, thread_id);
+CREATE INDEX IF NOT EXISTS thread_catalog_owner ON thread_catalog (owner, last_updated, thread_id);
+"""
+CURSOR_PINS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cursor_pins (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+"""
+
+PIN_SQL = """
+INSERT INTO cursor_pins (thread_id, checkpoint_ns, checkpoint_id, expires_at) VALUES (?, '', ?, ?)
+ON CONFLICT (thread_id, checkpoint_ns, checkpoint_id) DO UPDATE SET
+    expires_at = MAX(cursor_pins.expires_at, excluded.expires_at)
+"""
+
+UPSERT_SQL = """
+INSERT INTO thread_catalog (thread_id, created_at, last_updated, message_count, title, owner)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (thread_id) DO UPDATE SET
+    last_updated = MAX(thread_catalog.last_updated, excluded.last_updated),
+    message_count = excluded.message_count,
+    title = COALESCE(thread_catalog.title, excluded.title),
+    owner = COALESCE(thread_catalog.owner, excluded.owner)
+"""
+
+# Threads that have checkpoints but no catalog row: databases written before the
+# catalog existed, or by a plain SqliteSaver.
+MISSING_THREADS_SQL = """
+SELECT DISTINCT thread_id FROM checkpoints
+WHERE checkpoint_ns = '' AND thread_id NOT IN (SELECT thread_id FROM thread_catalog)
+"""
+
+BOUNDARY_CHECKPOINT_SQL = """
+SELECT type, checkpoint, metadata FROM checkpoints
+WHERE thread_id = ? AND checkpoint_ns = ''
+ORDER BY checkpoint_id {order} LIMIT 1
+"""
+
+TITLE_MAX_CHARS = 60
+
+
+# -------------------
+# 1. Row derivation
+# -------------------
+def _title(messages: Sequence[Any]) -> Optional[str]:
+    """First user message, trimmed to a sidebar-sized title."""
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            text = " ".join(str(message.text).split())
+            if text:
+                return text if len(text) <= TITLE_MAX_CHARS else text[: TITLE_MAX_CHARS - 1] + "…"
+    return None
+
+
+def catalog_row(
+    thread_id: str, checkpoint: Checkpoint, metadata: CheckpointMetadata, config: RunnableConfig
+) -> Tuple[str, str, str, int, Optional[str], Optional[str]]:
+    """(thread_id, created_at, last_updated, message_count, title, owner) for one write."""
+    messages = checkpoint.get("channel_values", {}).get("messages")
+    if not isinstance(messages, list):
+        messages = []
+    owner = config.get("configurable", {}).get("user_id") or (metadata or {}).get("user_id")
+    return (
+        str(thread_id),
+        checkpoint["ts"],
+        checkpoint["ts"],
+        len(messages),
+        _title(messages),
+        str(owner) if owner is not None else None,
+    )
+
+
+def pin_row(thread_id: str, cursor: Cursor) -> Tuple[str, str, float]:
+    return str(thread_id), cursor[0], time.time() + HISTORY_CURSOR_TTL_SECONDS
+
+
+def _row_from_checkpoints(thread_id: str, first: tuple, latest: tuple, serde: Any) -> tuple:
+    created = serde.loads_typed((first[0], first[1]))
+    checkpoint = serde.loads_typed((latest[0], latest[1]))
+    metadata = json.loads(latest[2]) if latest[2] else {}
+    row = catalog_row(thread_id, checkpoint, metadata, {})
+    return (row[0], created["ts"], *row[2:])
+
+
+def _page_query(limit: int, before: Optional[Tuple[str, str]], owner: Optional[str]) -> Tuple[str, list]:
+    clauses, params = [], []
+    if owner is not None:
+        clauses.append("owner = ?")
+        params.append(owner)
+    if before is not None:
+        clauses.append("(last_updated, thread_id) < (?, ?)")
+        params.extend(before)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    params.append(limit)
+    return (
+        "SELECT thread_id, created_at, last_updated, message_count, title, owner "
+        f"FROM thread_catalog {where} ORDER BY last_updated DESC, thread_id DESC LIMIT ?",
+        params,
+    )
+
+
+_COLUMNS = ("thread_id", "created_at", "last_updated", "message_count", "title", "owner")
+
+
+def _rows_to_dicts(rows: Iterable[tuple]) -> List[dict]:
+    return [dict(zip(_COLUMNS, row)) for row in rows]
+
+
+def page_cursor(page: List[dict]) -> Optional[Tuple[str, str]]:
+    """Cursor for the page after `page` (pass as `before=`), or None at the end."""
+    if not page:
+        return None
+    return page[-1]["last_updated"], page[-1]["thread_id"]
+
+
+# -------------------
+# 2. Sync saver
+# -------------------
+class CatalogSqliteSaver(DeltaSqliteSaver):
+    """SqliteSaver that keeps `thread_catalog` current as checkpoints are written."""
+
+    def setup(self) -> None:
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.executescript(CATALOG_SCHEMA)
+        self.conn.executescript(CURSOR_PINS_SCHEMA)
+        self._backfill()
+        self.conn.commit()
+
+    def _backfill(self) -> None:
+        missing = [row[0] for row in self.conn.execute(MISSING_THREADS_SQL)]
+        for thread_id in missing:
+            first = self.conn.execute(BOUNDARY_CHECKPOINT_SQL.format(order="ASC"), (thread_id,)).fetchone()
+            latest = self.conn.execute(BOUNDARY_CHECKPOINT_SQL.format(order="DESC"), (thread_id,)).fetchone()
+            self.conn.execute(UPSERT_SQL, _row_from_checkpoints(thread_id, first, latest, self.serde))
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        if config["configurable"].get("checkpoint_ns", "") == "":
+            with self.cursor() as cur:
+                cur.execute(
+                    UPSERT_SQL,
+                    catalog_row(config["configurable"]["thread_id"], checkpoint, metadata, config),
+                )
+        return saved
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM thread_catalog WHERE thread_id = ?", (str(thread_id),))
+            cur.execute("DELETE FROM cursor_pins WHERE thread_id = ?", (str(thread_id),))
+
+    def message_window(
+        self, thread_id: str, limit: int, before: Optional[Cursor] = None
+    ) -> Tuple[List[BaseMessage], Optional[Cursor]]:
+        messages, cursor = super().message_window(thread_id, limit, before)
+        if cursor is not None:
+            with self.cursor() as cur:
+                cur.execute(PIN_SQL, pin_row(thread_id, cursor))
+        return messages, cursor
+
+    def list_threads(
+        self,
+        limit: int = 50,
+        before: Optional[Tuple[str, str]] = None,
+        owner: Optional[str] = None,
+    ) -> List[dict]:
+        """Most recently updated threads first; page with `before=page_cursor(page)`."""
+        sql, params = _page_query(limit, before, owner)
+        with self.cursor(transaction=False) as cur:
+            return _rows_to_dicts(cur.execute(sql, params).fetchall())
+
+    def thread_ids(self, owner: Optional[str] = None) -> List[str]:
+        """Every thread id, least recently updated first (the order the sidebars expect)."""
+        sql = "SELECT thread_id FROM thread_catalog"
+        params: list = []
+        if owner is not None:
+            sql += " WHERE owner = ?"
+            params.append(owner)
+        sql += " ORDER BY last_updated, thread_id"
+        with self.cursor(transaction=False) as cur:
+            return [row[0] for row in cur.execute(sql, params)]
+
+
+# -------------------
+# 3. Async saver
+# -------------------
+class AsyncCatalogSqliteSaver(AsyncDeltaSqliteSaver):
+    """AsyncSqliteSaver counterpart of CatalogSqliteSaver."""
+
+    _catalog_ready = False
+
+    async def setup(self) -> None:
+        await super().setup()
+        if self._catalog_ready:
+            return
+        async with self.lock:
+            if self._catalog_ready:
+                return
+            await self.conn.executescript(CATALOG_SCHEMA)
+            await self.conn.executescript(CURSOR_PINS_SCHEMA)
+            async with self.conn.execute(MISSING_THREADS_SQL) as cur:
+                missing = [row[0] for row in await cur.fetchall()]
+            for thread_id in missing:
+                async with self.conn.execute(
+                    BOUNDARY_CHECKPOINT_SQL.format(order="ASC"), (thread_id,)
+                ) as cur:
+                    first = await cur.fetchone()
+                async with self.conn.execute(
+                    BOUNDARY_CHECKPOINT_SQL.format(order="DESC"), (thread_id,)
+                ) as cur:
+                    latest = await cur.fetchone()
+                await self.conn.execute(
+                    UPSERT_SQL, _row_from_checkpoints(thread_id, first, latest, self.serde)
+                )
+            await self.conn.commit()
+            self._catalog_ready = True
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        saved = await super().aput(config, checkpoint, metadata, new_versions)
+        if config["configurable"].get("checkpoint_ns", "") == "":
+            async with self.lock:
+                await self.conn.execute(
+                    UPSERT_SQL,
+                    catalog_row(config["configurable"]["thread_id"], checkpoint, metadata, config),
+                )
+                await self.conn.commit()
+        return saved
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await super().adelete_thread(thread_id)
+        async with self.lock:
+            await self.conn.execute(
+                "DELETE FROM thread_catalog WHERE thread_id = ?", (str(thread_id),)
+            )
+            await self.conn.execute("DELETE FROM cursor_pins WHERE thread_id = ?", (str(thread_id),))
+            await self.conn.commit()
+
+    async def amessage_window(
+        self, thread_id: str, limit: int, before: Optional[Cursor] = None
+    ) -> Tuple[List[BaseMessage], Optional[Cursor]]:
+        messages, cursor = await super().amessage_window(thread_id, limit, before)
+        if cursor is not None:
+            async with self.lock:
+                await self.conn.execute(PIN_SQL, pin_row(thread_id, cursor))
+                await self.conn.commit()
+        return messages, cursor
+
+    async def alist_threads(
+        self,
+        limit: int = 50,
+        before: Optional[Tuple[str, str]] = None,
+        owner: Optional[str] = None,
+    ) -> List[dict]:
+        await self.setup()
+        sql, params = _page_query(limit, before, owner)
+        async with self.lock, self.conn.execute(sql, params) as cur:
+            return _rows_to_dicts(await cur.fetchall())
+
+    async def athread_ids(self, owner: Optional[str] = None) -> List[str]:
+        await self.setup()
+        sql = "SELECT thread_id FROM thread_catalog"
+        params: list = []
+        if owner is not None:
+            sql += " WHERE owner = ?"
+            params.append(owner)
+        sql += " ORDER BY last_updated, thread_id"
+        async with self.lock, self.conn.execute(sql, params) as cur:
+            return [row[0] for row in await cur.fetchall()]
@@ -3,7 +3,7 @@ import os
 from langgraph.graph import StateGraph, START
 from typing import TypedDict, Annotated
 from langchain_core.messages import BaseMessage, HumanMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
+from Chatbot.llm_gateway import chat_model  # shared rate limits / retries (llm_gateway)
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode, tools_condition
@@ -19,7 +19,7 @@ load_dotenv()
 # -------------------
 # 1. LLM
 # -------------------
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash")
+llm = chat_model("gemini-2.5-flash")
 
 # -------------------
 # 2. Tools